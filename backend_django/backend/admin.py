@@ -1,3 +1,13 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Diagnosis
+
+
+@admin.register(Diagnosis)
+class DiagnosisAdmin(admin.ModelAdmin):
+    list_display = ["created_at", "user", "prediction", "confidence", "risk"]
+    list_filter = ["prediction", "risk"]
+    # One join instead of a query per row for the user column.
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    search_fields = ["user__email"]
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        from django.conf import settings
+        from .ml.registry import model_registry
+        from . import signals  # noqa: F401
+
+        model_registry.backend = settings.PREDICT_BACKEND
+        model_registry.student_path = settings.PREDICT_CASCADE_STUDENT
+        model_registry.student_arch = settings.PREDICT_CASCADE_STUDENT_ARCH
+        model_registry.escalate_above = settings.PREDICT_CASCADE_ESCALATE_ABOVE
@@ -0,0 +1,266 @@
+"""Appointment slot availability.
+
+``Doctor.working_hours`` maps weekdays to opening ranges, e.g.::
+
+    {"mon": ["09:00-13:00", "14:00-18:00"], "saturday": [["10:00", "14:00"]]}
+
+Days are cut into ``APPOINTMENT_SLOT_MINUTES`` slots, and each doctor/day
+within ``APPOINTMENT_HORIZON_DAYS`` gets a ``DoctorAvailability`` row holding
+a bitmap of its free slots. Rows are built lazily (or in bulk by the
+``rebuild_availability`` command) from working hours minus active
+appointments, and kept current by the Appointment signals, so finding free
+slots reads a few bitmaps instead of probing the appointments table.
+
+Changing ``APPOINTMENT_SLOT_MINUTES`` changes what the bits mean; run
+``rebuild_availability --reset`` afterwards.
+"""
+
+import datetime
+from collections import defaultdict
+from functools import reduce
+from itertools import groupby
+from operator import itemgetter, or_
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .geo import doctor_index
+from .models import Appointment, Doctor, DoctorAvailability
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MINUTES_PER_DAY = 24 * 60
+
+
+def _minutes(value):
+    hours, minutes = str(value).strip().split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_working_hours(working_hours):
+    """``{weekday: [(start_minute, end_minute)]}`` with Monday as 0.
+
+    Day keys may be full names or abbreviations in any case; ranges are
+    ``"HH:MM-HH:MM"`` strings or ``[start, end]`` pairs. Malformed entries
+    are skipped. A doctor with no working hours has no slots.
+    """
+    parsed = defaultdict(list)
+    for day, ranges in (working_hours or {}).items():
+        key = str(day).strip().lower()[:3]
+        if key not in WEEKDAYS:
+            continue
+        if isinstance(ranges, str):
+            ranges = [ranges]
+        for entry in ranges or ():
+            try:
+                start, end = entry.split("-") if isinstance(entry, str) else entry
+                parsed[WEEKDAYS.index(key)].append((_minutes(start), _minutes(end)))
+            except (AttributeError, TypeError, ValueError):
+                continue
+    return parsed
+
+
+def slot_index(time):
+    """Bit index of the slot starting at ``time``; ``ValueError`` if ``time``
+    is not on the slot grid."""
+    step = settings.APPOINTMENT_SLOT_MINUTES
+    index, offset = divmod(time.hour * 60 + time.minute, step)
+    if offset or time.second or time.microsecond:
+        raise ValueError(f"{time} is not on the {step}-minute slot grid")
+    return index
+
+
+def slot_time(index):
+    return datetime.time(*divmod(index * settings.APPOINTMENT_SLOT_MINUTES, 60))
+
+
+def opening_mask(hours, weekday):
+    """Bitmap of the slots that fit entirely inside the working ranges of
+    ``weekday`` in parsed ``hours``."""
+    step = settings.APPOINTMENT_SLOT_MINUTES
+    mask = 0
+    for start, end in hours.get(weekday, ()):
+        first = -(-max(start, 0) // step)
+        last = min(end, MINUTES_PER_DAY) // step
+        if last > first:
+            mask |= ((1 << (last - first)) - 1) << first
+    return mask
+
+
+def encode(mask):
+    size = (MINUTES_PER_DAY // settings.APPOINTMENT_SLOT_MINUTES + 7) // 8
+    return mask.to_bytes(size, "little")
+
+
+def decode(data):
+    # Postgres hands BinaryField values back as memoryview.
+    return int.from_bytes(bytes(data), "little")
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def build_row(doctor_id, date, hours, booked=0):
+    mask = opening_mask(hours, date.weekday()) & ~booked
+    return DoctorAvailability(
+        doctor_id=doctor_id,
+        date=date,
+        free_slots=encode(mask),
+        free_count=mask.bit_count(),
+    )
+
+
+def ensure_days(doctor_ids, start, end):
+    """Create the missing availability rows for ``doctor_ids`` from ``start``
+    to ``end`` inclusive and return how many were created.
+
+    A COUNT query settles the common case where every row exists; otherwise
+    the existing rows, the working hours and the active appointments of the
+    doctors with gaps are read with one query each.
+    """
+    doctor_ids = list(doctor_ids)
+    days = [start + datetime.timedelta(days=n) for n in range((end - start).days + 1)]
+    rows = DoctorAvailability.objects.filter(
+        doctor_id__in=doctor_ids, date__range=(start, end)
+    )
+    # The common case: everything is built and a COUNT is all it costs.
+    if rows.count() == len(doctor_ids) * len(days):
+        return 0
+    existing = set(rows.values_list("doctor_id", "date"))
+    missing = [
+        (pk, day) for pk in doctor_ids for day in days if (pk, day) not in existing
+    ]
+    if not missing:
+        return 0
+
+    pending = {pk for pk, _ in missing}
+    hours = {
+        pk: parse_working_hours(working_hours)
+        for pk, working_hours in Doctor.objects.filter(pk__in=pending).values_list(
+            "id", "working_hours"
+        )
+    }
+    booked = defaultdict(int)
+    appointments = (
+        Appointment.objects.filter(doctor_id__in=pending, date__range=(start, end))
+        .exclude(status="cancelled")
+        .values_list("doctor_id", "date", "time_slot")
+    )
+    for pk, day, time in appointments:
+        try:
+            booked[pk, day] |= 1 << slot_index(time)
+        except ValueError:
+            continue
+
+    rows = [
+        build_row(pk, day, hours[pk], booked.get((pk, day), 0))
+        for pk, day in missing
+        if pk in hours
+    ]
+    # A concurrent request may have built some of these rows already.
+    DoctorAvailability.objects.bulk_create(rows, ignore_conflicts=True, batch_size=1000)
+    return len(rows)
+
+
+def refresh_slot(doctor_id, date, time):
+    """Recompute one slot's bit from the appointments table. Called by the
+    Appointment signals on booking, cancellation and deletion."""
+    try:
+        index = slot_index(time)
+    except ValueError:
+        return
+    with transaction.atomic():
+        row = (
+            DoctorAvailability.objects.select_for_update()
+            .filter(doctor_id=doctor_id, date=date)
+            .first()
+        )
+        if row is None:
+            # Built from the appointments table when it is first needed.
+            return
+        mask = decode(row.free_slots)
+        taken = (
+            Appointment.objects.filter(doctor_id=doctor_id, date=date, time_slot=time)
+            .exclude(status="cancelled")
+            .exists()
+        )
+        if taken:
+            mask &= ~(1 << index)
+        else:
+            working_hours = Doctor.objects.values_list("working_hours", flat=True).get(
+                pk=doctor_id
+            )
+            hours = parse_working_hours(working_hours)
+            mask |= (1 << index) & opening_mask(hours, date.weekday())
+        row.free_slots = encode(mask)
+        row.free_count = mask.bit_count()
+        row.save(update_fields=["free_slots", "free_count"])
+
+
+def reset_doctor(doctor_id):
+    """Drop a doctor's current and future rows, e.g. after their working
+    hours change; they are rebuilt on the next lookup."""
+    DoctorAvailability.objects.filter(
+        doctor_id=doctor_id, date__gte=timezone.localdate()
+    ).delete()
+
+
+def horizon(after=None):
+    after = timezone.localtime(after)
+    start = after.date()
+    return (
+        after,
+        start,
+        start + datetime.timedelta(days=settings.APPOINTMENT_HORIZON_DAYS - 1),
+    )
+
+
+def next_free_slots(lat, lon, radius_km, count, after=None):
+    """The ``count`` earliest free slots starting after ``after`` (default
+    now) at doctors within ``radius_km``, as ``[(date, time, distance_km,
+    doctor_id)]`` ordered by start and then distance.
+
+    Doctors come from the in-memory ``doctor_index``; their bitmaps for the
+    whole horizon are streamed with one query in date order. Each day's
+    bitmaps are OR-ed to walk only slots someone has free, in time order,
+    and the scan stops as soon as ``count`` slots are found.
+    """
+    after, start, end = horizon(after)
+    nearby = doctor_index.nearest(
+        lat, lon, radius_km, settings.APPOINTMENT_SEARCH_MAX_DOCTORS
+    )
+    distances = {pk: distance for distance, pk in nearby}
+    if not distances:
+        return []
+    ensure_days(distances, start, end)
+
+    rows = (
+        DoctorAvailability.objects.filter(
+            doctor_id__in=distances, date__range=(start, end), free_count__gt=0
+        )
+        .order_by("date")
+        .values_list("date", "doctor_id", "free_slots")
+        .iterator(chunk_size=500)
+    )
+    # Slots that have already started today are not offered.
+    started = (after.hour * 60 + after.minute) // settings.APPOINTMENT_SLOT_MINUTES
+    past = (1 << (started + 1)) - 1
+
+    found = []
+    for day, day_rows in groupby(rows, key=itemgetter(0)):
+        masks = sorted(
+            (distances[pk], pk, decode(data) & ~past if day == start else decode(data))
+            for _, pk, data in day_rows
+        )
+        for index in iter_bits(reduce(or_, (mask for *_, mask in masks), 0)):
+            bit = 1 << index
+            for distance, pk, mask in masks:
+                if mask & bit:
+                    found.append((day, slot_time(index), distance, pk))
+                    if len(found) == count:
+                        return found
+    return found
@@ -0,0 +1,317 @@
+"""Contention-safe appointment booking.
+
+Every booking for a doctor/day goes through that day's ``DoctorAvailability``
+row: the row is locked with ``select_for_update``, the slot's bit is checked
+and the Appointment is inserted while the lock is held, so racing bookers
+queue on one row instead of colliding on the unique constraint. Callers that
+want any free slot use ``skip_locked`` and take the next unlocked day rather
+than wait. On databases without row locks (SQLite) the partial unique
+constraint on active appointments still guarantees one booking per slot,
+and a lost race is reported as ``SlotUnavailable``.
+
+A hold is an Appointment in the "held" state: it hides the slot like a
+booking until it is confirmed or cancelled, or released by
+``release_expired_holds`` once ``hold_expires_at`` has passed.
+
+An idempotency key is stored with a fingerprint of the request that used
+it. Replaying the key with the same request returns the first appointment;
+reusing it for a different request raises ``IdempotencyConflict``.
+"""
+
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import (
+    decode,
+    ensure_days,
+    horizon,
+    iter_bits,
+    refresh_slot,
+    slot_index,
+    slot_time,
+)
+from .models import Appointment, Doctor, DoctorAvailability
+
+# Unlocked doctor/day rows locked and scanned per query by ``allocate``.
+ALLOCATE_CANDIDATES = 8
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+class HoldExpired(Exception):
+    pass
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def _fingerprint(**request):
+    raw = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _replay(user, idempotency_key, fingerprint):
+    """The appointment ``idempotency_key`` already created, or None. Raises
+    ``IdempotencyConflict`` if it was created by a different request."""
+    if not idempotency_key:
+        return None
+    appointment = Appointment.objects.filter(
+        user=user, idempotency_key=idempotency_key
+    ).first()
+    # Appointments booked before fingerprints were stored have none.
+    if appointment and appointment.idempotency_fingerprint not in ("", fingerprint):
+        raise IdempotencyConflict(
+            "Idempotency-Key was already used for a different booking"
+        )
+    return appointment
+
+
+def _first_open(day, after):
+    """Index of the earliest free slot in ``day`` that starts after
+    ``after``, or None."""
+    mask = decode(day.free_slots)
+    if day.date == after.date():
+        started = (after.hour * 60 + after.minute) // settings.APPOINTMENT_SLOT_MINUTES
+        mask &= ~((1 << (started + 1)) - 1)
+    return next(iter_bits(mask), None)
+
+
+def _create(user, doctor_id, date, time_slot, hold, idempotency_key, fingerprint):
+    # The post_save signal clears the slot's bit under the lock we hold.
+    return Appointment.objects.create(
+        user=user,
+        doctor_id=doctor_id,
+        date=date,
+        time_slot=time_slot,
+        status="held" if hold else "booked",
+        hold_expires_at=(
+            timezone.now()
+            + datetime.timedelta(seconds=settings.APPOINTMENT_HOLD_SECONDS)
+            if hold
+            else None
+        ),
+        idempotency_key=idempotency_key or None,
+        idempotency_fingerprint=fingerprint if idempotency_key else "",
+    )
+
+
+def release_expired_holds(**filters):
+    """Cancel holds whose expiry has passed and give their slots back.
+    ``filters`` narrow the Appointment queryset, e.g. to one doctor/day."""
+    expired = list(
+        Appointment.objects.filter(
+            status="held", hold_expires_at__lte=timezone.now(), **filters
+        ).values_list("pk", "doctor_id", "date", "time_slot")
+    )
+    if not expired:
+        return 0
+    released = Appointment.objects.filter(
+        pk__in=[pk for pk, *_ in expired], status="held"
+    ).update(status="cancelled")
+    for _, doctor_id, date, time_slot in expired:
+        refresh_slot(doctor_id, date, time_slot)
+    return released
+
+
+def reserve(user, doctor_id, date, time_slot, hold=False, idempotency_key=None):
+    """Book one slot, or hold it if ``hold`` is set, and return
+    ``(appointment, created)``.
+
+    Replaying an ``idempotency_key`` returns the appointment it created the
+    first time with ``created`` False, also when the first request is still
+    in flight and commits while this one waits for the day's lock. Raises
+    ``SlotUnavailable`` if the slot is taken, closed or already started,
+    ``Doctor.DoesNotExist`` for an unknown doctor, ``ValueError`` if
+    ``time_slot`` is off the slot grid, and ``IdempotencyConflict`` if the
+    key was used for a different request.
+    """
+    fingerprint = _fingerprint(
+        action="reserve",
+        doctor=str(doctor_id),
+        date=date,
+        time_slot=time_slot,
+        hold=hold,
+    )
+    if appointment := _replay(user, idempotency_key, fingerprint):
+        return appointment, False
+    index = slot_index(time_slot)
+    after, start, end = horizon()
+    starts_at = timezone.make_aware(datetime.datetime.combine(date, time_slot))
+    if not start <= date <= end or starts_at <= after:
+        raise SlotUnavailable("Slot is outside the booking window")
+    try:
+        with transaction.atomic():
+            ensure_days([doctor_id], date, date)
+            day = (
+                DoctorAvailability.objects.select_for_update()
+                .filter(doctor_id=doctor_id, date=date)
+                .first()
+            )
+            if day is None:
+                raise Doctor.DoesNotExist("Unknown doctor")
+            # A concurrent retry with the same key may have committed while
+            # we waited for the lock.
+            if appointment := _replay(user, idempotency_key, fingerprint):
+                return appointment, False
+            if release_expired_holds(doctor_id=doctor_id, date=date):
+                day.refresh_from_db(fields=["free_slots"])
+            if not decode(day.free_slots) >> index & 1:
+                raise SlotUnavailable("Slot is not available")
+            return (
+                _create(
+                    user,
+                    doctor_id,
+                    date,
+                    time_slot,
+                    hold,
+                    idempotency_key,
+                    fingerprint,
+                ),
+                True,
+            )
+    except IntegrityError:
+        if appointment := _replay(user, idempotency_key, fingerprint):
+            return appointment, False
+        raise SlotUnavailable("Slot was just taken")
+
+
+def _lock_open_day(doctor_ids, after, start, end, skip_locked):
+    """Lock the earliest doctor/day with a slot starting after ``after``.
+    Returns ``(day, slot_index, rows_locked)``; ``day`` is None if no locked
+    row has such a slot.
+
+    Rows are paged by ``(date, doctor_id)``, so today's rows whose free
+    slots have all started are passed over instead of filling the page.
+    """
+    candidates = DoctorAvailability.objects.filter(
+        doctor_id__in=doctor_ids, date__range=(start, end), free_count__gt=0
+    ).order_by("date", "doctor_id")
+    seen, last = 0, None
+    while True:
+        page = candidates.select_for_update(skip_locked=skip_locked)
+        if last is not None:
+            page = page.filter(
+                Q(date__gt=last.date) | Q(date=last.date, doctor_id__gt=last.doctor_id)
+            )
+        days = list(page[:ALLOCATE_CANDIDATES])
+        for day in days:
+            index = _first_open(day, after)
+            if index is not None:
+                return day, index, seen
+        seen += len(days)
+        if len(days) < ALLOCATE_CANDIDATES:
+            return None, None, seen
+        last = days[-1]
+
+
+def allocate(user, doctor_ids, date=None, hold=False, idempotency_key=None, attempts=3):
+    """Book (or hold) the earliest free slot at any of ``doctor_ids`` within
+    the booking horizon, or on ``date`` if given, and return
+    ``(appointment, created)``.
+
+    Candidate days are locked with ``skip_locked``, so concurrent callers
+    spread over different doctor/days instead of queueing on the earliest
+    one; a caller may therefore get a slot slightly later than the absolute
+    earliest while that day is busy. If every open day was locked by
+    someone else the attempt is retried, and the last of ``attempts`` waits
+    for the locks instead of skipping them, so ``SlotUnavailable`` means
+    there really is no free slot. Lost races on SQLite are retried too.
+    Raises ``Doctor.DoesNotExist`` if none of ``doctor_ids`` exists and
+    ``IdempotencyConflict`` if the key was used for a different request.
+    """
+    doctor_ids = list(doctor_ids)
+    fingerprint = _fingerprint(
+        action="allocate",
+        doctors=sorted(str(pk) for pk in doctor_ids),
+        date=date,
+        hold=hold,
+    )
+    if appointment := _replay(user, idempotency_key, fingerprint):
+        return appointment, False
+    if not Doctor.objects.filter(pk__in=doctor_ids).exists():
+        raise Doctor.DoesNotExist("Unknown doctor")
+    after, start, end = horizon()
+    if date is not None:
+        if not start <= date <= end:
+            raise SlotUnavailable("Date is outside the booking window")
+        start = end = date
+    ensure_days(doctor_ids, start, end)
+    for attempt in range(attempts):
+        skip_locked = attempt < attempts - 1
+        try:
+            with transaction.atomic():
+                # Expired holds still hide their slots from the scan below
+                # until released.
+                release_expired_holds(
+                    doctor_id__in=doctor_ids, date__range=(start, end)
+                )
+                day, index, locked = _lock_open_day(
+                    doctor_ids, after, start, end, skip_locked
+                )
+                if day is not None:
+                    return (
+                        _create(
+                            user,
+                            day.doctor_id,
+                            day.date,
+                            slot_time(index),
+                            hold,
+                            idempotency_key,
+                            fingerprint,
+                        ),
+                        True,
+                    )
+                open_days = DoctorAvailability.objects.filter(
+                    doctor_id__in=doctor_ids,
+                    date__range=(start, end),
+                    free_count__gt=0,
+                ).count()
+            # Every open day was ours to check, so waiting cannot help.
+            if not skip_locked or open_days <= locked:
+                break
+        except IntegrityError:
+            if appointment := _replay(user, idempotency_key, fingerprint):
+                return appointment, False
+    if appointment := _replay(user, idempotency_key, fingerprint):
+        return appointment, False
+    raise SlotUnavailable("No free slots")
+
+
+def confirm(user, appointment_id):
+    """Turn a hold into a booking. Confirming an already booked appointment
+    is a no-op; a hold that was released after expiring raises
+    ``HoldExpired``. A hold past its expiry that has not been released yet
+    can still be confirmed, since nobody else can have taken the slot."""
+    with transaction.atomic():
+        appointment = Appointment.objects.select_for_update().get(
+            pk=appointment_id, user=user
+        )
+        if appointment.status == "booked":
+            return appointment
+        if appointment.status != "held":
+            raise HoldExpired("Hold is no longer active")
+        appointment.status = "booked"
+        appointment.hold_expires_at = None
+        appointment.save(update_fields=["status", "hold_expires_at"])
+    return appointment
+
+
+def cancel(user, appointment_id):
+    with transaction.atomic():
+        appointment = Appointment.objects.select_for_update().get(
+            pk=appointment_id, user=user
+        )
+        if appointment.status in ("held", "booked"):
+            appointment.status = "cancelled"
+            appointment.hold_expires_at = None
+            appointment.save(update_fields=["status", "hold_expires_at"])
+    return appointment
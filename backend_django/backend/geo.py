@@ -0,0 +1,176 @@
+import heapq
+import threading
+import time
+from math import cos, degrees, radians
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Doctor
+from .utils import haversine
+
+EARTH_RADIUS_KM = 6371
+
+
+def bounding_box(lat, lon, radius_km):
+    """Return a ``Q`` matching every point within ``radius_km`` of
+    (``lat``, ``lon``), plus some corner slack, using plain range filters
+    that the (latitude, longitude) index can serve."""
+    dlat = degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        # The circle covers a pole, so every longitude is in range.
+        return Q(latitude__gte=max(min_lat, -90), latitude__lte=min(max_lat, 90))
+
+    dlon = degrees(radius_km / (EARTH_RADIUS_KM * cos(radians(lat))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+    query = Q(latitude__gte=min_lat, latitude__lte=max_lat)
+    if dlon >= 180:
+        return query
+    if min_lon < -180:
+        return query & (Q(longitude__gte=min_lon + 360) | Q(longitude__lte=max_lon))
+    if max_lon > 180:
+        return query & (Q(longitude__gte=min_lon) | Q(longitude__lte=max_lon - 360))
+    return query & Q(longitude__gte=min_lon, longitude__lte=max_lon)
+
+
+def haversine_np(lat, lon, lats, lons):
+    """Vectorized ``utils.haversine``: distances in km from one point, or from
+    a column of points (shape ``(Q, 1)``), to every point in ``lats``/``lons``.
+    All inputs are in radians."""
+    dlat = lats - lat
+    dlon = lons - lon
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _top_k(distances, radius_km, limit):
+    within = np.flatnonzero(distances <= radius_km)
+    if len(within) > limit:
+        within = within[np.argpartition(distances[within], limit - 1)[:limit]]
+    return within[np.argsort(distances[within], kind="stable")]
+
+
+class DoctorIndex:
+    """Array-backed snapshot of every doctor's id and coordinates, sorted by
+    latitude so each query only computes distances for the latitude band
+    that can be within the radius.
+
+    The snapshot is rebuilt lazily after ``invalidate()`` (wired to Doctor
+    save/delete signals in this process) or once it is older than
+    ``DOCTOR_INDEX_TTL`` seconds, which bounds staleness for changes made by
+    other workers or by ``bulk_create``/``update``.
+    """
+
+    # Queries whose (queries x band) distance matrix is computed at once.
+    QUERY_CHUNK = 256
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _fresh(self):
+        return (
+            self._snapshot is not None
+            and time.monotonic() - self._built_at <= settings.DOCTOR_INDEX_TTL
+        )
+
+    def snapshot(self):
+        if not self._fresh():
+            with self._lock:
+                if not self._fresh():
+                    self._snapshot = self._build()
+                    self._built_at = time.monotonic()
+        return self._snapshot
+
+    def _build(self):
+        rows = list(Doctor.objects.values_list("id", "latitude", "longitude"))
+        ids = np.array([row[0] for row in rows], dtype=object)
+        coords = np.radians(np.array([row[1:] for row in rows], dtype=np.float64))
+        coords = coords.reshape(-1, 2)
+        order = np.argsort(coords[:, 0], kind="stable")
+        return ids[order], coords[order, 0].copy(), coords[order, 1].copy()
+
+    def nearest(self, lat, lon, radius_km, limit):
+        """``[(distance_km, doctor_id)]`` for the ``limit`` closest doctors
+        within ``radius_km``, sorted by distance."""
+        return self.nearest_many([(lat, lon)], radius_km, limit)[0]
+
+    def nearest_many(self, points, radius_km, limit):
+        """``nearest`` for many ``(lat, lon)`` points, e.g. batch geocoding.
+
+        Points are grouped into latitude-sorted chunks of nearby queries; each
+        chunk is one vectorized distance computation against its band.
+        """
+        ids, lats, lons = self.snapshot()
+        points = np.radians(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+        # No point further than radius_km can differ by more than this in
+        # latitude, so the band is exact, poles included.
+        dlat = radius_km / EARTH_RADIUS_KM
+        order = np.argsort(points[:, 0], kind="stable")
+        results = [None] * len(points)
+        for indices in self._chunks(points[order, 0], order, dlat):
+            chunk = points[indices]
+            lo = np.searchsorted(lats, chunk[0, 0] - dlat, side="left")
+            hi = np.searchsorted(lats, chunk[-1, 0] + dlat, side="right")
+            distances = haversine_np(
+                chunk[:, :1], chunk[:, 1:], lats[lo:hi], lons[lo:hi]
+            )
+            for index, row in zip(indices, distances):
+                top = _top_k(row, radius_km, limit)
+                results[index] = list(zip(row[top].tolist(), ids[lo:hi][top]))
+        return results
+
+    def _chunks(self, sorted_lats, order, dlat):
+        # Group latitude-sorted queries so a chunk's band stays narrow:
+        # start a new chunk once it would span more than one radius.
+        start = 0
+        for end in range(1, len(order) + 1):
+            if (
+                end == len(order)
+                or end - start == self.QUERY_CHUNK
+                or sorted_lats[end] - sorted_lats[start] > dlat
+            ):
+                yield order[start:end]
+                start = end
+
+
+doctor_index = DoctorIndex()
+
+
+def nearby_doctors(lat, lon, radius_km, limit):
+    """The ``limit`` closest doctors within ``radius_km``, as
+    ``[(distance_km, doctor)]`` sorted by distance, answered from the
+    in-memory ``doctor_index``; full rows are fetched for the top ``limit``
+    only."""
+    closest = doctor_index.nearest(lat, lon, radius_km, limit)
+    doctors = Doctor.objects.in_bulk([pk for _, pk in closest])
+    return [(d, doctors[pk]) for d, pk in closest if pk in doctors]
+
+
+def nearby_doctors_db(lat, lon, radius_km, limit, queryset=None):
+    """Database-only ``nearby_doctors``, for filtered querysets or when the
+    in-memory index is not wanted.
+
+    Candidates come from an index-backed bounding-box query that only reads
+    ids and coordinates; exact haversine distances are computed for those,
+    and full rows are fetched for the top ``limit`` only.
+    """
+    queryset = Doctor.objects.all() if queryset is None else queryset
+    candidates = queryset.filter(bounding_box(lat, lon, radius_km)).values_list(
+        "id", "latitude", "longitude"
+    )
+    within = (
+        (haversine(lat, lon, doc_lat, doc_lon), pk)
+        for pk, doc_lat, doc_lon in candidates
+    )
+    closest = heapq.nsmallest(
+        limit, ((d, pk) for d, pk in within if d <= radius_km), key=lambda x: x[0]
+    )
+    doctors = queryset.in_bulk([pk for _, pk in closest])
+    return [(d, doctors[pk]) for d, pk in closest]
@@ -0,0 +1,243 @@
+"""Hospital lookup used to pad nearby-doctor results.
+
+``HospitalClient`` sits in front of a pluggable provider and keeps the
+doctor search fast when the upstream is slow or down: requests go through a
+pooled session with strict timeouts, results are cached per rounded
+location/radius with stale-while-revalidate, and a circuit breaker stops
+calling an upstream that keeps failing. Upstream calls always run on a
+background thread; a search with nothing usable cached waits for one only
+up to ``miss_wait`` seconds.
+"""
+
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .utils import haversine
+
+logger = logging.getLogger(__name__)
+
+
+class HospitalProvider(ABC):
+    """Returns hospitals near a point as Google Places ``nearbysearch``
+    result dicts (``name``, ``vicinity``, ``geometry.location.lat/lng``)."""
+
+    @abstractmethod
+    def search(self, lat, lon, radius):
+        """Hospitals within ``radius`` metres of ``(lat, lon)``."""
+
+
+class GooglePlacesProvider(HospitalProvider):
+    URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+
+    def __init__(self, api_key, timeout=(1.0, 2.0), pool_size=10):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+
+    def search(self, lat, lon, radius):
+        params = {
+            "location": f"{lat},{lon}",
+            "radius": radius,
+            "type": "hospital",
+            "key": self.api_key,
+        }
+        resp = self.session.get(self.URL, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("status") not in ("OK", "ZERO_RESULTS"):
+            raise RuntimeError(f"Places API returned {data.get('status')}")
+        return data.get("results", [])
+
+
+class FixtureProvider(HospitalProvider):
+    """Offline provider backed by a JSON list of Places-style results."""
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.hospitals = json.load(f)
+
+    def search(self, lat, lon, radius):
+        found = []
+        for hospital in self.hospitals:
+            location = hospital["geometry"]["location"]
+            distance = haversine(lat, lon, location["lat"], location["lng"])
+            if distance * 1000 <= radius:
+                found.append((distance, hospital))
+        found.sort(key=lambda item: item[0])
+        return [hospital for _, hospital in found]
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures and lets one trial call
+    through every ``cooldown`` seconds until a call succeeds."""
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half-open: allow one trial and restart the cooldown.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class HospitalClient:
+    def __init__(
+        self,
+        provider,
+        ttl=3600,
+        stale_ttl=86400,
+        max_entries=2048,
+        breaker=None,
+        precision=3,
+        miss_wait=0.2,
+    ):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.breaker = breaker or CircuitBreaker()
+        # 3 decimals of a degree is ~110 m, close enough to share results.
+        self.precision = precision
+        self.miss_wait = miss_wait
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> Future of the fetch in flight
+        self._refreshing = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="hospital-refresh"
+        )
+
+    def key(self, lat, lon, radius):
+        return (
+            round(lat, self.precision),
+            round(lon, self.precision),
+            int(radius),
+        )
+
+    def nearby(self, lat, lon, radius=5000):
+        key = self.key(lat, lon, radius)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None:
+            stored_at, results = entry
+            age = time.monotonic() - stored_at
+            if age <= self.ttl:
+                return results
+            if age <= self.stale_ttl:
+                self._refresh_in_background(key)
+                return results
+
+        # Missing or too stale to serve: the request may wait a little for
+        # the fetch, which carries on in the background if it takes longer.
+        try:
+            results = self._refresh_in_background(key).result(timeout=self.miss_wait)
+        except TimeoutError:
+            results = None
+        if results is None:
+            return entry[1] if entry is not None else []
+        return results
+
+    def _fetch(self, key):
+        if not self.breaker.allow():
+            return None
+        lat, lon, radius = key
+        try:
+            results = self.provider.search(lat, lon, radius)
+        except Exception:
+            logger.warning("Hospital lookup failed for %s", key, exc_info=True)
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        self._store(key, results)
+        return results
+
+    def _refresh_in_background(self, key):
+        """Future for a fetch of ``key``, joining one already in flight."""
+
+        def refresh():
+            try:
+                return self._fetch(key)
+            finally:
+                with self._lock:
+                    self._refreshing.pop(key, None)
+
+        with self._lock:
+            future = self._refreshing.get(key)
+            if future is None:
+                future = self._refreshing[key] = self._executor.submit(refresh)
+        return future
+
+    def _store(self, key, results):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def build_client():
+    if settings.HOSPITAL_PROVIDER == "fixture":
+        provider = FixtureProvider(settings.HOSPITAL_FIXTURE_PATH)
+    else:
+        provider = GooglePlacesProvider(
+            settings.GOOGLE_MAPS_API_KEY,
+            timeout=(settings.HOSPITAL_CONNECT_TIMEOUT, settings.HOSPITAL_READ_TIMEOUT),
+        )
+    return HospitalClient(
+        provider,
+        ttl=settings.HOSPITAL_CACHE_TTL,
+        stale_ttl=settings.HOSPITAL_CACHE_STALE_TTL,
+        max_entries=settings.HOSPITAL_CACHE_SIZE,
+        breaker=CircuitBreaker(
+            threshold=settings.HOSPITAL_BREAKER_THRESHOLD,
+            cooldown=settings.HOSPITAL_BREAKER_COOLDOWN,
+        ),
+        miss_wait=settings.HOSPITAL_MISS_WAIT_MS / 1000,
+    )
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_client()
+    return _client
@@ -0,0 +1,140 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .metrics import ERRORS
+from .ml.registry import model_registry
+from .models import PredictionJob
+from .predictions import predict, record_diagnosis
+
+logger = logging.getLogger(__name__)
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to "running" and return it.
+
+    A job whose worker has not renewed its lease (see ``run_job``) for
+    ``PREDICT_JOB_LEASE_SECONDS`` belongs to a worker that died, and is
+    claimed again like a queued one.
+    ``skip_locked`` lets concurrent workers on Postgres pass over each other's
+    rows; the conditional update keeps the claim exclusive on backends
+    without row locks (SQLite).
+    """
+    expired = timezone.now() - timedelta(seconds=settings.PREDICT_JOB_LEASE_SECONDS)
+    with transaction.atomic():
+        job = (
+            PredictionJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status="queued") | Q(status="running", updated_at__lt=expired))
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == "running":
+            logger.warning("Reclaiming prediction job %s after lease expiry", job.id)
+        claimed_at = timezone.now()
+        claimed = PredictionJob.objects.filter(
+            pk=job.pk, status=job.status, updated_at=job.updated_at
+        ).update(status="running", updated_at=claimed_at)
+    if not claimed:
+        return None
+    job.status, job.updated_at = "running", claimed_at
+    return job
+
+
+def _lease(job):
+    """The claim still held by this worker: ``job``'s row as it was last
+    claimed or renewed."""
+    return PredictionJob.objects.filter(
+        pk=job.pk, status="running", updated_at=job.updated_at
+    )
+
+
+@contextmanager
+def _heartbeat(job):
+    """Renew ``job``'s lease from a background thread while the block runs,
+    so a slow job is not reclaimed by another worker."""
+    stop = threading.Event()
+    interval = settings.PREDICT_JOB_LEASE_SECONDS / 3
+
+    def renew():
+        try:
+            while not stop.wait(interval):
+                renewed_at = timezone.now()
+                try:
+                    renewed = _lease(job).update(updated_at=renewed_at)
+                except DatabaseError:
+                    logger.warning("Could not renew lease on job %s", job.id)
+                    continue
+                if not renewed:
+                    return
+                job.updated_at = renewed_at
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=renew, name=f"job-heartbeat-{job.id}")
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and store its outcome.
+
+    The outcome is written only if this worker still holds the claim; if the
+    job was reclaimed meanwhile the result is dropped, so a job gets one
+    Diagnosis however many workers ran it.
+    """
+    result, status, error = None, "done", ""
+    with _heartbeat(job):
+        try:
+            # Workers handle one job at a time, so there is nothing for the
+            # micro-batcher to merge; call the model directly. Every row is
+            # a view of the job's one image.
+            result = predict(
+                bytes(job.image),
+                model=lambda x: model_registry.forward_with_embedding(x, [len(x)]),
+            )
+        except Exception as exc:
+            ERRORS.inc(view="job")
+            logger.exception("Prediction job %s failed", job.id)
+            status, error = "failed", str(exc)
+
+    with transaction.atomic():
+        finished_at = timezone.now()
+        if not _lease(job).update(
+            status=status, error=error, image=b"", updated_at=finished_at
+        ):
+            logger.warning("Prediction job %s was reclaimed; dropping result", job.id)
+            job.refresh_from_db()
+            return job
+        if result is not None:
+            job.diagnosis = record_diagnosis(job.user, result)
+            PredictionJob.objects.filter(pk=job.pk).update(diagnosis=job.diagnosis)
+    job.status, job.error, job.image, job.updated_at = status, error, b"", finished_at
+    return job
+
+
+def work(poll_interval=0.5, once=False):
+    """Process jobs until interrupted, or until the queue is empty if
+    ``once`` is set. Returns the number of jobs processed."""
+    processed = 0
+    while True:
+        job = claim_next_job()
+        if job is None:
+            if once:
+                return processed
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
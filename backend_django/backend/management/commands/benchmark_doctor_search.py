@@ -0,0 +1,120 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend.geo import doctor_index, nearby_doctors, nearby_doctors_db
+from backend.models import Doctor
+from backend.utils import haversine
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark nearby-doctor search on synthetic doctors (inserted inside "
+        "a transaction that is rolled back) against the old full-table scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--doctors", type=int, default=100_000)
+        parser.add_argument("--queries", type=int, default=50)
+        parser.add_argument("--radius", type=float, default=10)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument(
+            "--skip-scan",
+            action="store_true",
+            help="Do not time the O(N) baseline (slow for large --doctors).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            doctor_index.invalidate()
+
+    def _run(self, options):
+        rng = random.Random(0)
+        # Scatter doctors over a handful of metro areas, like real directories.
+        cities = [(19.07, 72.87), (28.61, 77.21), (12.97, 77.59), (22.57, 88.36)]
+        doctors = []
+        for i in range(options["doctors"]):
+            lat, lon = rng.choice(cities)
+            doctors.append(
+                Doctor(
+                    name=f"Dr. Synthetic {i}",
+                    specialization="Dermatologist",
+                    hospital="Synthetic Clinic",
+                    address=f"{i} Synthetic Road",
+                    latitude=lat + rng.gauss(0, 0.3),
+                    longitude=lon + rng.gauss(0, 0.3),
+                )
+            )
+        start = time.perf_counter()
+        Doctor.objects.bulk_create(doctors, batch_size=5000)
+        self.stdout.write(
+            f"Inserted {len(doctors)} doctors in {time.perf_counter() - start:.1f}s"
+        )
+
+        queries = [
+            (lat + rng.gauss(0, 0.2), lon + rng.gauss(0, 0.2))
+            for lat, lon in (rng.choice(cities) for _ in range(options["queries"]))
+        ]
+        radius, limit = options["radius"], options["limit"]
+
+        def in_memory(lat, lon):
+            return nearby_doctors(lat, lon, radius, limit)
+
+        def indexed(lat, lon):
+            return nearby_doctors_db(lat, lon, radius, limit)
+
+        def scan(lat, lon):
+            found = []
+            for doc in Doctor.objects.all():
+                distance = haversine(lat, lon, doc.latitude, doc.longitude)
+                if distance <= radius:
+                    found.append((distance, doc))
+            found.sort(key=lambda x: x[0])
+            return found[:limit]
+
+        doctor_index.invalidate()
+        start = time.perf_counter()
+        doctor_index.snapshot()
+        self.stdout.write(
+            f"Built in-memory index in {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        start = time.perf_counter()
+        doctor_index.nearest_many(queries, radius, limit)
+        self.stdout.write(
+            f"Batch of {len(queries)} queries against the index (ids only): "
+            f"{(time.perf_counter() - start) * 1000:.2f} ms"
+        )
+
+        def ids_only(lat, lon):
+            return doctor_index.nearest(lat, lon, radius, limit)
+
+        strategies = [
+            ("numpy ids", ids_only),
+            ("numpy", in_memory),
+            ("bbox+index", indexed),
+        ]
+        if not options["skip_scan"]:
+            strategies.append(("full scan", scan))
+        for name, search in strategies:
+            timings = []
+            for lat, lon in queries:
+                start = time.perf_counter()
+                search(lat, lon)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f"{name:>11}: p50 {statistics.median(timings):.2f} ms, "
+                f"p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms "
+                f"over {len(timings)} queries"
+            )
@@ -0,0 +1,90 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.ml.registry import MODEL_PATH, artifact_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Export model.pth to TorchScript, ONNX and a statically quantized INT8 "
+        "ONNX model, and check each against the eager fp32 model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "sample_dir",
+            help="Directory of lesion images used for INT8 calibration and the "
+            "parity check.",
+        )
+        parser.add_argument(
+            "--labels",
+            help="Optional ISIC-style CSV (image_name,target) so melanoma recall "
+            "is measured against ground truth rather than the fp32 model.",
+        )
+        parser.add_argument("--model-path", default=MODEL_PATH)
+        parser.add_argument(
+            "--backends",
+            nargs="+",
+            default=["torchscript", "onnx", "onnx-int8"],
+            choices=["torchscript", "onnx", "onnx-int8"],
+        )
+        parser.add_argument("--limit", type=int, default=256)
+        parser.add_argument(
+            "--max-recall-drop",
+            type=float,
+            default=0.0,
+            help="Fail if a backend's melanoma recall is more than this below "
+            "the fp32 model's.",
+        )
+        parser.add_argument("--report", help="Write the parity report as JSON.")
+
+    def handle(self, *args, **options):
+        from backend.ml import export
+        from backend.ml.detection_model import load_backend, load_model
+
+        model_path = options["model_path"]
+        reference = load_model(model_path)
+        inputs, labels = export.load_sample_set(
+            options["sample_dir"], options["labels"], options["limit"]
+        )
+        self.stdout.write(f"Loaded {len(inputs)} sample images")
+
+        backends = options["backends"]
+        if "onnx-int8" in backends and "onnx" not in backends:
+            backends = ["onnx"] + backends
+
+        report = {}
+        for backend in backends:
+            path = artifact_path(backend, model_path)
+            if backend == "torchscript":
+                export.export_torchscript(reference, path)
+            elif backend == "onnx":
+                export.export_onnx(reference, path)
+            else:
+                export.quantize_onnx(
+                    artifact_path("onnx", model_path),
+                    path,
+                    export.iter_batches(inputs),
+                )
+            report[backend] = export.parity_report(
+                reference, load_backend(backend, model_path), inputs, labels
+            )
+            self.stdout.write(f"{backend}: {path}\n  {report[backend]}")
+
+        if options["report"]:
+            with open(options["report"], "w") as f:
+                json.dump(report, f, indent=2)
+
+        failed = [
+            backend
+            for backend, result in report.items()
+            if result["reference_melanoma_recall"] is not None
+            and result["candidate_melanoma_recall"]
+            < result["reference_melanoma_recall"] - options["max_recall_drop"]
+        ]
+        if failed:
+            raise CommandError(
+                f"Melanoma recall dropped beyond tolerance for: {', '.join(failed)}"
+            )
+        self.stdout.write(self.style.SUCCESS("All exported backends passed parity"))
@@ -0,0 +1,181 @@
+import json
+import math
+import time
+from functools import lru_cache
+
+import phonenumbers
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.geo import doctor_index
+from backend.models import Doctor
+
+UPDATE_FIELDS = [
+    "specialization",
+    "hospital",
+    "city",
+    "phone",
+    "latitude",
+    "longitude",
+]
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    """Yield the elements of a top-level JSON array without loading the whole
+    file, decoding one element at a time from a sliding buffer."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started and buffer:
+            if buffer[0] != "[":
+                raise ValueError("Expected a JSON array")
+            buffer = buffer[1:].lstrip()
+            started = True
+        if started and buffer.startswith(","):
+            buffer = buffer[1:].lstrip()
+        if started and buffer.startswith("]"):
+            return
+        if started and buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                buffer = buffer[end:]
+                continue
+        if eof:
+            raise ValueError("Unexpected end of JSON array")
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
+
+
+@lru_cache(maxsize=65536)
+def normalize_phone(raw, region):
+    # Clinics share switchboard numbers, so parsing is memoized.
+    try:
+        number = phonenumbers.parse(raw, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(number):
+        return None
+    return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+
+
+def city_from_address(address, default):
+    # "..., Bandra West, Mumbai, Maharashtra 400050, India"
+    parts = [part.strip() for part in address.split(",")]
+    return parts[-3] if len(parts) >= 3 else default
+
+
+def coordinates(location):
+    """``(latitude, longitude)`` as floats; ``ValueError`` if either is
+    missing, null, not a number or out of range."""
+    try:
+        latitude = float(location["latitude"])
+        longitude = float(location["longitude"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"invalid location {location!r}")
+    if not (
+        math.isfinite(latitude)
+        and math.isfinite(longitude)
+        and abs(latitude) <= 90
+        and abs(longitude) <= 180
+    ):
+        raise ValueError(f"location out of range {location!r}")
+    return latitude, longitude
+
+
+def to_doctor(record, region):
+    """Map one scraped record onto a Doctor, or None if it has no name,
+    address or location. Raises ``ValueError`` for malformed coordinates."""
+    location = record.get("location") or {}
+    name = (record.get("name") or record.get("clinic_name") or "").strip()
+    address = (record.get("address") or "").strip()
+    if not name or not address or not location:
+        return None
+    latitude, longitude = coordinates(location)
+    return Doctor(
+        name=name[:100],
+        specialization=(record.get("specialization") or "Dermatologist")[:100],
+        hospital=(record.get("clinic_name") or name)[:150],
+        address=address[:255],
+        city=city_from_address(address, "Mumbai")[:100],
+        phone=normalize_phone(record.get("phone") or "", region),
+        latitude=latitude,
+        longitude=longitude,
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a doctors JSON file (doctors_data.json layout) into the Doctor "
+        "table, deduplicating on name+address and upserting in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            default=str(settings.BASE_DIR.parent / "doctors_data.json"),
+        )
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--region", default="IN", help="Default region for phone numbers."
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        start = time.perf_counter()
+        read = skipped = written = 0
+        # Dedupe within a chunk here; across chunks and against existing rows
+        # the (name, address) unique constraint turns repeats into updates.
+        pending = {}
+
+        def flush():
+            nonlocal written
+            if pending:
+                Doctor.objects.bulk_create(
+                    pending.values(),
+                    update_conflicts=True,
+                    unique_fields=["name", "address"],
+                    update_fields=UPDATE_FIELDS,
+                )
+                written += len(pending)
+                pending.clear()
+
+        try:
+            with open(options["path"], encoding="utf-8") as f:
+                for record in iter_json_array(f):
+                    read += 1
+                    try:
+                        doctor = to_doctor(record, options["region"])
+                    except ValueError as exc:
+                        self.stderr.write(
+                            self.style.WARNING(f"Skipping record {read}: {exc}")
+                        )
+                        doctor = None
+                    if doctor is None:
+                        skipped += 1
+                        continue
+                    pending[(doctor.name, doctor.address)] = doctor
+                    if len(pending) >= chunk_size:
+                        flush()
+                flush()
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Could not import {options['path']}: {exc}")
+
+        # bulk_create skips the signals that normally invalidate the index.
+        doctor_index.invalidate()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Read {read} records, upserted {written}, skipped {skipped} "
+                f"in {elapsed:.2f}s ({read / max(elapsed, 1e-9):.0f} rows/s)"
+            )
+        )
@@ -0,0 +1,246 @@
+import datetime
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from backend.availability import (
+    WEEKDAYS,
+    decode,
+    ensure_days,
+    iter_bits,
+    slot_time,
+)
+from backend.booking import SlotUnavailable, allocate, confirm, reserve
+from backend.models import Appointment, Doctor, DoctorAvailability
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate concurrent users racing to book a few popular doctors' slots "
+        "and report booking throughput and conflict rate. Synthetic doctors "
+        "and users are created up front and deleted afterwards. Point "
+        "DATABASES at a local Postgres for realistic row locking; on SQLite "
+        'set OPTIONS["transaction_mode"] = "IMMEDIATE" so writers wait for '
+        'each other instead of failing with "database is locked".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bookers", type=int, default=300)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--doctors", type=int, default=4)
+        parser.add_argument(
+            "--mode",
+            choices=["slot", "any"],
+            default="slot",
+            help='"slot": pick a specific, mostly early slot and retry another '
+            'one on conflict; "any": let the server allocate the next free slot.',
+        )
+        parser.add_argument(
+            "--hold", action="store_true", help="Hold the slot, then confirm it."
+        )
+        parser.add_argument("--attempts", type=int, default=5)
+        parser.add_argument(
+            "--replay-rate",
+            type=float,
+            default=0.1,
+            help="Fraction of successful requests re-sent with the same key.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        doctors, users = self._setup(run_id, options)
+        try:
+            self._run(doctors, users, options)
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+            Doctor.objects.filter(pk__in=doctors).delete()
+
+    def _setup(self, run_id, options):
+        hours = {day: ["09:00-17:00"] for day in WEEKDAYS}
+        doctors = Doctor.objects.bulk_create(
+            Doctor(
+                name=f"Dr. Loadtest {run_id} {i}",
+                specialization="Dermatologist",
+                hospital="Loadtest Clinic",
+                address=f"{i} Loadtest Road",
+                latitude=19.07,
+                longitude=72.87,
+                working_hours=hours,
+            )
+            for i in range(options["doctors"])
+        )
+        users = User.objects.bulk_create(
+            User(
+                username=f"loadtest-{run_id}-{i}",
+                email=f"loadtest-{run_id}-{i}@example.com",
+                full_name=f"Load Test {i}",
+                phone_no=f"+1555{run_id[:3]}{i:07d}",
+                password="!",
+            )
+            for i in range(options["bookers"])
+        )
+        return [d.pk for d in doctors], users
+
+    def _run(self, doctor_ids, users, options):
+        rng = random.Random(options["seed"])
+        day = timezone.localdate() + datetime.timedelta(days=1)
+        ensure_days(doctor_ids, day, day)
+        slots = [
+            (pk, day, slot_time(index))
+            for pk, data in DoctorAvailability.objects.filter(
+                doctor_id__in=doctor_ids, date=day
+            ).values_list("doctor_id", "free_slots")
+            for index in iter_bits(decode(data))
+        ]
+        slots.sort(key=lambda slot: slot[2])
+        hot = slots[: max(1, len(slots) // 8)]
+
+        lock = threading.Lock()
+        stats = {
+            "attempts": 0,
+            "booked": 0,
+            "conflicts": 0,
+            "gave_up": 0,
+            "errors": 0,
+            "replays_ok": 0,
+            "replays_bad": 0,
+        }
+        latencies = []
+        errors = []
+        barrier = threading.Barrier(min(options["concurrency"], len(users)))
+
+        def book(user, choice, key):
+            if options["mode"] == "any":
+                appointment, _ = allocate(
+                    user, doctor_ids, hold=options["hold"], idempotency_key=key
+                )
+            else:
+                doctor_id, date, time_slot = choice
+                appointment, _ = reserve(
+                    user,
+                    doctor_id,
+                    date,
+                    time_slot,
+                    hold=options["hold"],
+                    idempotency_key=key,
+                )
+            if options["hold"]:
+                confirm(user, appointment.pk)
+            return appointment
+
+        def booker(user, seed, replay):
+            local = random.Random(seed)
+            try:
+                try:
+                    barrier.wait(timeout=5)
+                except threading.BrokenBarrierError:
+                    pass
+                for attempt in range(options["attempts"]):
+                    # Everyone goes for the early slots first, then retries
+                    # anywhere in the day.
+                    choice = local.choice(hot if attempt == 0 else slots)
+                    key = uuid.uuid4().hex
+                    start = time.perf_counter()
+                    try:
+                        appointment = book(user, choice, key)
+                        outcome = "booked"
+                    except SlotUnavailable:
+                        outcome = "conflicts"
+                    except Exception as exc:
+                        outcome = "errors"
+                        errors.append(repr(exc))
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        stats["attempts"] += 1
+                        stats[outcome] += 1
+                        latencies.append(elapsed * 1000)
+                    if outcome == "booked":
+                        break
+                else:
+                    with lock:
+                        stats["gave_up"] += 1
+                    return
+                if replay:
+                    # A client retrying after a timeout must get the same row.
+                    same = book(user, choice, key).pk == appointment.pk
+                    with lock:
+                        stats["replays_ok" if same else "replays_bad"] += 1
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as pool:
+            for seed, user in enumerate(users):
+                replay = rng.random() < options["replay_rate"]
+                pool.submit(booker, user, options["seed"] * 100_003 + seed, replay)
+        elapsed = time.perf_counter() - start
+        duplicates = (
+            Appointment.objects.filter(doctor_id__in=doctor_ids)
+            .exclude(status="cancelled")
+            .values("doctor_id", "date", "time_slot")
+            .annotate(n=Count("id"))
+            .filter(n__gt=1)
+            .count()
+        )
+        booked = Appointment.objects.filter(
+            doctor_id__in=doctor_ids, status="booked"
+        ).count()
+        free = (
+            sum(
+                DoctorAvailability.objects.filter(
+                    doctor_id__in=doctor_ids, date__gte=day
+                ).values_list("free_count", flat=True)
+            )
+            if options["mode"] == "slot"
+            else None
+        )
+
+        latencies.sort()
+        self.stdout.write(
+            f"{len(users)} bookers, concurrency {options['concurrency']}, "
+            f"mode {options['mode']}{' +hold' if options['hold'] else ''}, "
+            f"{len(slots)} slots on {day} across {len(doctor_ids)} doctors"
+        )
+        self.stdout.write(
+            f"Booked {stats['booked']} in {elapsed:.2f}s "
+            f"({stats['booked'] / elapsed:.0f} bookings/s, "
+            f"{stats['attempts'] / elapsed:.0f} attempts/s)"
+        )
+        self.stdout.write(
+            f"Conflict rate {stats['conflicts'] / max(stats['attempts'], 1):.1%} "
+            f"({stats['conflicts']} of {stats['attempts']} attempts), "
+            f"{stats['gave_up']} bookers gave up, {stats['errors']} errors"
+            + (f" (first: {errors[0]})" if errors else "")
+        )
+        if latencies:
+            self.stdout.write(
+                f"Attempt latency p50 {statistics.median(latencies):.1f} ms, "
+                f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms, "
+                f"max {latencies[-1]:.1f} ms"
+            )
+        self.stdout.write(
+            f"Idempotent replays: {stats['replays_ok']} matched, "
+            f"{stats['replays_bad']} mismatched"
+        )
+        consistent = duplicates == 0 and booked == stats["booked"]
+        if free is not None:
+            consistent = consistent and free == len(slots) - booked
+        style = self.style.SUCCESS if consistent else self.style.ERROR
+        self.stdout.write(
+            style(
+                f"Double-booked slots: {duplicates}; booked rows {booked}"
+                + (f"; free bits {free}" if free is not None else "")
+            )
+        )
@@ -0,0 +1,43 @@
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from backend.availability import ensure_days, horizon
+from backend.models import Doctor, DoctorAvailability
+
+
+class Command(BaseCommand):
+    help = (
+        "Prune past free-slot bitmaps and build the missing ones for every "
+        "doctor over the booking horizon. Run daily, and with --reset after "
+        "changing APPOINTMENT_SLOT_MINUTES or editing working hours in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Drop and rebuild today's and future rows too.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        start_time = time.perf_counter()
+        _, start, end = horizon()
+        pruned, _ = DoctorAvailability.objects.filter(date__lt=start).delete()
+        if options["reset"]:
+            DoctorAvailability.objects.filter(date__gte=start).delete()
+
+        created = 0
+        doctor_ids = Doctor.objects.values_list("id", flat=True).iterator()
+        while chunk := list(islice(doctor_ids, options["chunk_size"])):
+            created += ensure_days(chunk, start, end)
+
+        elapsed = time.perf_counter() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Pruned {pruned} past rows, built {created} rows for "
+                f"{start}..{end} in {elapsed:.2f}s"
+            )
+        )
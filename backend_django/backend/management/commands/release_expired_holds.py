@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from backend.booking import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Cancel appointment holds past their expiry and free their slots."
+
+    def handle(self, *args, **options):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired holds"))
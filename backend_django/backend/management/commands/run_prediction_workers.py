@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from backend.jobs import work
+
+
+def _worker(threads, poll_interval, once):
+    import torch
+
+    torch.set_num_threads(threads)
+    work(poll_interval=poll_interval, once=once)
+
+
+class Command(BaseCommand):
+    help = "Run a pool of inference worker processes draining predict/jobs/."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2)
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=2,
+            help="torch intra-op threads per worker process.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=0.5)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the queue is empty."
+        )
+
+    def handle(self, *args, **options):
+        args = (options["threads"], options["poll_interval"], options["once"])
+        # Each forked worker must open its own database connection, and loads
+        # the (memory-mapped) weights lazily on its first job.
+        connections.close_all()
+        processes = [
+            multiprocessing.get_context("fork").Process(
+                target=_worker, args=args, daemon=True
+            )
+            for _ in range(options["workers"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} prediction workers")
+        for process in processes:
+            process.join()
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from backend.ml.registry import model_registry
+
+
+class Command(BaseCommand):
+    help = "Load the melanoma classifier and run one dummy forward pass."
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        model_registry.warmup()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Model {model_registry.version} warmed up in {elapsed:.2f}s"
+            )
+        )
@@ -0,0 +1,136 @@
+"""Low-overhead in-process metrics with Prometheus text exposition.
+
+Counters and histograms are plain dicts guarded by a lock, and stage timings
+use ``time.perf_counter``. Stage timings are also collected per request
+(through a context variable) for the optional structured request log line.
+Values are per process, so scrape every worker or run one worker per pod.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_request_spans = ContextVar("request_spans", default=None)
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        # The last slot counts observations above the largest bucket.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    labels = _format_labels(key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time spent handling API requests."
+)
+STAGE_DURATION = Histogram(
+    "predict_stage_duration_seconds",
+    "Time spent in each stage of a prediction (upload, preprocess, forward, db).",
+)
+ERRORS = Counter(
+    "predict_errors_total",
+    "Failed predictions: requests that raised, and images a bulk request or "
+    "job could not score.",
+)
+
+# Callables returning ``[(name, type, help, {labels: value})]`` evaluated at
+# scrape time, for state that already lives elsewhere (cache, batcher, model).
+_collectors = []
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+    return collector
+
+
+@contextmanager
+def timed(stage):
+    """Time a block into ``STAGE_DURATION`` and the current request's spans."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans[stage] = spans.get(stage, 0) + elapsed
+
+
+def start_request(spans=None):
+    """Collect ``timed`` spans into ``spans`` (a new dict by default) until
+    ``end_request``; pass an earlier request's dict to resume it."""
+    spans = {} if spans is None else spans
+    return spans, _request_spans.set(spans)
+
+
+def end_request(token):
+    _request_spans.reset(token)
+
+
+def render():
+    lines = []
+    for metric in (REQUEST_DURATION, STAGE_DURATION, ERRORS):
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,77 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger("backend.requests")
+
+
+class RequestMetricsMiddleware:
+    """Records request latency per route and, if METRICS_LOG_REQUESTS is set,
+    logs one JSON line per request with the stage timings collected by
+    ``metrics.timed``. Streaming responses are recorded when the stream is
+    closed, so the time spent producing the body counts."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        spans, token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+
+        def finish():
+            self.record(request, response, spans, time.perf_counter() - start)
+
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, spans, finish
+            )
+        else:
+            finish()
+        return response
+
+    def stream(self, content, spans, finish):
+        # The body is produced after __call__ has returned, so the request's
+        # spans are re-activated around each chunk.
+        try:
+            chunks = iter(content)
+            while True:
+                _, token = metrics.start_request(spans)
+                try:
+                    chunk = next(chunks, None)
+                finally:
+                    metrics.end_request(token)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            finish()
+
+    def record(self, request, response, spans, elapsed):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        metrics.REQUEST_DURATION.observe(
+            elapsed, method=request.method, route=route, status=response.status_code
+        )
+        if settings.METRICS_LOG_REQUESTS:
+            logger.info(
+                json.dumps(
+                    {
+                        "method": request.method,
+                        "route": route,
+                        "status": response.status_code,
+                        "duration_ms": round(elapsed * 1000, 2),
+                        "stages_ms": {
+                            stage: round(seconds * 1000, 2)
+                            for stage, seconds in spans.items()
+                        },
+                    }
+                )
+            )
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_doctors(apps, schema_editor):
+    """Collapse doctors sharing a name and address into one row so the
+    constraint can be added, moving their appointments to the kept row.
+
+    If a duplicate has an appointment in a slot the kept row already has,
+    the unique (doctor, date, time_slot) rule leaves no lossless merge, so
+    nothing is changed and the migration stops with the clashes listed.
+    """
+    Doctor = apps.get_model("backend", "Doctor")
+    Appointment = apps.get_model("backend", "Appointment")
+    groups = (
+        Doctor.objects.values("name", "address")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .order_by()
+    )
+    merges, clashes = [], []
+    for group in groups:
+        keep, *duplicates = Doctor.objects.filter(
+            name=group["name"], address=group["address"]
+        ).order_by("pk")
+        taken = {}
+        for appointment in Appointment.objects.filter(
+            doctor__in=[keep, *duplicates]
+        ).order_by("doctor_id", "pk"):
+            slot = (appointment.date, appointment.time_slot)
+            if slot in taken:
+                clashes.append(
+                    f"{keep.name} ({keep.address}) on {slot[0]} at {slot[1]}: "
+                    f"appointments {taken[slot].pk} and {appointment.pk}"
+                )
+            else:
+                taken[slot] = appointment
+        merges.append((keep, duplicates))
+    if clashes:
+        raise RuntimeError(
+            "Duplicate doctors cannot be merged without losing appointments. "
+            "Reschedule one appointment of each pair below, then run migrate "
+            "again:\n  " + "\n  ".join(clashes)
+        )
+    for keep, duplicates in merges:
+        Appointment.objects.filter(doctor__in=duplicates).update(doctor=keep)
+        Doctor.objects.filter(pk__in=[doctor.pk for doctor in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_doctor_location_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_doctors, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='doctor',
+            constraint=models.UniqueConstraint(fields=('name', 'address'), name='unique_doctor_name_address'),
+        ),
+    ]
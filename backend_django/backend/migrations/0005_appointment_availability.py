@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_doctor_unique_name_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('free_slots', models.BinaryField()),
+                ('free_count', models.PositiveSmallIntegerField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointment',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'cancelled'), _negated=True), fields=('doctor', 'date', 'time_slot'), name='unique_active_appointment_slot'),
+        ),
+        migrations.AddField(
+            model_name='doctoravailability',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='backend.doctor'),
+        ),
+        migrations.AddConstraint(
+            model_name='doctoravailability',
+            constraint=models.UniqueConstraint(fields=('doctor', 'date'), name='unique_doctor_availability_day'),
+        ),
+    ]
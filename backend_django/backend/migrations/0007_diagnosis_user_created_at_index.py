@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_appointment_holds'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diagnosis',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='backend_dia_user_id_c7faf5_idx'),
+        ),
+    ]
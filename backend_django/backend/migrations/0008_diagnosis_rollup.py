@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_diagnosis_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiagnosisRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('prediction', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0)),
+                ('high_risk_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='diagnosis_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'day', 'prediction'), name='unique_user_rollup'), models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('day', 'prediction'), name='unique_clinic_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_diagnosis_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='diagnosis',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_diagnosis_embedding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='idempotency_fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from queue import Empty, Queue
+
+
+class BatchScheduler:
+    """Collects concurrent single-image requests into one forward pass.
+
+    Callers submit a preprocessed ``(N, C, H, W)`` tensor (one image, or its
+    test-time augmentation views) and block on their own future. A worker
+    thread drains the queue until either ``max_batch_size`` rows are
+    pending or ``max_wait_ms`` has passed since the first one arrived, runs
+    the model once and hands each caller its slice of the output. A tensor
+    that would push the batch past ``max_batch_size`` rows waits for the
+    next one, unless it is alone.
+
+    The scheduler is callable like the model it wraps, so it can be passed
+    straight to ``predict_melanoma``. Tuple outputs are sliced element-wise.
+    With ``grouped`` the model is also passed ``groups``, the row count of
+    each submitted tensor, so a cascade scores one image's views as a unit.
+    """
+
+    def __init__(self, model, max_batch_size=16, max_wait_ms=10, grouped=False):
+        self.model = model
+        self.grouped = grouped
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+        self._batch_sizes = Counter()
+        self._queue_depths = Counter()
+        # Dequeued item that did not fit the previous batch.
+        self._carry = None
+
+    def __call__(self, input_tensor):
+        return self.submit(input_tensor).result()
+
+    def submit(self, input_tensor):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((input_tensor, future))
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "queue_depth_histogram": dict(sorted(self._queue_depths.items())),
+            }
+
+    def _ensure_worker(self):
+        # The worker thread does not survive a fork, so a child process
+        # gets its own queue and thread on first use.
+        if self._worker is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._pid == os.getpid():
+                return
+            self._queue = Queue()
+            self._carry = None
+            self._pid = os.getpid()
+            self._worker = threading.Thread(
+                target=self._run, name="predict-batcher", daemon=True
+            )
+            self._worker.start()
+
+    def _collect(self):
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [self._queue.get()]
+        rows = batch[0][0].shape[0]
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            if rows + item[0].shape[0] > self.max_batch_size:
+                self._carry = item
+                break
+            batch.append(item)
+            rows += item[0].shape[0]
+        return batch
+
+    def _run(self):
+        import torch
+
+        while True:
+            batch = self._collect()
+            with self._lock:
+                self._batch_sizes[len(batch)] += 1
+                self._queue_depths[self._queue.qsize()] += 1
+
+            tensors, futures = zip(*batch)
+            try:
+                with torch.inference_mode():
+                    if self.grouped:
+                        outputs = self.model(
+                            torch.cat(tensors),
+                            groups=[tensor.shape[0] for tensor in tensors],
+                        )
+                    else:
+                        outputs = self.model(torch.cat(tensors))
+            except Exception as exc:
+                for future in futures:
+                    future.set_exception(exc)
+                continue
+
+            offset = 0
+            for tensor, future in zip(tensors, futures):
+                size = tensor.shape[0]
+                future.set_result(_slice(outputs, offset, offset + size))
+                offset += size
+
+
+def _slice(outputs, start, stop):
+    # Models may return a tuple of per-row outputs, e.g. (logits, embedding).
+    if isinstance(outputs, tuple):
+        return tuple(None if o is None else o[start:stop] for o in outputs)
+    return outputs[start:stop]
@@ -0,0 +1,219 @@
+"""Inference benchmark for the ml package.
+
+Runs standalone (no Django needed) on a CPU-only box:
+
+    python -m backend.ml.benchmark --random-weights --output bench.json
+
+and reports p50/p95/p99 latency, images/sec and peak RSS for preprocessing,
+the forward pass and ``predict_batch`` (decode, preprocess and forward)
+across batch sizes, torch thread counts and inference backends. Compare two
+JSON files to spot regressions.
+
+``predict_batch`` is the model path only: the request path in
+``backend.predictions.predict`` adds the micro-batcher, result cache and
+TTA planner on top, which need Django and are not measured here.
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw, ImageFilter
+
+from .detection_model import EfficientNetClassifier, load_backend, predict_batch
+from .preprocessing import preprocess_batch
+from .registry import BACKEND_SUFFIXES, MODEL_PATH, artifact_path
+
+
+def synthetic_lesion(width, height, seed=0):
+    """JPEG bytes of a skin-toned image with a dark irregular blob, roughly
+    the size and entropy of a phone photo of a lesion."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (224, 172, 140))
+    draw = ImageDraw.Draw(image)
+    cx, cy = width // 2, height // 2
+    for _ in range(12):
+        rx = rng.randint(width // 12, width // 6)
+        ry = rng.randint(height // 12, height // 6)
+        ox, oy = rng.randint(-rx // 2, rx // 2), rng.randint(-ry // 2, ry // 2)
+        shade = rng.randint(40, 110)
+        draw.ellipse(
+            (cx + ox - rx, cy + oy - ry, cx + ox + rx, cy + oy + ry),
+            fill=(shade + 30, shade, shade - 20),
+        )
+    noise = Image.effect_noise((width, height), 24).convert("RGB")
+    image = Image.blend(image, noise, 0.15).filter(ImageFilter.GaussianBlur(2))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def measure(fn, items_per_call, repeats, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    ms = np.array(timings) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "images_per_sec": float(items_per_call * len(ms) / ms.sum() * 1000),
+        "repeats": repeats,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in KiB on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_models(backends, random_weights, model_path):
+    models = {}
+    for backend in backends:
+        if random_weights:
+            if backend != "eager":
+                continue
+            models[backend] = EfficientNetClassifier(num_classes=2).eval()
+        elif os.path.exists(artifact_path(backend, model_path)):
+            models[backend] = load_backend(backend, model_path)
+    return models
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options):
+    images = {
+        f"{w}x{h}": [synthetic_lesion(w, h, seed) for seed in range(8)]
+        for w, h in options.image_sizes
+    }
+    models = load_models(options.backends, options.random_weights, options.model_path)
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "random_weights": options.random_weights,
+            "backends": sorted(models),
+        },
+        "preprocess": [],
+        "forward": [],
+        "predict_batch": [],
+    }
+
+    for size, samples in images.items():
+        for batch_size in options.batch_sizes:
+            batch = [samples[i % len(samples)] for i in range(batch_size)]
+            result = measure(
+                lambda: preprocess_batch(batch), batch_size, options.repeats
+            )
+            report["preprocess"].append(
+                {"image_size": size, "batch_size": batch_size} | result
+            )
+
+    for threads in options.threads:
+        torch.set_num_threads(threads)
+        for backend, model in models.items():
+            for batch_size in options.batch_sizes:
+                inputs = torch.randn(batch_size, 3, 224, 224)
+
+                def forward():
+                    with torch.inference_mode():
+                        model(inputs)
+
+                result = measure(forward, batch_size, options.repeats)
+                report["forward"].append(
+                    {"backend": backend, "threads": threads, "batch_size": batch_size}
+                    | result
+                )
+
+                for size, samples in images.items():
+                    batch = [samples[i % len(samples)] for i in range(batch_size)]
+                    result = measure(
+                        lambda: predict_batch(model, batch),
+                        batch_size,
+                        options.repeats,
+                    )
+                    report["predict_batch"].append(
+                        {
+                            "backend": backend,
+                            "threads": threads,
+                            "batch_size": batch_size,
+                            "image_size": size,
+                        }
+                        | result
+                    )
+
+    report["meta"]["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def parse_size(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1})
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=list(BACKEND_SUFFIXES),
+        choices=list(BACKEND_SUFFIXES),
+        help="Backends whose artifacts are missing are skipped.",
+    )
+    parser.add_argument(
+        "--image-sizes",
+        type=parse_size,
+        nargs="+",
+        default=[(1024, 768), (4032, 3024)],
+        help="Synthetic image sizes as WIDTHxHEIGHT.",
+    )
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument(
+        "--random-weights",
+        action="store_true",
+        help="Benchmark a randomly initialised eager model instead of model.pth.",
+    )
+    parser.add_argument("--output", help="Write the JSON report here (else stdout).")
+    options = parser.parse_args(argv)
+
+    report = run(options)
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Caches ``predict_melanoma`` results by upload content.
+
+    Keys combine a hash of the image bytes with the model fingerprint
+    (``model_version`` is a zero-argument callable, resolved on use), so
+    swapping ``model.pth`` never serves stale predictions. Entries live in a
+    bounded in-process LRU; if ``backend`` is given (any Django cache, e.g. a
+    file-based or Redis cache) it is used as a shared second tier.
+    """
+
+    def __init__(self, model_version, max_size=1024, backend=None, timeout=None):
+        self.model_version = model_version
+        self.max_size = max_size
+        self.backend = backend
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+
+    def key(self, data, variant=""):
+        """``variant`` separates results computed differently from the same
+        upload, e.g. with test-time augmentation."""
+        digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+        if variant:
+            return f"predict:{self.model_version()}:{variant}:{digest}"
+        return f"predict:{self.model_version()}:{digest}"
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+
+        if self.backend is not None:
+            result = self.backend.get(key)
+            if result is not None:
+                self._store(key, result)
+                with self._lock:
+                    self.backend_hits += 1
+                return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, result):
+        self._store(key, result)
+        if self.backend is not None:
+            self.backend.set(key, result, self.timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "backend_hits": self.backend_hits,
+                "misses": self.misses,
+            }
+
+    def _store(self, key, result):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -1,66 +1,255 @@
+import time
 import torch
 import torch.nn as nn
-import torchvision.transforms as transforms
-from PIL import Image
 import timm
-import os
+from contextlib import nullcontext
+
+from .preprocessing import preprocess_batch
+from .registry import MODEL_PATH, artifact_path
+from .tta import VIEWS, augment, view_planner
 
 
 class EfficientNetClassifier(nn.Module):
-    def __init__(self, num_classes=2):
+    # ``arch`` picks another timm backbone with the same wrapper, e.g. the
+    # cascade's distilled student (ml-model/train.py --arch).
+    def __init__(self, num_classes=2, arch="efficientnet_b0"):
         super().__init__()
-        self.model = timm.create_model("efficientnet_b0", pretrained=False)
-        in_features = self.model.classifier.in_features
-        self.model.classifier = nn.Linear(in_features, num_classes)
+        self.model = timm.create_model(arch, pretrained=False)
+        self.model.reset_classifier(num_classes)
 
     def forward(self, x):
         return self.model(x)
 
+    def forward_with_embedding(self, x):
+        """Logits plus the pooled features fed to the classifier (the
+        penultimate layer), from a single pass through the backbone."""
+        pooled = self.model.forward_head(
+            self.model.forward_features(x), pre_logits=True
+        )
+        return self.model.classifier(pooled), pooled
+
 
-def load_model():
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    model_path = os.path.join(base_dir, "model.pth")
-    model = EfficientNetClassifier(num_classes=2)
-    state_dict = torch.load(model_path, map_location=torch.device("cpu"))
-    model.load_state_dict(state_dict)
+def load_model(model_path=MODEL_PATH, arch="efficientnet_b0"):
+    model = EfficientNetClassifier(num_classes=2, arch=arch)
+    # mmap + assign keeps the parameters backed by the weights file, so every
+    # worker on the host shares one copy through the page cache.
+    state_dict = torch.load(model_path, map_location=torch.device("cpu"), mmap=True)
+    model.load_state_dict(state_dict, assign=True)
     model.eval()
     return model
 
 
-def preprocess_image(image_path):
-    transform = transforms.Compose(
-        [
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ]
-    )
-    image = Image.open(image_path).convert("RGB")
-    return transform(image).unsqueeze(0)
+class OnnxRuntimeModel:
+    """Callable wrapper so an ONNX Runtime session can stand in for the
+    eager model: takes and returns torch tensors."""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        return self.forward_with_embedding(x)[0]
+
+    def forward_with_embedding(self, x):
+        outputs = self.session.run(None, {self.input_name: x.numpy()})
+        # Models exported before embeddings were added have one output.
+        embedding = torch.from_numpy(outputs[1]) if len(outputs) > 1 else None
+        return torch.from_numpy(outputs[0]), embedding
+
+
+class TorchScriptModel:
+    """Callable wrapper around an exported TorchScript module with the same
+    interface as ``OnnxRuntimeModel``."""
+
+    def __init__(self, path):
+        self.module = torch.jit.optimize_for_inference(
+            torch.jit.load(path, map_location="cpu")
+        )
+
+    def __call__(self, x):
+        return self.forward_with_embedding(x)[0]
+
+    def forward_with_embedding(self, x):
+        outputs = self.module(x)
+        if isinstance(outputs, tuple):
+            return outputs
+        return outputs, None
+
+
+class CascadeModel:
+    """Two-tier classifier: a small student scores every image and only the
+    ones it does not confidently call benign (melanoma probability at or
+    above ``escalate_above``) are re-scored by the teacher.
+
+    ``forward_with_embedding`` returns ``(logits, embeddings, escalated)``.
+    Embeddings come from the teacher, so they stay comparable with stored
+    ones; rows the student settled get zeros there and ``escalated`` False.
+    ``groups`` gives the row counts of consecutive blocks that are one
+    image's TTA views; a block is escalated as a whole on the student's mean
+    probability, so an image is never scored by a mix of both tiers.
+    """
+
+    def __init__(self, student, teacher, escalate_above=0.1):
+        self.student = student
+        self.teacher = teacher
+        self.escalate_above = escalate_above
+        self.scored = 0
+        self.escalated = 0
+
+    def __call__(self, x):
+        return self.forward_with_embedding(x)[0]
+
+    def forward_with_embedding(self, x, groups=None):
+        logits = self.student(x).float()
+        melanoma = torch.softmax(logits, dim=1)[:, CLASSES.index("Melanoma")]
+        sizes = torch.as_tensor(groups if groups is not None else [1] * len(x))
+        image = torch.repeat_interleave(torch.arange(len(sizes)), sizes)
+        mean = torch.zeros(len(sizes)).index_add_(0, image, melanoma) / sizes
+        escalated_images = mean >= self.escalate_above
+        escalated = escalated_images[image]
+        embeddings = None
+        if escalated.any():
+            teacher_logits, teacher_embeddings = self.teacher.forward_with_embedding(
+                x[escalated]
+            )
+            logits[escalated] = teacher_logits.float()
+            if teacher_embeddings is not None:
+                embeddings = teacher_embeddings.new_zeros(
+                    (len(x), teacher_embeddings.shape[1])
+                )
+                embeddings[escalated] = teacher_embeddings
+        self.scored += len(sizes)
+        self.escalated += int(escalated_images.sum())
+        return logits, embeddings, escalated
+
 
+def load_backend(backend="eager", model_path=MODEL_PATH):
+    """Load the classifier for one of the runtime backends in
+    ``registry.BACKEND_SUFFIXES``."""
+    path = artifact_path(backend, model_path)
+    if backend == "eager":
+        return load_model(path)
+    if backend == "torchscript":
+        return TorchScriptModel(path)
+    return OnnxRuntimeModel(path)
 
-def predict_melanoma(model, image_path):
+
+def preprocess_image(image):
+    return preprocess_batch([image])
+
+
+CLASSES = ["Benign", "Melanoma"]
+
+
+def format_prediction(probabilities, threshold=None):
+    """Build the API result from one row of class probabilities.
+
+    With a ``threshold`` the scan is called melanoma when its melanoma
+    probability reaches it, instead of when it is the larger one.
+    """
+    if threshold is None:
+        class_idx = int(torch.argmax(probabilities))
+    else:
+        class_idx = int(probabilities[CLASSES.index("Melanoma")] >= threshold)
+    confidence = probabilities[class_idx].item()
+    prediction = CLASSES[class_idx]
+
+    return {
+        "prediction": prediction,
+        "confidence": round(confidence * 100, 2),
+        "risk": "High" if prediction == "Melanoma" else "Low",
+        "recommendations": [
+            (
+                "Schedule dermatologist visit ASAP"
+                if prediction == "Melanoma"
+                else "Monitor the skin area"
+            ),
+            "Avoid excessive sun exposure",
+            "Take clear photos to track changes",
+        ],
+    }
+
+
+def predict_batch(model, images, timer=None, views=1, threshold=None):
+    """Score several images with a single forward pass.
+
+    ``model`` returns logits, or ``(logits, embeddings)`` like
+    ``forward_with_embedding``, in which case each result also carries its
+    embedding as float16 bytes under ``"embedding"``. A ``CascadeModel``
+    adds a per-row escalation mask; results then record the ``"tier"`` that
+    scored them, and only teacher-scored ones get an embedding. For a
+    cascade to treat each image's TTA views as one, ``model`` must pass it
+    ``groups`` (the micro-batcher does for ``predict_melanoma``).
+
+    With ``views`` > 1 each image is also scored as flipped/rotated copies
+    (see ``tta.VIEWS``), all in the same forward pass, and its result is the
+    mean of the per-view softmax. The embedding is taken from the unaltered
+    view so it stays comparable with single-view results.
+
+    ``threshold`` is the melanoma cutoff (see ``registry.load_threshold``);
+    None keeps the argmax.
+
+    ``timer``, if given, is called with a stage name ("preprocess",
+    "forward") and must return a context manager wrapping that stage.
+    """
+    timer = timer or (lambda stage: nullcontext())
     with torch.no_grad():
-        input_tensor = preprocess_image(image_path)
-        outputs = model(input_tensor)
-        probabilities = torch.softmax(outputs, dim=1)
-        class_idx = torch.argmax(probabilities, dim=1).item()
-        confidence = probabilities[0][class_idx].item()
-
-        classes = ["Benign", "Melanoma"]
-        prediction = classes[class_idx]
-
-        return {
-            "prediction": prediction,
-            "confidence": round(confidence * 100, 2),
-            "risk": "High" if prediction == "Melanoma" else "Low",
-            "recommendations": [
-                (
-                    "Schedule dermatologist visit ASAP"
-                    if prediction == "Melanoma"
-                    else "Monitor the skin area"
-                ),
-                "Avoid excessive sun exposure",
-                "Take clear photos to track changes",
-            ],
-        }
+        with timer("preprocess"):
+            inputs = preprocess_batch(images)
+            if views > 1:
+                inputs = augment(inputs, views)
+        with timer("forward"):
+            outputs = model(inputs)
+        if not isinstance(outputs, tuple):
+            outputs = (outputs,)
+        logits, embeddings, escalated = outputs + (None,) * (3 - len(outputs))
+        probabilities = torch.softmax(logits, dim=1)
+        if views > 1:
+            probabilities = probabilities.view(views, len(images), -1).mean(0)
+        results = [format_prediction(row, threshold) for row in probabilities]
+        # With TTA the unaltered view's rows come first.
+        if escalated is not None:
+            escalated = escalated[: len(images)].tolist()
+            for result, teacher in zip(results, escalated):
+                result["tier"] = "teacher" if teacher else "student"
+        if embeddings is not None:
+            embeddings = embeddings[: len(images)].to(torch.float16).numpy()
+            for i, (result, row) in enumerate(zip(results, embeddings)):
+                if escalated is None or escalated[i]:
+                    result["embedding"] = row.tobytes()
+        return results
+
+
+def predict_melanoma(
+    model, image, timer=None, max_views=1, budget_ms=None, threshold=None
+):
+    """Score one image, with test-time augmentation when ``max_views`` > 1.
+
+    The number of views is the most that ``view_planner`` expects to fit in
+    ``budget_ms`` (no limit if None), judged from the model latency of earlier
+    calls, so it drops towards one as the model slows down under load. The
+    result records it under ``"views"``.
+    """
+    views = 1
+    if max_views > 1:
+        views = (
+            min(max_views, len(VIEWS))
+            if budget_ms is None
+            else view_planner.views_for(budget_ms / 1000, max_views)
+        )
+
+    def observed(inputs):
+        start = time.perf_counter()
+        outputs = model(inputs)
+        view_planner.observe(views, time.perf_counter() - start)
+        return outputs
+
+    result = predict_batch(observed, [image], timer, views, threshold)[0]
+    result["views"] = views
+    return result
@@ -0,0 +1,152 @@
+import csv
+import os
+
+import numpy as np
+import torch
+
+from .preprocessing import IMAGE_EXTENSIONS, preprocess_batch
+
+MELANOMA = 1
+
+
+class WithEmbedding(torch.nn.Module):
+    """Exposes ``forward_with_embedding`` as ``forward`` so exported models
+    return ``(logits, embedding)``."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model.forward_with_embedding(x)
+
+
+def export_torchscript(model, path):
+    """Trace, freeze and save the eager model as a TorchScript module
+    returning ``(logits, embedding)``."""
+    example = torch.zeros(1, 3, 224, 224)
+    with torch.inference_mode():
+        traced = torch.jit.trace(WithEmbedding(model).eval(), example)
+    # optimize_for_inference() output does not serialize, so it is applied at
+    # load time instead (see detection_model.TorchScriptModel).
+    torch.jit.freeze(traced).save(path)
+    return path
+
+
+def export_onnx(model, path, opset=17):
+    """Export the eager model to ONNX with ``logits`` and ``embedding``
+    outputs and a dynamic batch dimension so the micro-batcher can feed it
+    batches of any size."""
+    example = torch.zeros(1, 3, 224, 224)
+    torch.onnx.export(
+        WithEmbedding(model).eval(),
+        example,
+        path,
+        input_names=["input"],
+        output_names=["logits", "embedding"],
+        dynamic_axes={
+            "input": {0: "batch"},
+            "logits": {0: "batch"},
+            "embedding": {0: "batch"},
+        },
+        opset_version=opset,
+        dynamo=False,
+    )
+    return path
+
+
+def quantize_onnx(fp32_path, int8_path, calibration_batches):
+    """Statically quantize the ONNX model to INT8 (QDQ, per-channel weights),
+    calibrating activation ranges on ``calibration_batches``."""
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(calibration_batches)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {"input": batch.numpy()}
+
+    quantize_static(
+        fp32_path,
+        int8_path,
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+    return int8_path
+
+
+def load_sample_set(image_dir, labels_csv=None, limit=None):
+    """Load a calibration/parity sample set.
+
+    ``labels_csv`` follows the ISIC ``train.csv`` layout (``image_name``,
+    ``target``); without it only agreement with the fp32 model is measured.
+    Returns ``(inputs, labels)`` where ``labels`` may be ``None``.
+    """
+    if labels_csv:
+        with open(labels_csv, newline="") as f:
+            rows = [(r["image_name"], int(r["target"])) for r in csv.DictReader(f)]
+        names = {os.path.splitext(n)[0]: n for n in os.listdir(image_dir)}
+        rows = [(names[name], target) for name, target in rows if name in names]
+    else:
+        rows = [
+            (name, None)
+            for name in sorted(os.listdir(image_dir))
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ]
+    rows = rows[:limit] if limit else rows
+    if not rows:
+        raise ValueError(f"No sample images found in {image_dir}")
+
+    inputs = preprocess_batch([os.path.join(image_dir, name) for name, _ in rows])
+    labels = None if labels_csv is None else np.array([t for _, t in rows])
+    return inputs, labels
+
+
+def iter_batches(inputs, batch_size=32):
+    for start in range(0, len(inputs), batch_size):
+        yield inputs[start : start + batch_size]
+
+
+def predict_probabilities(model, inputs, batch_size=32):
+    with torch.inference_mode():
+        return torch.cat(
+            [torch.softmax(model(b), dim=1) for b in iter_batches(inputs, batch_size)]
+        ).numpy()
+
+
+def melanoma_recall(predicted, positives):
+    if not positives.any():
+        return None
+    return float((predicted[positives] == MELANOMA).mean())
+
+
+def parity_report(reference, candidate, inputs, labels=None, batch_size=32):
+    """Compare a candidate backend against the eager fp32 reference.
+
+    Melanoma recall is measured against ``labels`` when given, otherwise
+    against the reference model's own melanoma predictions.
+    """
+    ref_probs = predict_probabilities(reference, inputs, batch_size)
+    cand_probs = predict_probabilities(candidate, inputs, batch_size)
+    ref_pred = ref_probs.argmax(axis=1)
+    cand_pred = cand_probs.argmax(axis=1)
+    positives = (labels if labels is not None else ref_pred) == MELANOMA
+
+    return {
+        "images": len(inputs),
+        "agreement": float((ref_pred == cand_pred).mean()),
+        "max_abs_prob_diff": float(np.abs(ref_probs - cand_probs).max()),
+        "reference_melanoma_recall": melanoma_recall(ref_pred, positives),
+        "candidate_melanoma_recall": melanoma_recall(cand_pred, positives),
+        "recall_against": "labels" if labels is not None else "reference",
+    }
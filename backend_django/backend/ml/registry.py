@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+# Nothing in this module imports torch at module level: management commands
+# (migrate, shell, createsuperuser) import the URLconf and therefore views,
+# and should not pay for torch/timm or the weights.
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model.pth")
+
+# Runtime backends and the artifact each one loads, relative to model.pth.
+# Everything except "eager" is produced by `manage.py export_model`.
+BACKEND_SUFFIXES = {
+    "eager": ".pth",
+    "torchscript": ".ts",
+    "onnx": ".onnx",
+    "onnx-int8": ".int8.onnx",
+}
+
+
+def artifact_path(backend, model_path=MODEL_PATH):
+    if backend not in BACKEND_SUFFIXES:
+        raise ValueError(
+            f"Unknown inference backend {backend!r}, "
+            f"expected one of {', '.join(BACKEND_SUFFIXES)}"
+        )
+    return os.path.splitext(model_path)[0] + BACKEND_SUFFIXES[backend]
+
+
+def threshold_path(model_path=MODEL_PATH):
+    """Decision threshold written by ml-model/evaluate.py next to the
+    weights (``model.threshold.json``)."""
+    return os.path.splitext(model_path)[0] + ".threshold.json"
+
+
+def load_threshold(model_path=MODEL_PATH):
+    """Melanoma probability at or above which a scan is called melanoma, or
+    None to keep the argmax cutoff when no threshold file exists."""
+    try:
+        with open(threshold_path(model_path)) as f:
+            return float(json.load(f)["threshold"])
+    except FileNotFoundError:
+        return None
+
+
+def model_version(model_path=MODEL_PATH):
+    """Short fingerprint of the weights file, used to key cached results."""
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class ModelRegistry:
+    """Lazily loads the classifier on first use.
+
+    The registry is callable like the model itself. Call ``warmup()`` in
+    each server process after it has forked (see ``gunicorn.conf.py``), not
+    in a preforking master: torch thread pools started before a fork can
+    deadlock the children. ``load_model`` memory-maps the weights file, so
+    processes that load independently still share its pages through the
+    page cache.
+    """
+
+    def __init__(
+        self,
+        model_path=MODEL_PATH,
+        backend="eager",
+        student_path=None,
+        student_arch="mobilenetv3_large_100",
+        escalate_above=0.1,
+    ):
+        self.model_path = model_path
+        self.backend = backend
+        # With a student, the model is a CascadeModel in front of the
+        # backend's classifier (see PREDICT_CASCADE_STUDENT).
+        self.student_path = student_path
+        self.student_arch = student_arch
+        self.escalate_above = escalate_above
+        self._model = None
+        self._version = None
+        self._threshold = None
+        self._threshold_loaded = False
+        self.loads = 0
+        self.load_seconds = 0.0
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)
+
+    def __call__(self, input_tensor):
+        return self.get()(input_tensor)
+
+    def forward_with_embedding(self, input_tensor, groups=None):
+        """``groups`` (row counts of one image's TTA views) only matters to
+        a cascade and is dropped for a single model."""
+        model = self.get()
+        if groups is not None and hasattr(model, "escalated"):
+            return model.forward_with_embedding(input_tensor, groups)
+        return model.forward_with_embedding(input_tensor)
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    @property
+    def threshold(self):
+        if not self._threshold_loaded:
+            self._threshold = load_threshold(self.model_path)
+            self._threshold_loaded = True
+        return self._threshold
+
+    @property
+    def escalate_cutoff(self):
+        """``escalate_above`` capped at the decision threshold (0.5 for
+        argmax): above it the student alone could call a scan melanoma."""
+        threshold = 0.5 if self.threshold is None else self.threshold
+        if self.escalate_above > threshold:
+            logger.warning(
+                "Cascade escalation cutoff %g is above the decision threshold "
+                "%g; using %g so every melanoma call comes from the main model",
+                self.escalate_above,
+                threshold,
+                threshold,
+            )
+            return threshold
+        return self.escalate_above
+
+    @property
+    def version(self):
+        if self._version is None:
+            path = artifact_path(self.backend, self.model_path)
+            version = f"{self.backend}-{model_version(path)}"
+            if self.threshold is not None:
+                # Results depend on the cutoff too.
+                version += f"-t{self.threshold:g}"
+            if self.student_path:
+                student = model_version(self.student_path)
+                version += f"-cascade-{student}-{self.escalate_cutoff:g}"
+            self._version = version
+        return self._version
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from .detection_model import (
+                        CascadeModel,
+                        load_backend,
+                        load_model,
+                    )
+
+                    start = time.perf_counter()
+                    model = load_backend(self.backend, self.model_path)
+                    if self.student_path:
+                        model = CascadeModel(
+                            load_model(self.student_path, self.student_arch),
+                            model,
+                            self.escalate_cutoff,
+                        )
+                    self._model = model
+                    self.load_seconds = time.perf_counter() - start
+                    self.loads += 1
+        return self._model
+
+    def cascade_stats(self):
+        """Images scored and escalated by the cascade so far, or None when
+        no cascade is loaded."""
+        model = self._model
+        if not hasattr(model, "escalated"):
+            return None
+        return {"scored": model.scored, "escalated": model.escalated}
+
+    def warmup(self):
+        """Load the weights and run one dummy forward pass so the first real
+        request does not pay for lazy initialisation inside torch."""
+        import torch
+
+        model = self.get()
+        with torch.inference_mode():
+            model(torch.zeros(1, 3, 224, 224))
+        return model
+
+    def _reset_lock(self):
+        # A lock held by another thread at fork time would stay locked forever
+        # in the child.
+        self._lock = threading.Lock()
+
+
+model_registry = ModelRegistry()
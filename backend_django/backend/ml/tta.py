@@ -0,0 +1,73 @@
+import threading
+from collections import Counter
+
+# Dihedral views of a (N, C, H, W) batch, most useful first: training
+# augments with horizontal and vertical flips, so the first four views are
+# in-distribution; lesions have no canonical orientation, so the rotations
+# and transposes after them are reasonable extras.
+VIEWS = (
+    ("identity", lambda x: x),
+    ("hflip", lambda x: x.flip(3)),
+    ("vflip", lambda x: x.flip(2)),
+    ("rot180", lambda x: x.flip(2, 3)),
+    ("rot90", lambda x: x.rot90(1, (2, 3))),
+    ("rot270", lambda x: x.rot90(3, (2, 3))),
+    ("transpose", lambda x: x.transpose(2, 3)),
+    ("antitranspose", lambda x: x.rot90(1, (2, 3)).flip(3)),
+)
+
+
+def augment(inputs, views):
+    """Stack the first ``views`` views of ``inputs`` into one batch, view
+    major: rows ``[v * N:(v + 1) * N]`` hold view ``v``."""
+    import torch
+
+    return torch.cat([transform(inputs) for _, transform in VIEWS[:views]])
+
+
+class ViewPlanner:
+    """Picks how many TTA views fit a latency budget.
+
+    Keeps an exponentially weighted average of the observed forward latency
+    per row. When the model sits behind the micro-batcher that latency
+    includes queueing and other requests' rows, so it rises under load and
+    requests automatically fall back towards a single view. The first
+    ``warmup`` calls are not averaged in, since they include loading the
+    model; until an estimate exists only one view is used.
+    """
+
+    def __init__(self, smoothing=0.2, warmup=1):
+        self.smoothing = smoothing
+        self.warmup = warmup
+        self.seconds_per_row = None
+        self.requests_by_views = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, rows, seconds):
+        """Record that a request scored ``rows`` views in ``seconds``."""
+        sample = seconds / rows
+        with self._lock:
+            self.requests_by_views[rows] += 1
+            if self.warmup > 0:
+                self.warmup -= 1
+                return
+            if self.seconds_per_row is None:
+                self.seconds_per_row = sample
+            else:
+                self.seconds_per_row += self.smoothing * (sample - self.seconds_per_row)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "seconds_per_row": self.seconds_per_row,
+                "requests_by_views": dict(sorted(self.requests_by_views.items())),
+            }
+
+    def views_for(self, budget_seconds, max_views):
+        estimate = self.seconds_per_row
+        if estimate is None or budget_seconds <= 0:
+            return 1
+        return max(1, min(max_views, len(VIEWS), int(budget_seconds / estimate)))
+
+
+view_planner = ViewPlanner()
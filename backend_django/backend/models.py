@@ -31,10 +31,80 @@ class Diagnosis(models.Model):
     confidence = models.FloatField()
     risk = models.CharField(max_length=20)
     recommendations = models.TextField()
+    # Classifier's pooled image features as float16 bytes, for lesion
+    # tracking (see backend.similarity).
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Serves the per-user history, newest first with id as tie-breaker.
+        indexes = [models.Index(fields=["user", "created_at", "id"])]
+
     def __str__(self):
-        return f"{self.user.full_name} - {self.prediction} ({self.confidence:.2f})"
+        # user_id rather than user.full_name: no query per row in admin lists.
+        return f"{self.prediction} ({self.confidence:.2f}) for user {self.user_id}"
+
+
+class DiagnosisRollup(models.Model):
+    """Per-day diagnosis counts by prediction, kept current by
+    ``backend.rollups``. Rows with no user hold the clinic-wide totals."""
+
+    user = models.ForeignKey(
+        User,
+        related_name="diagnosis_rollups",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    day = models.DateField()
+    prediction = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0)
+    high_risk_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day", "prediction"], name="unique_user_rollup"
+            ),
+            # NULLs are distinct in the constraint above.
+            models.UniqueConstraint(
+                fields=["day", "prediction"],
+                condition=models.Q(user__isnull=True),
+                name="unique_clinic_rollup",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.prediction}: {self.count}"
+
+
+class PredictionJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, related_name="prediction_jobs", on_delete=models.CASCADE
+    )
+    image = models.BinaryField()  # cleared once the job has run
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    diagnosis = models.OneToOneField(
+        Diagnosis, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
 
 
 class Doctor(models.Model):
@@ -50,12 +120,21 @@ class Doctor(models.Model):
     longitude = models.FloatField()
     working_hours = models.JSONField(default=dict)
 
+    class Meta:
+        indexes = [models.Index(fields=["latitude", "longitude"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "address"], name="unique_doctor_name_address"
+            )
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.specialization})"
 
 
 class Appointment(models.Model):
     STATUS_CHOICES = [
+        ("held", "Held"),
         ("booked", "Booked"),
         ("cancelled", "Cancelled"),
         ("completed", "Completed"),
@@ -71,10 +150,51 @@ class Appointment(models.Model):
     date = models.DateField()
     time_slot = models.TimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="booked")
+    hold_expires_at = models.DateTimeField(null=True, blank=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    # Hash of the request that used idempotency_key, so a reused key with a
+    # different request is rejected rather than replayed.
+    idempotency_fingerprint = models.CharField(max_length=64, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ("doctor", "date", "time_slot")
+        # Cancelled appointments keep their row but give the slot back.
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "date", "time_slot"],
+                condition=~models.Q(status="cancelled"),
+                name="unique_active_appointment_slot",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"],
+                name="unique_appointment_idempotency_key",
+            ),
+        ]
+        indexes = [models.Index(fields=["status", "hold_expires_at"])]
 
     def __str__(self):
         return f"Appt: {self.user.full_name} with {self.doctor.name} on {self.date} at {self.time_slot}"
+
+
+class DoctorAvailability(models.Model):
+    """Free-slot bitmap for one doctor on one day, maintained by
+    ``backend.availability``. Bit ``i`` is set when the slot starting
+    ``i * APPOINTMENT_SLOT_MINUTES`` minutes after midnight is within working
+    hours and not booked."""
+
+    doctor = models.ForeignKey(
+        Doctor, related_name="availability", on_delete=models.CASCADE
+    )
+    date = models.DateField()
+    free_slots = models.BinaryField()
+    free_count = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "date"], name="unique_doctor_availability_day"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.doctor_id} on {self.date}: {self.free_count} free"
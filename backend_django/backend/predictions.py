@@ -0,0 +1,310 @@
+import logging
+import zipfile
+from functools import partial
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .ml.batching import BatchScheduler
+from .ml.cache import PredictionCache
+from .ml.registry import model_registry
+from .ml.tta import view_planner
+from .metrics import ERRORS, register_collector, timed
+from .models import Diagnosis
+from . import rollups
+from .similarity import embedding_index
+
+logger = logging.getLogger(__name__)
+
+BATCHER = BatchScheduler(
+    model_registry.forward_with_embedding,
+    max_batch_size=settings.PREDICT_BATCH_MAX_SIZE,
+    max_wait_ms=settings.PREDICT_BATCH_MAX_WAIT_MS,
+    # Every submission is one image, possibly with its TTA views.
+    grouped=True,
+)
+PREDICTION_CACHE = PredictionCache(
+    lambda: model_registry.version,
+    max_size=settings.PREDICT_CACHE_SIZE,
+    backend=(
+        caches[settings.PREDICT_CACHE_ALIAS] if settings.PREDICT_CACHE_ALIAS else None
+    ),
+    timeout=settings.PREDICT_CACHE_TIMEOUT,
+)
+
+
+@register_collector
+def _collect():
+    cache = PREDICTION_CACHE.stats()
+    batching = BATCHER.stats()
+    tta = view_planner.stats()
+    cascade = model_registry.cascade_stats()
+    return [
+        (
+            "predict_cache_lookups_total",
+            "counter",
+            "Prediction cache lookups by outcome.",
+            {
+                (("result", "hit"),): cache["hits"],
+                (("result", "backend_hit"),): cache["backend_hits"],
+                (("result", "miss"),): cache["misses"],
+            },
+        ),
+        (
+            "predict_cache_entries",
+            "gauge",
+            "In-process cache size.",
+            {(): cache["size"]},
+        ),
+        (
+            "predict_batch_queue_depth",
+            "gauge",
+            "Requests waiting for the batcher.",
+            {(): batching["queue_depth"]},
+        ),
+        (
+            "predict_batches_total",
+            "counter",
+            "Forward passes run by the batcher, by batch size.",
+            {
+                (("size", size),): count
+                for size, count in batching["batch_size_histogram"].items()
+            },
+        ),
+        (
+            "predict_tta_seconds_per_view",
+            "gauge",
+            "Smoothed model latency per image view used to size TTA.",
+            {(): tta["seconds_per_row"] or 0},
+        ),
+        (
+            "predict_tta_requests_total",
+            "counter",
+            "Single-image predictions by number of views scored.",
+            {
+                (("views", views),): count
+                for views, count in tta["requests_by_views"].items()
+            },
+        ),
+        (
+            "predict_cascade_images_total",
+            "counter",
+            "Images scored by the cascade, by the tier that settled them.",
+            (
+                {
+                    (("tier", "student"),): cascade["scored"] - cascade["escalated"],
+                    (("tier", "teacher"),): cascade["escalated"],
+                }
+                if cascade
+                else {}
+            ),
+        ),
+        (
+            "model_loads_total",
+            "counter",
+            "Times the classifier weights were loaded in this process.",
+            {(("backend", model_registry.backend),): model_registry.loads},
+        ),
+        (
+            "model_load_seconds",
+            "gauge",
+            "Duration of the last model load.",
+            {(): model_registry.load_seconds},
+        ),
+    ]
+
+
+def _variant(views):
+    return f"tta{views}" if views > 1 else ""
+
+
+def predict(data, tta=None, budget_ms=None, model=None):
+    """Run the classifier on raw upload bytes, going through the cache.
+
+    ``tta`` and ``budget_ms`` default to ``PREDICT_TTA`` and
+    ``PREDICT_TTA_BUDGET_MS``. ``model`` defaults to the micro-batcher.
+
+    Results are cached under the number of views actually scored, so one
+    computed with fewer views under load is never served as the full-TTA
+    answer.
+    """
+    if tta is None:
+        tta = settings.PREDICT_TTA
+    max_views = settings.PREDICT_TTA_MAX_VIEWS if tta else 1
+    cache_key = PREDICTION_CACHE.key(data, _variant(max_views))
+    result = PREDICTION_CACHE.get(cache_key)
+    if result is None:
+        from .ml.detection_model import predict_melanoma
+
+        result = predict_melanoma(
+            model or BATCHER,
+            data,
+            timer=timed,
+            max_views=max_views,
+            budget_ms=budget_ms or settings.PREDICT_TTA_BUDGET_MS,
+            threshold=model_registry.threshold,
+        )
+        if result["views"] != max_views:
+            cache_key = PREDICTION_CACHE.key(data, _variant(result["views"]))
+        PREDICTION_CACHE.set(cache_key, result)
+    return result
+
+
+def build_diagnosis(user, result):
+    return Diagnosis(
+        user=user,
+        prediction=result["prediction"],
+        confidence=result["confidence"],
+        risk=result["risk"],
+        recommendations="\n".join(result["recommendations"]),
+        embedding=result.get("embedding"),
+    )
+
+
+def record_diagnosis(user, result):
+    diagnosis = build_diagnosis(user, result)
+    with transaction.atomic():
+        diagnosis.save()
+        rollups.record([diagnosis])
+    return diagnosis
+
+
+def iter_uploads(files):
+    """Yield ``(name, read)`` for each uploaded image, expanding ZIP archives
+    one member at a time. ``read()`` returns the image bytes; nothing is
+    read or decompressed until it is called, which must happen before the
+    next item is pulled.
+
+    Members that would inflate past ``FILE_UPLOAD_MAX_MEMORY_SIZE`` are not
+    extracted (a small archive can expand to gigabytes); their ``read()``
+    raises ``ValueError``.
+    """
+    from .ml.preprocessing import IMAGE_EXTENSIONS
+
+    for file in files:
+        if zipfile.is_zipfile(file):
+            file.seek(0)
+            with zipfile.ZipFile(file) as archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if (
+                        info.is_dir()
+                        or name.startswith("__MACOSX/")
+                        or not name.lower().endswith(IMAGE_EXTENSIONS)
+                    ):
+                        continue
+                    yield name, partial(_read_member, archive, info)
+        else:
+            yield file.name, partial(_read_file, file)
+
+
+def _read_member(archive, info):
+    if info.file_size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        raise ValueError("File is too large")
+    # ZipExtFile stops at file_size, so the header cannot understate it.
+    return archive.read(info)
+
+
+def _read_file(file):
+    file.seek(0)
+    return file.read()
+
+
+def _read(upload):
+    name, read = upload
+    try:
+        return name, read()
+    except Exception as exc:
+        return name, exc
+
+
+def predict_bulk(user, uploads):
+    """Score ``(name, read)`` uploads from ``iter_uploads`` in batches,
+    yielding one result dict per image and a final summary.
+
+    Each batch's diagnoses are written with one ``bulk_create`` before its
+    results are yielded, so every streamed id exists even if the client
+    goes away. Failures, including a failed forward pass, become per-file
+    ``error`` lines and the stream still ends with the summary. Uploads
+    beyond ``PREDICT_BULK_MAX_IMAGES`` are not read; the summary then has
+    ``truncated`` set.
+    """
+    from .ml.detection_model import predict_batch
+    from .ml.preprocessing import decode
+
+    count = 0
+    uploads = iter(uploads)
+    limited = islice(uploads, settings.PREDICT_BULK_MAX_IMAGES)
+    # Each upload is read as it is pulled, while its archive is still open.
+    while chunk := [
+        _read(upload) for upload in islice(limited, settings.PREDICT_BATCH_MAX_SIZE)
+    ]:
+        results, pending = {}, []
+        for i, (name, data) in enumerate(chunk):
+            if isinstance(data, Exception):
+                results[i] = data
+                continue
+            key = PREDICTION_CACHE.key(data)
+            results[i] = PREDICTION_CACHE.get(key)
+            if results[i] is None:
+                try:
+                    pending.append((i, key, decode(data)))
+                except Exception as exc:
+                    results[i] = exc
+
+        if pending:
+            images = [image for _, _, image in pending]
+            try:
+                scored = predict_batch(
+                    model_registry.forward_with_embedding,
+                    images,
+                    timer=timed,
+                    threshold=model_registry.threshold,
+                )
+            except Exception:
+                logger.exception("Bulk prediction batch failed")
+                scored = [RuntimeError("Prediction failed")] * len(pending)
+            for (i, key, _), result in zip(pending, scored):
+                if not isinstance(result, Exception):
+                    PREDICTION_CACHE.set(key, result)
+                results[i] = result
+
+        diagnoses = {
+            i: build_diagnosis(user, result)
+            for i, result in results.items()
+            if not isinstance(result, Exception)
+        }
+        with timed("db"), transaction.atomic():
+            Diagnosis.objects.bulk_create(diagnoses.values())
+            rollups.record(diagnoses.values())
+        # bulk_create skips the signal that normally does this.
+        embedding_index.invalidate(user.pk)
+        count += len(diagnoses)
+
+        for i, (name, _) in enumerate(chunk):
+            if i not in diagnoses:
+                ERRORS.inc(view="predict_bulk")
+                yield {"file": name, "error": str(results[i])}
+                continue
+            diagnosis = diagnoses[i]
+            yield {"file": name, "id": diagnosis.id} | diagnosis_payload(diagnosis)
+
+    summary = {"done": True, "count": count}
+    # Pulls at most one more name; its bytes are never read.
+    if next(uploads, None) is not None:
+        summary |= {"truncated": True, "max_images": settings.PREDICT_BULK_MAX_IMAGES}
+    yield summary
+
+
+def diagnosis_payload(diagnosis):
+    return {
+        "prediction": diagnosis.prediction,
+        "confidence": diagnosis.confidence,
+        "risk": diagnosis.risk,
+        "recommendations": diagnosis.recommendations,
+        # False for scans the cascade's student settled: they have no
+        # embedding, so diagnoses/<id>/similar/ cannot serve them.
+        "similar_available": diagnosis.embedding is not None,
+    }
@@ -0,0 +1,194 @@
+"""Daily diagnosis rollups for trend queries.
+
+Every new Diagnosis is folded into ``DiagnosisRollup`` rows keyed by
+(user, day, prediction), plus clinic-wide rows with no user, using atomic
+``F()`` increments. Trend reads then touch at most days x predictions rows
+instead of grouping the whole Diagnosis table. ``backfill_diagnosis_rollups``
+rebuilds the table from scratch.
+
+Every prediction in the clinic updates the same clinic-wide row for the
+day, so those increments run after the diagnosis transaction commits, each
+in its own short transaction, instead of holding that row's lock for the
+rest of the request. A crash between the commit and the increment loses it
+from the clinic totals until the next backfill.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Diagnosis, DiagnosisRollup
+
+# The high-risk flag needs at least this many recent high-risk results, and
+# a share of high-risk results this much above the previous period.
+TREND_MIN_HIGH_RISK = 3
+TREND_SHARE_MARGIN = 0.05
+
+
+def _groups(diagnoses):
+    groups = defaultdict(lambda: [0, 0.0, 0])
+    for diagnosis in diagnoses:
+        day = timezone.localdate(diagnosis.created_at)
+        for user_id in (diagnosis.user_id, None):
+            group = groups[user_id, day, diagnosis.prediction]
+            group[0] += 1
+            group[1] += diagnosis.confidence
+            group[2] += diagnosis.risk == "High"
+    return groups
+
+
+def _apply(groups):
+    # A fixed key order means two transactions updating overlapping groups
+    # lock the rows in the same order and cannot deadlock.
+    for (user_id, day, prediction), (count, confidence, high) in sorted(
+        groups.items(), key=lambda item: (str(item[0][0]), *item[0][1:])
+    ):
+        rows = DiagnosisRollup.objects.filter(
+            user_id=user_id, day=day, prediction=prediction
+        )
+        increments = {
+            "count": F("count") + count,
+            "confidence_sum": F("confidence_sum") + confidence,
+            "high_risk_count": F("high_risk_count") + high,
+        }
+        if rows.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                DiagnosisRollup.objects.create(
+                    user_id=user_id,
+                    day=day,
+                    prediction=prediction,
+                    count=count,
+                    confidence_sum=confidence,
+                    high_risk_count=high,
+                )
+        except IntegrityError:
+            # Another request created the row first.
+            rows.update(**increments)
+
+
+def record(diagnoses):
+    """Add saved ``diagnoses`` to their rollups: one UPDATE per (user, day,
+    prediction) group, and an INSERT the first time a group is seen. The
+    per-user rows are updated in the caller's transaction, the clinic-wide
+    ones once it commits."""
+    groups = _groups(diagnoses)
+    clinic = {key: totals for key, totals in groups.items() if key[0] is None}
+    _apply({key: totals for key, totals in groups.items() if key[0] is not None})
+    if clinic:
+        transaction.on_commit(lambda: _apply(clinic))
+
+
+def backfill(batch_size=5000):
+    """Rebuild every rollup from the Diagnosis table with one GROUP BY and
+    return the number of rows written. Diagnoses created while this runs
+    may be missed or counted twice, so run it when traffic is quiet."""
+    per_user = (
+        Diagnosis.objects.annotate(day=TruncDate("created_at"))
+        .values("user_id", "day", "prediction")
+        .annotate(
+            count=Count("id"),
+            confidence_sum=Sum("confidence"),
+            high_risk_count=Count("id", filter=Q(risk="High")),
+        )
+        .order_by()
+    )
+    clinic = defaultdict(lambda: [0, 0.0, 0])
+    rows = []
+    for group in per_user.iterator():
+        rows.append(DiagnosisRollup(**group))
+        totals = clinic[group["day"], group["prediction"]]
+        totals[0] += group["count"]
+        totals[1] += group["confidence_sum"]
+        totals[2] += group["high_risk_count"]
+    rows += [
+        DiagnosisRollup(
+            day=day,
+            prediction=prediction,
+            count=count,
+            confidence_sum=confidence,
+            high_risk_count=high,
+        )
+        for (day, prediction), (count, confidence, high) in clinic.items()
+    ]
+    with transaction.atomic():
+        DiagnosisRollup.objects.all().delete()
+        DiagnosisRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def _share(high, total):
+    return high / total if total else None
+
+
+def trend(user_id, days, end=None):
+    """Daily counts by prediction, mean confidence and a rising high-risk
+    flag over the ``days`` days ending ``end`` (default today), for one
+    user or clinic-wide when ``user_id`` is None.
+
+    The flag compares the share of high-risk results in the recent half of
+    the window with the earlier half.
+    """
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    dates = [start + timedelta(days=n) for n in range(days)]
+    series = {
+        day: {"total": 0, "counts": {}, "high_risk": 0, "confidence_sum": 0.0}
+        for day in dates
+    }
+    predictions = defaultdict(lambda: {"count": 0, "confidence_sum": 0.0})
+    rows = DiagnosisRollup.objects.filter(
+        user_id=user_id, day__range=(start, end)
+    ).values_list("day", "prediction", "count", "confidence_sum", "high_risk_count")
+    for day, prediction, count, confidence, high in rows:
+        point = series[day]
+        point["total"] += count
+        point["counts"][prediction] = count
+        point["high_risk"] += high
+        point["confidence_sum"] += confidence
+        predictions[prediction]["count"] += count
+        predictions[prediction]["confidence_sum"] += confidence
+
+    halves = [[0, 0], [0, 0]]
+    for n, point in enumerate(series.values()):
+        half = halves[n >= days - days // 2]
+        half[0] += point["high_risk"]
+        half[1] += point["total"]
+    previous, recent = (_share(*half) for half in halves)
+
+    return {
+        "start": start,
+        "end": end,
+        "days": [
+            {
+                "day": day,
+                "total": point["total"],
+                "counts": point["counts"],
+                "high_risk": point["high_risk"],
+                "mean_confidence": (
+                    point["confidence_sum"] / point["total"] if point["total"] else None
+                ),
+            }
+            for day, point in series.items()
+        ],
+        "predictions": {
+            prediction: {
+                "count": totals["count"],
+                "mean_confidence": totals["confidence_sum"] / totals["count"],
+            }
+            for prediction, totals in predictions.items()
+        },
+        "high_risk": {
+            "previous_share": previous,
+            "recent_share": recent,
+            "increasing": (
+                halves[1][0] >= TREND_MIN_HIGH_RISK
+                and recent > (previous or 0) + TREND_SHARE_MARGIN
+            ),
+        },
+    }
@@ -3,6 +3,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from .models import Appointment, Diagnosis, Doctor
+
 User = get_user_model()
 
 
@@ -69,3 +71,78 @@ class UserSerializer(serializers.ModelSerializer):
             "phone_no",
             "notification_preference",
         ]
+
+
+class DoctorSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Doctor
+        fields = [
+            "id",
+            "name",
+            "specialization",
+            "hospital",
+            "address",
+            "city",
+            "phone",
+            "email",
+            "latitude",
+            "longitude",
+            "working_hours",
+        ]
+
+
+class AppointmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Appointment
+        fields = [
+            "id",
+            "doctor",
+            "date",
+            "time_slot",
+            "status",
+            "hold_expires_at",
+            "created_at",
+        ]
+
+
+class BookingSerializer(serializers.Serializer):
+    """Input for a booking. Without ``time_slot`` the earliest free slot at
+    ``doctor`` is allocated, on ``date`` if given; with ``hold`` the slot is
+    only held."""
+
+    doctor = serializers.UUIDField()
+    date = serializers.DateField(required=False)
+    time_slot = serializers.TimeField(required=False)
+    hold = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if "time_slot" in attrs and "date" not in attrs:
+            raise serializers.ValidationError({"date": "Required with time_slot."})
+        return attrs
+
+
+class DiagnosisSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Diagnosis
+        fields = ["id", "prediction", "confidence", "risk", "created_at"]
+
+
+class PredictOptionsSerializer(serializers.Serializer):
+    """Optional /predict/ fields: test-time augmentation and its latency
+    budget in milliseconds (server defaults when omitted)."""
+
+    tta = serializers.BooleanField(required=False, default=None, allow_null=True)
+    budget_ms = serializers.IntegerField(required=False, min_value=1, max_value=10_000)
+
+
+class DiagnosisHistoryFilterSerializer(serializers.Serializer):
+    """Optional history filters; ``to`` is inclusive."""
+
+    prediction = serializers.CharField(required=False)
+    to = serializers.DateField(required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # "from" is a keyword, so it cannot be declared as a class attribute.
+        fields["from"] = serializers.DateField(required=False)
+        return fields
@@ -0,0 +1,60 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .availability import refresh_slot, reset_doctor
+from .geo import doctor_index
+from .models import Appointment, Diagnosis, Doctor
+from .similarity import embedding_index
+
+
+def _stored(instance, fields, update_fields):
+    """The saved values of ``fields`` for an existing row about to be
+    updated, or None for inserts and saves that do not touch them."""
+    if instance._state.adding or (
+        update_fields is not None and not set(fields) & set(update_fields)
+    ):
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver([post_save, post_delete], sender=Doctor)
+def invalidate_doctor_index(sender, **kwargs):
+    doctor_index.invalidate()
+
+
+@receiver(pre_save, sender=Doctor)
+def remember_working_hours(sender, instance, update_fields=None, **kwargs):
+    instance._stored_hours = _stored(instance, ["working_hours"], update_fields)
+
+
+@receiver(post_save, sender=Doctor)
+def reset_doctor_availability(sender, instance, **kwargs):
+    # Only a change of hours invalidates the bitmaps; new doctors have none.
+    stored = getattr(instance, "_stored_hours", None)
+    if stored is not None and stored != (instance.working_hours,):
+        reset_doctor(instance.pk)
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_slot(sender, instance, update_fields=None, **kwargs):
+    instance._stored_slot = _stored(
+        instance, ["doctor_id", "date", "time_slot"], update_fields
+    )
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def update_availability(sender, instance, **kwargs):
+    refresh_slot(instance.doctor_id, instance.date, instance.time_slot)
+    # A rescheduled appointment frees the slot it moved out of.
+    stored = getattr(instance, "_stored_slot", None)
+    if stored is not None and stored != (
+        instance.doctor_id,
+        instance.date,
+        instance.time_slot,
+    ):
+        refresh_slot(*stored)
+
+
+@receiver([post_save, post_delete], sender=Diagnosis)
+def invalidate_embedding_index(sender, instance, **kwargs):
+    embedding_index.invalidate(instance.user_id)
@@ -0,0 +1,131 @@
+"""Lesion tracking: find a user's earlier scans that look like a new one.
+
+Each Diagnosis stores the classifier's pooled embedding as float16 bytes.
+``EmbeddingIndex`` keeps one L2-normalized float32 matrix per recently used
+user and answers nearest-neighbour queries with an exact dot product, so
+history is compared without re-running the model on old photos. Per-user
+sets are small (hundreds to a few thousand scans), where exact search takes
+well under a millisecond and approximate structures (IVF/PQ) would only cost
+recall.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from operator import itemgetter
+
+import numpy as np
+from django.conf import settings
+
+from .models import Diagnosis
+
+EMBEDDING_DTYPE = np.float16
+
+
+def melanoma_probability(prediction, confidence):
+    """Model's melanoma probability from a stored (prediction, confidence %)
+    pair, so changes are comparable even when the predicted class flips."""
+    p = confidence / 100
+    return p if prediction == "Melanoma" else 1 - p
+
+
+class EmbeddingIndex:
+    """LRU of per-user embedding matrices.
+
+    A user's entry is rebuilt lazily after ``invalidate(user_id)`` (wired to
+    Diagnosis saves in this process), or once it is older than
+    ``SIMILARITY_INDEX_TTL`` seconds, which bounds staleness for rows written
+    by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def _build(self, user_id):
+        rows = list(
+            Diagnosis.objects.filter(user_id=user_id, embedding__isnull=False)
+            .order_by("created_at")
+            .values_list("id", "created_at", "prediction", "confidence", "embedding")
+        )
+        vectors = np.array(
+            [np.frombuffer(row[4], dtype=EMBEDDING_DTYPE) for row in rows],
+            dtype=np.float32,
+        )
+        if len(rows):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, np.finfo(np.float32).tiny)
+        return [row[:4] for row in rows], vectors
+
+    def entry(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] <= (
+                settings.SIMILARITY_INDEX_TTL
+            ):
+                self._entries.move_to_end(user_id)
+                return entry[1], entry[2]
+        rows, vectors = self._build(user_id)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic(), rows, vectors)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.SIMILARITY_INDEX_MAX_USERS:
+                self._entries.popitem(last=False)
+        return rows, vectors
+
+    def nearest(self, user_id, embedding, k, before=None, exclude=None):
+        """``[(similarity, (id, created_at, prediction, confidence))]`` for
+        the user's ``k`` most similar scans by cosine similarity, optionally
+        only those created before ``before`` and never ``exclude``."""
+        rows, vectors = self.entry(user_id)
+        if not rows:
+            return []
+        query = np.frombuffer(embedding, dtype=EMBEDDING_DTYPE).astype(np.float32)
+        query /= max(np.linalg.norm(query), np.finfo(np.float32).tiny)
+        scores = vectors @ query
+        # Rows are sorted by created_at, so "before" is a prefix.
+        if before is not None:
+            scores = scores[: bisect_left(rows, before, key=itemgetter(1))]
+        candidates = [
+            i
+            for i in np.argsort(-scores, kind="stable")[: k + 1]
+            if rows[i][0] != exclude
+        ]
+        return [(float(scores[i]), rows[i]) for i in candidates[:k]]
+
+
+embedding_index = EmbeddingIndex()
+
+
+def similar_diagnoses(diagnosis, k=5):
+    """The user's ``k`` earlier scans most similar to ``diagnosis``, each
+    with its similarity, whether it likely shows the same lesion, and how
+    the melanoma probability changed since."""
+    current = melanoma_probability(diagnosis.prediction, diagnosis.confidence)
+    matches = embedding_index.nearest(
+        diagnosis.user_id,
+        diagnosis.embedding,
+        k,
+        before=diagnosis.created_at,
+        exclude=diagnosis.id,
+    )
+    return [
+        {
+            "id": pk,
+            "created_at": created_at,
+            "prediction": prediction,
+            "confidence": confidence,
+            "similarity": round(similarity, 4),
+            "same_lesion": similarity >= settings.LESION_MATCH_MIN_SIMILARITY,
+            "confidence_change": round(diagnosis.confidence - confidence, 2),
+            "melanoma_probability_change": round(
+                current - melanoma_probability(prediction, confidence), 4
+            ),
+        }
+        for similarity, (pk, created_at, prediction, confidence) in matches
+    ]
@@ -0,0 +1,17 @@
+from itertools import count
+
+from django.contrib.auth import get_user_model
+
+_phone_numbers = count(5550100)
+
+
+def make_user(name="user", **fields):
+    """A user with a unique email and phone number."""
+    return get_user_model().objects.create_user(
+        username=name,
+        email=f"{name}@example.com",
+        password="password",
+        full_name=name.title(),
+        phone_no=f"+1415{next(_phone_numbers)}",
+        **fields,
+    )
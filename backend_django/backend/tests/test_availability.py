@@ -0,0 +1,111 @@
+import datetime
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from backend.availability import (
+    WEEKDAYS,
+    decode,
+    encode,
+    iter_bits,
+    next_free_slots,
+    opening_mask,
+    parse_working_hours,
+)
+from backend.geo import doctor_index
+from backend.models import Appointment, Doctor
+
+from . import make_user
+
+# Fifteen-minute slots: 96 a day.
+LAST = 95
+
+
+class BitmapTests(SimpleTestCase):
+    def test_encode_decode_round_trip(self):
+        for mask in [0, 1, 1 << LAST, (1 << (LAST + 1)) - 1, 0b1011 << 36]:
+            with self.subTest(mask=bin(mask)):
+                data = encode(mask)
+                self.assertEqual(len(data), 12)
+                self.assertEqual(decode(data), mask)
+                # Postgres returns BinaryField values as memoryview.
+                self.assertEqual(decode(memoryview(data)), mask)
+
+    def test_iter_bits_walks_set_bits_in_order(self):
+        self.assertEqual(list(iter_bits(0b1011 << 36 | 1 << LAST)), [36, 37, 39, LAST])
+
+    def test_opening_mask_keeps_whole_slots_only(self):
+        hours = parse_working_hours(
+            {"Monday": ["09:10-10:00", "23:00-24:00"], "tue": [["09:00", "09:20"]]}
+        )
+        self.assertEqual(
+            list(iter_bits(opening_mask(hours, 0))), [37, 38, 39, 92, 93, 94, 95]
+        )
+        self.assertEqual(list(iter_bits(opening_mask(hours, 1))), [36])
+        self.assertEqual(opening_mask(hours, 2), 0)
+
+
+class NextFreeSlotsTests(TestCase):
+    def setUp(self):
+        doctor_index.invalidate()
+        # 23:40, so only the last slot of today has not started.
+        self.now = timezone.localtime().replace(
+            hour=23, minute=40, second=0, microsecond=0
+        )
+        self.today = self.now.date()
+        self.tomorrow = self.today + datetime.timedelta(days=1)
+        hours = {day: ["00:00-00:30", "23:00-24:00"] for day in WEEKDAYS}
+        self.near = self.doctor("Dr Near", 19.070, hours)
+        self.far = self.doctor("Dr Far", 19.080, hours)
+
+    def doctor(self, name, latitude, hours):
+        return Doctor.objects.create(
+            name=name,
+            specialization="Dermatologist",
+            hospital="City Hospital",
+            address=f"{name} Street",
+            latitude=latitude,
+            longitude=72.87,
+            working_hours=hours,
+        )
+
+    def slots(self, count):
+        return [
+            (date, time, pk)
+            for date, time, _, pk in next_free_slots(
+                19.07, 72.87, 10, count, after=self.now
+            )
+        ]
+
+    def test_slots_run_across_midnight_in_time_then_distance_order(self):
+        self.assertEqual(
+            self.slots(5),
+            [
+                (self.today, datetime.time(23, 45), self.near.pk),
+                (self.today, datetime.time(23, 45), self.far.pk),
+                (self.tomorrow, datetime.time(0, 0), self.near.pk),
+                (self.tomorrow, datetime.time(0, 0), self.far.pk),
+                (self.tomorrow, datetime.time(0, 15), self.near.pk),
+            ],
+        )
+
+    def test_booked_slot_after_midnight_is_skipped(self):
+        Appointment.objects.create(
+            user=make_user(),
+            doctor=self.near,
+            date=self.tomorrow,
+            time_slot=datetime.time(0, 0),
+        )
+        self.assertEqual(
+            self.slots(4)[2:],
+            [
+                (self.tomorrow, datetime.time(0, 0), self.far.pk),
+                (self.tomorrow, datetime.time(0, 15), self.near.pk),
+            ],
+        )
+
+    def test_started_slots_are_not_offered(self):
+        self.now = self.now.replace(hour=23, minute=45)
+        self.assertEqual(
+            self.slots(1), [(self.tomorrow, datetime.time(0, 0), self.near.pk)]
+        )
@@ -0,0 +1,74 @@
+import threading
+
+import torch
+from django.test import SimpleTestCase
+
+from backend.ml.batching import BatchScheduler
+
+
+class GatedModel:
+    """Doubles its input and returns per-row sums as a second output. The
+    first forward pass waits for ``release`` so tests can queue requests up
+    behind it."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.batches = []
+
+    def __call__(self, inputs):
+        self.started.set()
+        self.release.wait(timeout=5)
+        self.batches.append(inputs.shape[0])
+        return inputs * 2, inputs.flatten(1).sum(1)
+
+
+def rows(n, value):
+    return torch.full((n, 1, 2, 2), float(value))
+
+
+class BatchSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.model = GatedModel()
+        self.scheduler = BatchScheduler(self.model, max_batch_size=4, max_wait_ms=50)
+
+    def queue_behind_gate(self, *tensors):
+        gate = self.scheduler.submit(rows(1, 0))
+        self.assertTrue(self.model.started.wait(timeout=5))
+        futures = [self.scheduler.submit(tensor) for tensor in tensors]
+        self.model.release.set()
+        gate.result(timeout=5)
+        return futures
+
+    def test_item_that_does_not_fit_carries_over_to_the_next_batch(self):
+        tensors = [rows(2, 1), rows(3, 2), rows(1, 3)]
+        futures = self.queue_behind_gate(*tensors)
+        for future in futures:
+            future.result(timeout=5)
+        # 2 + 3 rows would overflow, so the 3 rows start the next batch.
+        self.assertEqual(self.model.batches, [1, 2, 4])
+
+    def test_oversized_item_runs_alone(self):
+        futures = self.queue_behind_gate(rows(1, 1), rows(6, 2), rows(1, 3))
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(self.model.batches, [1, 1, 6, 1])
+
+    def test_each_caller_gets_its_own_rows(self):
+        tensors = [rows(1, 1), rows(2, 2), rows(1, 3)]
+        futures = self.queue_behind_gate(*tensors)
+        for tensor, future in zip(tensors, futures):
+            doubled, sums = future.result(timeout=5)
+            self.assertTrue(torch.equal(doubled, tensor * 2))
+            self.assertTrue(torch.equal(sums, tensor.flatten(1).sum(1)))
+        self.assertEqual(self.model.batches, [1, 4])
+
+    def test_model_errors_reach_every_caller_in_the_batch(self):
+        def broken(inputs):
+            raise RuntimeError("boom")
+
+        self.scheduler.model = broken
+        futures = [self.scheduler.submit(rows(1, n)) for n in range(3)]
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, "boom"):
+                future.result(timeout=5)
@@ -0,0 +1,412 @@
+import datetime
+import threading
+import uuid
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend import booking
+from backend.availability import WEEKDAYS, decode, slot_index
+from backend.models import Appointment, Doctor, DoctorAvailability
+
+from . import make_user
+
+
+def make_doctor(name="Dr A", hours="09:00-12:00"):
+    return Doctor.objects.create(
+        name=name,
+        specialization="Dermatologist",
+        hospital="City Hospital",
+        address=f"{name} Street",
+        latitude=19.07,
+        longitude=72.87,
+        working_hours={day: hours for day in WEEKDAYS},
+    )
+
+
+class BookingTestCase(TestCase):
+    def setUp(self):
+        # Noon, so today's morning slots have started and afternoon ones
+        # have not.
+        self.now = timezone.localtime().replace(
+            hour=12, minute=0, second=0, microsecond=0
+        )
+        patcher = mock.patch("django.utils.timezone.now", return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = make_user()
+        self.doctor = make_doctor()
+        self.tomorrow = self.now.date() + datetime.timedelta(days=1)
+
+    def free(self, doctor, date, time):
+        row = DoctorAvailability.objects.get(doctor=doctor, date=date)
+        return bool(decode(row.free_slots) >> slot_index(time) & 1)
+
+
+class ReserveTests(BookingTestCase):
+    def test_books_slot_and_clears_its_bit(self):
+        slot = datetime.time(9, 15)
+        appointment, created = booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, slot
+        )
+        self.assertTrue(created)
+        self.assertEqual(appointment.status, "booked")
+        self.assertFalse(self.free(self.doctor, self.tomorrow, slot))
+
+    def test_taken_slot_is_unavailable(self):
+        slot = datetime.time(9, 15)
+        booking.reserve(self.user, self.doctor.pk, self.tomorrow, slot)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.reserve(make_user("other"), self.doctor.pk, self.tomorrow, slot)
+
+    def test_started_slot_is_unavailable(self):
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.reserve(
+                self.user, self.doctor.pk, self.now.date(), datetime.time(9, 0)
+            )
+
+    def test_off_grid_slot_is_rejected(self):
+        with self.assertRaises(ValueError):
+            booking.reserve(
+                self.user, self.doctor.pk, self.tomorrow, datetime.time(9, 5)
+            )
+
+    def test_unknown_doctor(self):
+        with self.assertRaises(Doctor.DoesNotExist):
+            booking.reserve(self.user, uuid.uuid4(), self.tomorrow, datetime.time(9, 0))
+
+    def test_idempotency_key_replays_the_first_appointment(self):
+        slot = datetime.time(10, 0)
+        first, created = booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, slot, idempotency_key="k1"
+        )
+        again, replayed = booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, slot, idempotency_key="k1"
+        )
+        self.assertTrue(created)
+        self.assertFalse(replayed)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_retry_that_waited_for_the_lock_replays(self):
+        # The first attempt commits after the retry's initial key check but
+        # before the retry gets the day's lock.
+        slot = datetime.time(10, 0)
+        first, _ = booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, slot, idempotency_key="k1"
+        )
+        real_replay = booking._replay
+        calls = []
+
+        def replay(user, key, fingerprint):
+            calls.append(key)
+            return None if len(calls) == 1 else real_replay(user, key, fingerprint)
+
+        with mock.patch.object(booking, "_replay", side_effect=replay):
+            again, created = booking.reserve(
+                self.user, self.doctor.pk, self.tomorrow, slot, idempotency_key="k1"
+            )
+        self.assertFalse(created)
+        self.assertEqual(again.pk, first.pk)
+
+    def test_reused_key_for_another_slot_is_a_conflict(self):
+        booking.reserve(
+            self.user,
+            self.doctor.pk,
+            self.tomorrow,
+            datetime.time(10, 0),
+            idempotency_key="k1",
+        )
+        with self.assertRaises(booking.IdempotencyConflict):
+            booking.reserve(
+                self.user,
+                self.doctor.pk,
+                self.tomorrow,
+                datetime.time(10, 15),
+                idempotency_key="k1",
+            )
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_same_key_for_another_user_is_independent(self):
+        slot = datetime.time(10, 0)
+        booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, slot, idempotency_key="k1"
+        )
+        _, created = booking.reserve(
+            make_user("other"),
+            self.doctor.pk,
+            self.tomorrow,
+            datetime.time(10, 15),
+            idempotency_key="k1",
+        )
+        self.assertTrue(created)
+
+    def test_cancel_frees_the_slot(self):
+        slot = datetime.time(11, 0)
+        appointment, _ = booking.reserve(self.user, self.doctor.pk, self.tomorrow, slot)
+        booking.cancel(self.user, appointment.pk)
+        self.assertTrue(self.free(self.doctor, self.tomorrow, slot))
+
+    def test_hold_then_confirm(self):
+        held, _ = booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, datetime.time(9, 0), hold=True
+        )
+        self.assertEqual(held.status, "held")
+        self.assertEqual(booking.confirm(self.user, held.pk).status, "booked")
+
+    def test_released_hold_cannot_be_confirmed(self):
+        held, _ = booking.reserve(
+            self.user, self.doctor.pk, self.tomorrow, datetime.time(9, 0), hold=True
+        )
+        Appointment.objects.filter(pk=held.pk).update(hold_expires_at=self.now)
+        self.assertEqual(booking.release_expired_holds(), 1)
+        with self.assertRaises(booking.HoldExpired):
+            booking.confirm(self.user, held.pk)
+
+
+class AllocateTests(BookingTestCase):
+    def test_takes_the_earliest_future_slot(self):
+        doctor = make_doctor("Dr B", hours="09:00-18:00")
+        appointment, created = booking.allocate(self.user, [doctor.pk])
+        self.assertTrue(created)
+        self.assertEqual(appointment.date, self.now.date())
+        self.assertEqual(appointment.time_slot, datetime.time(12, 15))
+
+    def test_pages_past_days_whose_slots_have_started(self):
+        # More doctors than one page of candidates, all with only past free
+        # slots today.
+        doctors = [
+            make_doctor(f"Dr {n}", hours="00:00-00:30")
+            for n in range(booking.ALLOCATE_CANDIDATES + 2)
+        ]
+        appointment, _ = booking.allocate(self.user, [d.pk for d in doctors])
+        self.assertEqual(appointment.date, self.tomorrow)
+        self.assertEqual(appointment.time_slot, datetime.time(0, 0))
+
+    def test_no_free_slots(self):
+        doctor = make_doctor("Dr C", hours=[])
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.allocate(self.user, [doctor.pk])
+
+    def test_doctor_without_working_hours_has_no_slots(self):
+        # e.g. rows loaded by import_doctors
+        doctor = make_doctor("Dr D")
+        Doctor.objects.filter(pk=doctor.pk).update(working_hours={})
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.allocate(self.user, [doctor.pk])
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.reserve(self.user, doctor.pk, self.tomorrow, datetime.time(10))
+
+    def test_unknown_doctor(self):
+        with self.assertRaises(Doctor.DoesNotExist):
+            booking.allocate(self.user, [uuid.uuid4()])
+
+    def test_retries_when_open_days_are_locked(self):
+        # The first attempt finds every open day locked by someone else.
+        real = booking._lock_open_day
+        calls = []
+
+        def lock_open_day(*args):
+            calls.append(args[-1])
+            return (None, None, 0) if len(calls) == 1 else real(*args)
+
+        with mock.patch.object(booking, "_lock_open_day", side_effect=lock_open_day):
+            appointment, created = booking.allocate(self.user, [self.doctor.pk])
+        self.assertTrue(created)
+        self.assertEqual(calls, [True, True])
+
+    def test_last_attempt_waits_for_locks(self):
+        calls = []
+
+        def lock_open_day(*args):
+            calls.append(args[-1])
+            return None, None, 0
+
+        with mock.patch.object(booking, "_lock_open_day", side_effect=lock_open_day):
+            with self.assertRaises(booking.SlotUnavailable):
+                booking.allocate(self.user, [self.doctor.pk], attempts=3)
+        self.assertEqual(calls, [True, True, False])
+
+    def test_releases_expired_holds_before_scanning(self):
+        # The doctor's only slot is held, and the hold has expired but the
+        # release command has not run yet.
+        doctor = make_doctor("Dr E", hours="13:00-13:15")
+        held, _ = booking.reserve(
+            make_user("other"),
+            doctor.pk,
+            self.now.date(),
+            datetime.time(13, 0),
+            hold=True,
+        )
+        Appointment.objects.filter(pk=held.pk).update(hold_expires_at=self.now)
+        appointment, created = booking.allocate(self.user, [doctor.pk])
+        self.assertTrue(created)
+        self.assertEqual(
+            (appointment.date, appointment.time_slot),
+            (self.now.date(), datetime.time(13, 0)),
+        )
+        held.refresh_from_db()
+        self.assertEqual(held.status, "cancelled")
+
+    def test_date_limits_the_search_to_that_day(self):
+        later = self.now.date() + datetime.timedelta(days=3)
+        appointment, _ = booking.allocate(self.user, [self.doctor.pk], date=later)
+        self.assertEqual(
+            (appointment.date, appointment.time_slot), (later, datetime.time(9, 0))
+        )
+
+    def test_date_outside_the_horizon(self):
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.allocate(
+                self.user,
+                [self.doctor.pk],
+                date=self.now.date() - datetime.timedelta(days=1),
+            )
+
+    def test_reused_key_for_another_request_is_a_conflict(self):
+        other = make_doctor("Dr F")
+        booking.allocate(self.user, [self.doctor.pk], idempotency_key="k")
+        for kwargs in ({"doctor_ids": [other.pk]}, {"hold": True}):
+            kwargs = {"doctor_ids": [self.doctor.pk], **kwargs}
+            with self.assertRaises(booking.IdempotencyConflict):
+                booking.allocate(self.user, idempotency_key="k", **kwargs)
+
+    def test_idempotency_key_replays(self):
+        first, _ = booking.allocate(self.user, [self.doctor.pk], idempotency_key="k")
+        again, created = booking.allocate(
+            self.user, [self.doctor.pk], idempotency_key="k"
+        )
+        self.assertFalse(created)
+        self.assertEqual(again.pk, first.pk)
+
+
+class AppointmentApiTests(BookingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, body, **headers):
+        return self.client.post("/api/appointments/", body, format="json", **headers)
+
+    def test_replayed_key_returns_200_with_the_same_appointment(self):
+        body = {
+            "doctor": str(self.doctor.pk),
+            "date": str(self.tomorrow),
+            "time_slot": "09:00",
+        }
+        first = self.post(body, HTTP_IDEMPOTENCY_KEY="abc")
+        again = self.post(body, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()["id"], first.json()["id"])
+
+    def test_reused_key_with_another_body_is_422(self):
+        body = {
+            "doctor": str(self.doctor.pk),
+            "date": str(self.tomorrow),
+            "time_slot": "09:00",
+        }
+        self.post(body, HTTP_IDEMPOTENCY_KEY="abc")
+        body["time_slot"] = "09:15"
+        response = self.post(body, HTTP_IDEMPOTENCY_KEY="abc")
+        self.assertEqual(response.status_code, 422)
+
+    def test_date_without_time_slot_allocates_on_that_date(self):
+        later = self.now.date() + datetime.timedelta(days=2)
+        response = self.post({"doctor": str(self.doctor.pk), "date": str(later)})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["date"], str(later))
+
+    def test_taken_slot_is_409(self):
+        body = {
+            "doctor": str(self.doctor.pk),
+            "date": str(self.tomorrow),
+            "time_slot": "09:00",
+        }
+        self.post(body)
+        self.assertEqual(self.post(body).status_code, 409)
+
+    def test_unknown_doctor_is_404(self):
+        response = self.post({"doctor": str(uuid.uuid4())})
+        self.assertEqual(response.status_code, 404)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class ConcurrentBookingTests(TransactionTestCase):
+    """Real races; needs row locks, so skipped on SQLite."""
+
+    def race(self, target, count=8):
+        barrier = threading.Barrier(count)
+        results = []
+
+        def run():
+            try:
+                barrier.wait()
+                results.append(target())
+            except Exception as exc:
+                results.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_one_booking_per_slot(self):
+        doctor = make_doctor()
+        date = timezone.localdate() + datetime.timedelta(days=1)
+        users = [make_user(f"user{n}") for n in range(8)]
+        it = iter(users)
+        lock = threading.Lock()
+
+        def book():
+            with lock:
+                user = next(it)
+            return booking.reserve(user, doctor.pk, date, datetime.time(9, 0))
+
+        results = self.race(book)
+        booked = [r for r in results if isinstance(r, tuple)]
+        self.assertEqual(len(booked), 1)
+        self.assertTrue(
+            all(
+                isinstance(r, booking.SlotUnavailable)
+                for r in results
+                if not isinstance(r, tuple)
+            )
+        )
+
+    def test_concurrent_retries_share_one_appointment(self):
+        doctor = make_doctor()
+        user = make_user()
+        date = timezone.localdate() + datetime.timedelta(days=1)
+        results = self.race(
+            lambda: booking.reserve(
+                user, doctor.pk, date, datetime.time(9, 0), idempotency_key="k"
+            )
+        )
+        self.assertTrue(all(isinstance(r, tuple) for r in results), results)
+        self.assertEqual(len({appointment.pk for appointment, _ in results}), 1)
+        self.assertEqual(sum(created for _, created in results), 1)
+
+    def test_allocate_spreads_over_slots(self):
+        doctor = make_doctor(hours="00:00-23:45")
+        users = [make_user(f"user{n}") for n in range(8)]
+        it = iter(users)
+        lock = threading.Lock()
+
+        def allocate():
+            with lock:
+                user = next(it)
+            return booking.allocate(user, [doctor.pk])
+
+        results = self.race(allocate)
+        self.assertTrue(all(isinstance(r, tuple) for r in results), results)
+        slots = {(a.date, a.time_slot) for a, _ in results}
+        self.assertEqual(len(slots), 8)
@@ -0,0 +1,162 @@
+import io
+import zipfile
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from backend import predictions
+from backend.ml.cache import PredictionCache
+from backend.models import Diagnosis
+
+from . import make_user
+
+COLORS = ["red", "green", "blue", "white"]
+
+
+def png(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def archive(members, name="scans.zip"):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for member, data in members.items():
+            zf.writestr(member, data)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def scored(model, images, **kwargs):
+    return [
+        {
+            "prediction": "Benign",
+            "confidence": 0.9,
+            "risk": "Low",
+            "recommendations": ["Monitor"],
+        }
+        for _ in images
+    ]
+
+
+class IterUploadsTests(TestCase):
+    def test_plain_files_and_zip_images(self):
+        upload = archive(
+            {
+                "a.png": png(),
+                "notes.txt": b"not an image",
+                "__MACOSX/._a.png": b"resource fork",
+                "dir/b.JPG": png("blue"),
+            }
+        )
+        plain = SimpleUploadedFile("c.png", png("green"))
+        uploads = [
+            (name, read()) for name, read in predictions.iter_uploads([upload, plain])
+        ]
+        self.assertEqual([name for name, _ in uploads], ["a.png", "dir/b.JPG", "c.png"])
+        self.assertEqual(uploads[0][1], png())
+        self.assertEqual(uploads[2][1], png("green"))
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1000)
+    def test_member_inflating_past_the_limit_is_not_extracted(self):
+        # Compresses to a few bytes but inflates past the limit.
+        upload = archive({"bomb.png": b"\0" * 100_000, "ok.png": b"x" * 10})
+        uploads = predictions.iter_uploads([upload])
+        _, bomb = next(uploads)
+        with mock.patch.object(zipfile.ZipFile, "read") as read:
+            with self.assertRaisesMessage(ValueError, "File is too large"):
+                bomb()
+        read.assert_not_called()
+        _, ok = next(uploads)
+        self.assertEqual(ok(), b"x" * 10)
+
+    def test_members_are_only_read_on_demand(self):
+        upload = archive({f"{n}.png": png(COLORS[n]) for n in range(3)})
+        with mock.patch.object(zipfile.ZipFile, "read") as read:
+            names = [name for name, _ in predictions.iter_uploads([upload])]
+        self.assertEqual(names, ["0.png", "1.png", "2.png"])
+        read.assert_not_called()
+
+
+@override_settings(PREDICT_BATCH_MAX_SIZE=2, PREDICT_BULK_MAX_IMAGES=10)
+class PredictBulkTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        patchers = [
+            mock.patch.object(predictions, "PREDICTION_CACHE", PredictionCache(str)),
+            mock.patch("backend.ml.detection_model.predict_batch", side_effect=scored),
+        ]
+        self.predict_batch = patchers[1].start()
+        patchers[0].start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def run_bulk(self, *files):
+        return list(
+            predictions.predict_bulk(self.user, predictions.iter_uploads(files))
+        )
+
+    def test_scores_every_image_in_batches(self):
+        lines = self.run_bulk(archive({f"{n}.png": png(COLORS[n]) for n in range(3)}))
+        self.assertEqual(self.predict_batch.call_count, 2)
+        self.assertEqual(lines[-1], {"done": True, "count": 3})
+        ids = {line["id"] for line in lines[:-1]}
+        self.assertEqual(ids, set(Diagnosis.objects.values_list("id", flat=True)))
+        self.assertEqual(lines[0]["file"], "0.png")
+        self.assertEqual(lines[0]["recommendations"], "Monitor")
+
+    def test_unreadable_images_get_error_lines(self):
+        lines = self.run_bulk(
+            SimpleUploadedFile("bad.png", b"not a png"),
+            SimpleUploadedFile("good.png", png()),
+        )
+        self.assertEqual(lines[0]["file"], "bad.png")
+        self.assertIn("error", lines[0])
+        self.assertEqual(lines[1]["file"], "good.png")
+        self.assertEqual(lines[-1], {"done": True, "count": 1})
+
+    def test_failed_forward_pass_reports_errors_and_continues(self):
+        calls = []
+
+        def fail_first(model, images, **kwargs):
+            calls.append(len(images))
+            if len(calls) == 1:
+                raise RuntimeError("CUDA out of memory")
+            return scored(model, images)
+
+        self.predict_batch.side_effect = fail_first
+        with self.assertLogs("backend.predictions", "ERROR"):
+            lines = self.run_bulk(
+                archive({f"{n}.png": png(COLORS[n]) for n in range(3)})
+            )
+        self.assertEqual(
+            lines[:2],
+            [
+                {"file": "0.png", "error": "Prediction failed"},
+                {"file": "1.png", "error": "Prediction failed"},
+            ],
+        )
+        self.assertEqual(lines[2]["file"], "2.png")
+        self.assertEqual(lines[-1], {"done": True, "count": 1})
+        self.assertEqual(Diagnosis.objects.count(), 1)
+
+    @override_settings(PREDICT_BULK_MAX_IMAGES=2)
+    def test_cap_truncates_without_reading_past_it(self):
+        upload = archive({f"{n}.png": png(COLORS[n]) for n in range(4)})
+        with mock.patch.object(
+            zipfile.ZipFile, "read", autospec=True, side_effect=zipfile.ZipFile.read
+        ) as read:
+            lines = self.run_bulk(upload)
+        self.assertEqual(read.call_count, 2)
+        self.assertEqual(
+            lines[-1],
+            {"done": True, "count": 2, "truncated": True, "max_images": 2},
+        )
+
+    def test_cached_images_skip_the_model(self):
+        self.run_bulk(SimpleUploadedFile("a.png", png()))
+        lines = self.run_bulk(SimpleUploadedFile("again.png", png()))
+        self.assertEqual(self.predict_batch.call_count, 1)
+        self.assertEqual(lines[-1], {"done": True, "count": 1})
@@ -0,0 +1,78 @@
+import torch
+from django.test import SimpleTestCase
+
+from backend.ml.batching import BatchScheduler
+from backend.ml.detection_model import CascadeModel
+
+
+class Student:
+    """Each input row holds the melanoma probability to report for it."""
+
+    def __call__(self, x):
+        melanoma = torch.logit(x[:, 0].double()).float()
+        return torch.stack([torch.zeros_like(melanoma), melanoma], dim=1)
+
+
+class Teacher:
+    def __init__(self):
+        self.inputs = []
+
+    def forward_with_embedding(self, x):
+        self.inputs.append(x.clone())
+        logits = torch.tensor([[-5.0, 5.0]]).repeat(len(x), 1)
+        return logits, x.repeat(1, 3) + 1
+
+
+def views(*probabilities):
+    return torch.tensor(probabilities).reshape(-1, 1)
+
+
+class CascadeModelTests(SimpleTestCase):
+    def setUp(self):
+        self.teacher = Teacher()
+        self.cascade = CascadeModel(Student(), self.teacher, escalate_above=0.5)
+        # Three images: two views, three views and one view.
+        self.x = views(0.9, 0.2, 0.6, 0.1, 0.1, 0.5)
+
+    def test_groups_escalate_whole_images_on_the_mean(self):
+        logits, embeddings, escalated = self.cascade.forward_with_embedding(
+            self.x, groups=[2, 3, 1]
+        )
+        # Means 0.55, 0.27 and 0.5: the second image stays with the student
+        # even though one of its views is above the cutoff.
+        expected = torch.tensor([True, True, False, False, False, True])
+        self.assertTrue(torch.equal(escalated, expected))
+        self.assertTrue(torch.equal(self.teacher.inputs[0], self.x[expected]))
+        self.assertTrue(torch.equal(logits[expected], torch.tensor([[-5.0, 5.0]] * 3)))
+        self.assertTrue(
+            torch.allclose(
+                torch.softmax(logits[~expected], dim=1)[:, 1], self.x[~expected, 0]
+            )
+        )
+        self.assertTrue(torch.equal(embeddings[~expected], torch.zeros(3, 3)))
+        self.assertTrue(
+            torch.equal(embeddings[expected], self.x[expected].repeat(1, 3) + 1)
+        )
+        self.assertEqual((self.cascade.scored, self.cascade.escalated), (3, 2))
+
+    def test_without_groups_each_row_is_an_image(self):
+        _, _, escalated = self.cascade.forward_with_embedding(self.x)
+        self.assertEqual(escalated.tolist(), [True, False, True, False, False, True])
+        self.assertEqual((self.cascade.scored, self.cascade.escalated), (6, 3))
+
+    def test_settled_batch_skips_the_teacher(self):
+        logits, embeddings, escalated = self.cascade.forward_with_embedding(
+            views(0.1, 0.2), groups=[2]
+        )
+        self.assertEqual(self.teacher.inputs, [])
+        self.assertIsNone(embeddings)
+        self.assertFalse(escalated.any())
+
+    def test_grouped_scheduler_passes_each_submission_as_a_group(self):
+        scheduler = BatchScheduler(
+            self.cascade.forward_with_embedding, max_wait_ms=50, grouped=True
+        )
+        first = scheduler.submit(views(0.9, 0.2))
+        second = scheduler.submit(views(0.6, 0.1, 0.1))
+        self.assertEqual(first.result(timeout=5)[2].tolist(), [True, True])
+        self.assertEqual(second.result(timeout=5)[2].tolist(), [False, False, False])
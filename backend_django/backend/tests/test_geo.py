@@ -0,0 +1,75 @@
+import random
+
+from django.test import TestCase
+
+from backend.geo import doctor_index, nearby_doctors, nearby_doctors_db
+from backend.models import Doctor
+
+# Query points: a dense city, both sides of the antimeridian and near a pole.
+POINTS = [(19.07, 72.87), (-16.5, 179.9), (-16.5, -179.9), (88.9, 10.0)]
+
+
+class DoctorIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        doctors = []
+        for n in range(400):
+            lat, lon = POINTS[n % len(POINTS)]
+            doctors.append(
+                Doctor(
+                    name=f"Dr {n}",
+                    specialization="Dermatologist",
+                    hospital="Hospital",
+                    address=f"{n} Main Street",
+                    latitude=lat + rng.uniform(-1, 1),
+                    longitude=(lon + rng.uniform(-2, 2) + 180) % 360 - 180,
+                )
+            )
+        Doctor.objects.bulk_create(doctors)
+
+    def setUp(self):
+        doctor_index.invalidate()
+
+    def assertSameResults(self, index_results, db_results):
+        self.assertEqual(
+            [doctor.pk for _, doctor in index_results],
+            [doctor.pk for _, doctor in db_results],
+        )
+        for (a, _), (b, _) in zip(index_results, db_results):
+            self.assertAlmostEqual(a, b, places=6)
+
+    def test_index_matches_the_database_query(self):
+        for lat, lon in POINTS:
+            for radius, limit in [(5, 3), (50, 10), (150, 500)]:
+                with self.subTest(lat=lat, lon=lon, radius=radius, limit=limit):
+                    results = nearby_doctors(lat, lon, radius, limit)
+                    self.assertSameResults(
+                        results, nearby_doctors_db(lat, lon, radius, limit)
+                    )
+                    self.assertLessEqual(len(results), limit)
+
+    def test_results_span_the_antimeridian(self):
+        lons = [
+            doctor.longitude for _, doctor in nearby_doctors(-16.5, 179.9, 150, 500)
+        ]
+        self.assertTrue(any(lon > 0 for lon in lons))
+        self.assertTrue(any(lon < 0 for lon in lons))
+
+    def test_nearest_many_matches_nearest(self):
+        self.assertEqual(
+            doctor_index.nearest_many(POINTS, 100, 10),
+            [doctor_index.nearest(lat, lon, 100, 10) for lat, lon in POINTS],
+        )
+
+    def test_invalidate_picks_up_new_doctors(self):
+        self.assertEqual(nearby_doctors(0, 0, 10, 5), [])
+        doctor = Doctor.objects.create(
+            name="Dr Equator",
+            specialization="Dermatologist",
+            hospital="Hospital",
+            address="Null Island",
+            latitude=0.01,
+            longitude=0.01,
+        )
+        self.assertEqual([d.pk for _, d in nearby_doctors(0, 0, 10, 5)], [doctor.pk])
@@ -0,0 +1,130 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from backend.hospitals import CircuitBreaker, HospitalClient, HospitalProvider
+
+
+class FakeProvider(HospitalProvider):
+    """Returns ``results`` (or raises ``error``) after ``release`` is set."""
+
+    def __init__(self, results=None):
+        self.results = results if results is not None else [{"name": "City"}]
+        self.error = None
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def search(self, lat, lon, radius):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return self.results
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = 100.0
+        patcher = mock.patch("backend.hospitals.time.monotonic", lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(threshold=2, cooldown=30)
+
+    def test_opens_after_threshold_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_trial_through_per_cooldown(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock += 30
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        # The trial failed: closed again only after another cooldown.
+        self.breaker.record_failure()
+        self.clock += 29
+        self.assertFalse(self.breaker.allow())
+        self.clock += 1
+        self.assertTrue(self.breaker.allow())
+
+    def test_success_closes_it(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock += 30
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+        self.assertTrue(self.breaker.allow())
+
+
+class HospitalClientTests(SimpleTestCase):
+    def setUp(self):
+        self.provider = FakeProvider()
+        self.client = HospitalClient(self.provider, ttl=60, stale_ttl=600, miss_wait=1)
+
+    def age(self, seconds):
+        """Make every cached entry ``seconds`` older."""
+        for key, (stored_at, results) in self.client._entries.items():
+            self.client._entries[key] = (stored_at - seconds, results)
+
+    def wait_for_refreshes(self):
+        for future in list(self.client._refreshing.values()):
+            future.result(5)
+
+    def test_fresh_entry_is_served_from_cache(self):
+        self.assertEqual(self.client.nearby(19.07, 72.87), [{"name": "City"}])
+        self.assertEqual(self.client.nearby(19.0701, 72.8701), [{"name": "City"}])
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        self.client.nearby(19.07, 72.87)
+        self.age(120)
+        self.provider.results = [{"name": "New"}]
+        self.assertEqual(self.client.nearby(19.07, 72.87), [{"name": "City"}])
+        self.wait_for_refreshes()
+        self.assertEqual(self.client.nearby(19.07, 72.87), [{"name": "New"}])
+        self.assertEqual(self.provider.calls, 2)
+
+    def test_stale_entry_survives_failed_refresh(self):
+        self.client.nearby(19.07, 72.87)
+        self.age(120)
+        self.provider.error = RuntimeError("down")
+        with self.assertLogs("backend.hospitals", "WARNING"):
+            self.assertEqual(self.client.nearby(19.07, 72.87), [{"name": "City"}])
+            self.wait_for_refreshes()
+            self.assertEqual(self.client.nearby(19.07, 72.87), [{"name": "City"}])
+            self.wait_for_refreshes()
+
+    def test_slow_cold_miss_returns_empty_within_the_wait(self):
+        self.client.miss_wait = 0.05
+        self.provider.release.clear()
+        started = time.monotonic()
+        self.assertEqual(self.client.nearby(19.07, 72.87), [])
+        self.assertLess(time.monotonic() - started, 1)
+        # The fetch carries on and fills the cache for the next search.
+        self.provider.release.set()
+        self.wait_for_refreshes()
+        self.assertEqual(self.client.nearby(19.07, 72.87), [{"name": "City"}])
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        self.client.miss_wait = 0.05
+        self.provider.release.clear()
+        for _ in range(3):
+            self.client.nearby(19.07, 72.87)
+        self.provider.release.set()
+        self.wait_for_refreshes()
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_open_breaker_skips_the_provider(self):
+        self.client.breaker = CircuitBreaker(threshold=1, cooldown=60)
+        self.provider.error = RuntimeError("down")
+        with self.assertLogs("backend.hospitals", "WARNING"):
+            self.assertEqual(self.client.nearby(19.07, 72.87), [])
+        self.assertEqual(self.client.nearby(19.07, 72.87), [])
+        self.assertEqual(self.provider.calls, 1)
@@ -0,0 +1,52 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from backend.models import Doctor
+
+
+def record(name, **location):
+    return {
+        "name": name,
+        "address": f"{name} Clinic, Bandra West, Mumbai, Maharashtra 400050, India",
+        "location": location,
+    }
+
+
+class ImportDoctorsTests(TestCase):
+    def run_import(self, records):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+            json.dump(records, f)
+            f.flush()
+            stdout, stderr = StringIO(), StringIO()
+            call_command("import_doctors", f.name, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_malformed_coordinates_are_skipped_with_a_warning(self):
+        stdout, stderr = self.run_import(
+            [
+                record("Dr A", latitude=19.07, longitude=72.87),
+                record("Dr B", latitude=19.07),
+                record("Dr C", latitude=19.07, longitude=None),
+                record("Dr D", latitude="north", longitude=72.87),
+                record("Dr E", latitude=190, longitude=72.87),
+                record("Dr F", latitude=19.08, longitude=72.88),
+            ]
+        )
+        self.assertEqual(
+            sorted(Doctor.objects.values_list("name", flat=True)), ["Dr A", "Dr F"]
+        )
+        self.assertIn("skipped 4", stdout)
+        for n in (2, 3, 4, 5):
+            self.assertIn(f"Skipping record {n}:", stderr)
+
+    def test_records_without_a_location_are_skipped_quietly(self):
+        stdout, stderr = self.run_import(
+            [record("Dr A"), record("Dr B", latitude=19.07, longitude=72.87)]
+        )
+        self.assertEqual(list(Doctor.objects.values_list("name", flat=True)), ["Dr B"])
+        self.assertIn("skipped 1", stdout)
+        self.assertEqual(stderr, "")
@@ -0,0 +1,156 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test import skipUnlessDBFeature
+from django.utils import timezone
+
+from backend import jobs
+from backend.models import Diagnosis, PredictionJob
+
+from . import make_user
+
+RESULT = {
+    "prediction": "Benign",
+    "confidence": 0.9,
+    "risk": "Low",
+    "recommendations": [],
+}
+
+
+class JobTestCase(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        patcher = mock.patch.object(jobs, "predict", return_value=RESULT)
+        self.predict = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def queue(self, **fields):
+        return PredictionJob.objects.create(user=self.user, image=b"image", **fields)
+
+    def expire(self, job):
+        expired = timezone.now() - timedelta(seconds=301)
+        PredictionJob.objects.filter(pk=job.pk).update(updated_at=expired)
+
+
+@override_settings(PREDICT_JOB_LEASE_SECONDS=300)
+class ClaimTests(JobTestCase):
+    def test_claims_the_oldest_queued_job_once(self):
+        first, second = self.queue(), self.queue()
+        claimed = [jobs.claim_next_job(), jobs.claim_next_job(), jobs.claim_next_job()]
+        self.assertEqual(
+            [job and job.pk for job in claimed], [first.pk, second.pk, None]
+        )
+        self.assertEqual(claimed[0].status, "running")
+
+    def test_stale_snapshot_cannot_claim(self):
+        # Another worker claimed the row between this one's read and update.
+        job = self.queue()
+        stale = PredictionJob.objects.get(pk=job.pk)
+        self.assertIsNotNone(jobs.claim_next_job())
+        with mock.patch("django.db.models.QuerySet.first", return_value=stale):
+            self.assertIsNone(jobs.claim_next_job())
+
+    def test_running_job_is_left_alone_within_its_lease(self):
+        self.queue()
+        jobs.claim_next_job()
+        self.assertIsNone(jobs.claim_next_job())
+
+    def test_expired_lease_is_reclaimed(self):
+        job = self.queue()
+        jobs.claim_next_job()
+        self.expire(job)
+        with self.assertLogs("backend.jobs", "WARNING"):
+            self.assertEqual(jobs.claim_next_job().pk, job.pk)
+
+
+@override_settings(PREDICT_JOB_LEASE_SECONDS=300)
+class RunJobTests(JobTestCase):
+    def test_stores_the_diagnosis_and_clears_the_image(self):
+        self.queue()
+        job = jobs.run_job(jobs.claim_next_job())
+        stored = PredictionJob.objects.get(pk=job.pk)
+        self.assertEqual(stored.status, "done")
+        self.assertEqual(stored.image, b"")
+        self.assertEqual(stored.diagnosis.prediction, "Benign")
+
+    def test_failure_is_recorded(self):
+        self.predict.side_effect = ValueError("Unreadable image")
+        self.queue()
+        with self.assertLogs("backend.jobs", "ERROR"):
+            job = jobs.run_job(jobs.claim_next_job())
+        stored = PredictionJob.objects.get(pk=job.pk)
+        self.assertEqual((stored.status, stored.error), ("failed", "Unreadable image"))
+        self.assertIsNone(stored.diagnosis)
+
+    def test_reclaimed_job_records_one_diagnosis(self):
+        # A slow worker loses its lease; the job is claimed again, and both
+        # workers finish.
+        self.queue()
+        slow = jobs.claim_next_job()
+        self.expire(slow)
+        with self.assertLogs("backend.jobs", "WARNING"):
+            again = jobs.claim_next_job()
+        jobs.run_job(again)
+        with self.assertLogs("backend.jobs", "WARNING"):
+            jobs.run_job(slow)
+        self.assertEqual(Diagnosis.objects.count(), 1)
+        stored = PredictionJob.objects.get(pk=again.pk)
+        self.assertEqual(stored.status, "done")
+        self.assertEqual(stored.updated_at, again.updated_at)
+
+
+@override_settings(PREDICT_JOB_LEASE_SECONDS=0.15)
+class HeartbeatTests(TransactionTestCase):
+    def test_lease_is_renewed_while_the_job_runs(self):
+        job = PredictionJob.objects.create(user=make_user(), image=b"image")
+        job = jobs.claim_next_job()
+        claimed_at = job.updated_at
+        seen = []
+
+        def slow_predict(*args, **kwargs):
+            # Three lease lengths: long enough for another worker to
+            # reclaim the job without renewals.
+            for _ in range(9):
+                threading.Event().wait(0.05)
+                seen.append(PredictionJob.objects.get(pk=job.pk).updated_at)
+            self.assertIsNone(jobs.claim_next_job())
+            return RESULT
+
+        with mock.patch.object(jobs, "predict", side_effect=slow_predict):
+            jobs.run_job(job)
+        self.assertGreater(seen[-1], claimed_at + timedelta(seconds=0.15))
+        stored = PredictionJob.objects.get(pk=job.pk)
+        self.assertEqual(stored.status, "done")
+        self.assertEqual(Diagnosis.objects.count(), 1)
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class ConcurrentClaimTests(TransactionTestCase):
+    """Needs row locks, so skipped on SQLite."""
+
+    def test_each_job_is_claimed_by_one_worker(self):
+        user = make_user()
+        for _ in range(4):
+            PredictionJob.objects.create(user=user, image=b"image")
+        barrier = threading.Barrier(8)
+        claimed = []
+
+        def claim():
+            try:
+                barrier.wait()
+                job = jobs.claim_next_job()
+                if job is not None:
+                    claimed.append(job.pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(claimed), len(set(claimed)))
+        self.assertLessEqual(len(claimed), 4)
@@ -0,0 +1,72 @@
+import datetime
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+BEFORE = [("backend", "0003_doctor_location_index")]
+AFTER = [("backend", "0004_doctor_unique_name_address")]
+
+
+class MergeDuplicateDoctorsTests(TransactionTestCase):
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(BEFORE)
+        apps = self.executor.loader.project_state(BEFORE).apps
+        self.Doctor = apps.get_model("backend", "Doctor")
+        self.Appointment = apps.get_model("backend", "Appointment")
+        self.user = apps.get_model("backend", "User").objects.create(
+            username="patient", email="p@example.com", phone_no="+14155550100"
+        )
+        self.date = datetime.date(2026, 1, 5)
+
+    def tearDown(self):
+        self.Appointment.objects.all().delete()
+        self.Doctor.objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def doctor(self):
+        return self.Doctor.objects.create(
+            name="Dr A",
+            specialization="Dermatologist",
+            hospital="City Hospital",
+            address="1 Main Street",
+            latitude=19.07,
+            longitude=72.87,
+        )
+
+    def book(self, doctor, hour):
+        return self.Appointment.objects.create(
+            user=self.user, doctor=doctor, date=self.date, time_slot=datetime.time(hour)
+        )
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(AFTER)
+        return executor.loader.project_state(AFTER).apps
+
+    def test_duplicates_merge_and_keep_their_appointments(self):
+        doctors = [self.doctor() for _ in range(3)]
+        appointments = [self.book(doctor, 9 + n) for n, doctor in enumerate(doctors)]
+        # The lowest primary key is kept.
+        keep = min(doctors, key=lambda doctor: doctor.pk)
+        apps = self.migrate()
+        Doctor = apps.get_model("backend", "Doctor")
+        Appointment = apps.get_model("backend", "Appointment")
+        self.assertEqual(list(Doctor.objects.values_list("pk", flat=True)), [keep.pk])
+        self.assertEqual(
+            set(Appointment.objects.values_list("pk", "doctor_id")),
+            {(appointment.pk, keep.pk) for appointment in appointments},
+        )
+
+    def test_clashing_appointments_stop_the_migration(self):
+        keep, duplicate = sorted((self.doctor(), self.doctor()), key=lambda d: d.pk)
+        self.book(keep, 9)
+        clash = self.book(duplicate, 9)
+        with self.assertRaisesMessage(RuntimeError, str(clash.pk)):
+            self.migrate()
+        self.assertEqual(self.Doctor.objects.count(), 2)
+        self.assertEqual(
+            self.Appointment.objects.get(pk=clash.pk).doctor_id, duplicate.pk
+        )
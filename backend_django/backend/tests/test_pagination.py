@@ -0,0 +1,97 @@
+import datetime
+import uuid
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.models import Diagnosis
+
+from . import make_user
+
+
+class DiagnosisHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.start = timezone.now().replace(microsecond=0)
+
+    def add(self, minutes, prediction="Benign", user=None):
+        diagnosis = Diagnosis.objects.create(
+            user=user or self.user,
+            prediction=prediction,
+            confidence=0.9,
+            risk="Low",
+            recommendations="",
+        )
+        # created_at is auto_now_add, so set it afterwards.
+        created_at = self.start - datetime.timedelta(minutes=minutes)
+        Diagnosis.objects.filter(pk=diagnosis.pk).update(created_at=created_at)
+        diagnosis.created_at = created_at
+        return diagnosis
+
+    def expected(self, diagnoses):
+        ordered = sorted(diagnoses, key=lambda d: (d.created_at, d.id), reverse=True)
+        return [str(d.id) for d in ordered]
+
+    def walk(self, url):
+        """Every page from ``url``, following ``next``."""
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["id"] for row in response.json()["results"]])
+            url = response.json()["next"]
+        return pages
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        diagnoses = [self.add(minutes) for minutes in range(7)]
+        pages = self.walk("/api/diagnoses/?limit=3")
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), self.expected(diagnoses))
+
+    def test_rows_sharing_a_timestamp_are_ordered_by_id(self):
+        diagnoses = [self.add(minutes) for minutes in (0, 1, 1, 1, 1, 2)]
+        pages = self.walk("/api/diagnoses/?limit=2")
+        self.assertEqual(sum(pages, []), self.expected(diagnoses))
+
+    def test_last_full_page_has_no_next(self):
+        for minutes in range(4):
+            self.add(minutes)
+        self.assertEqual(len(self.walk("/api/diagnoses/?limit=2")), 2)
+
+    def test_rows_added_while_paging_do_not_shift_pages(self):
+        diagnoses = [self.add(minutes) for minutes in range(4)]
+        first = self.client.get("/api/diagnoses/?limit=2").json()
+        self.add(-1)
+        rest = self.walk(first["next"])
+        self.assertEqual(
+            [row["id"] for row in first["results"]] + sum(rest, []),
+            self.expected(diagnoses),
+        )
+
+    def test_filters_apply_to_every_page(self):
+        melanomas = [self.add(minutes, "Melanoma") for minutes in range(0, 6, 2)]
+        for minutes in range(1, 6, 2):
+            self.add(minutes)
+        pages = self.walk("/api/diagnoses/?limit=2&prediction=Melanoma")
+        self.assertEqual(sum(pages, []), self.expected(melanomas))
+
+    def test_only_the_callers_rows(self):
+        mine = self.add(0)
+        self.add(1, user=make_user("other"))
+        self.assertEqual(self.walk("/api/diagnoses/"), [[str(mine.id)]])
+
+    def test_limit_is_clamped(self):
+        for minutes in range(3):
+            self.add(minutes)
+        response = self.client.get("/api/diagnoses/?limit=0")
+        self.assertEqual(len(response.json()["results"]), 1)
+        response = self.client.get("/api/diagnoses/?limit=abc")
+        self.assertEqual(len(response.json()["results"]), 3)
+
+    def test_invalid_cursor_is_404(self):
+        for cursor in ("not-base64!", "bm9waXBl", f"{uuid.uuid4()}"):
+            response = self.client.get(f"/api/diagnoses/?cursor={cursor}")
+            self.assertEqual(response.status_code, 404, cursor)
@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+
+from backend import predictions
+from backend.ml.cache import PredictionCache
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.version = "v1"
+        self.cache = PredictionCache(lambda: self.version, max_size=2)
+
+    def test_key_depends_on_bytes_variant_and_model_version(self):
+        key = self.cache.key(b"image")
+        self.assertEqual(key, self.cache.key(b"image"))
+        self.assertNotEqual(key, self.cache.key(b"other"))
+        self.assertNotEqual(key, self.cache.key(b"image", "tta4"))
+        self.assertNotEqual(
+            self.cache.key(b"image", "tta4"), self.cache.key(b"image", "tta2")
+        )
+        self.version = "v2"
+        self.assertNotEqual(key, self.cache.key(b"image"))
+
+    def test_lru_evicts_the_oldest_entry(self):
+        for name in ("a", "b"):
+            self.cache.set(name, {"name": name})
+        self.cache.get("a")
+        self.cache.set("c", {"name": "c"})
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), {"name": "a"})
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_backend_tier_refills_the_process_cache(self):
+        backend = LocMemCache("predict-tests", {})
+        shared = PredictionCache(lambda: "v1", backend=backend)
+        shared.set("key", {"prediction": "Benign"})
+        fresh = PredictionCache(lambda: "v1", backend=backend)
+        self.assertEqual(fresh.get("key"), {"prediction": "Benign"})
+        self.assertEqual(fresh.get("key"), {"prediction": "Benign"})
+        self.assertEqual(fresh.stats()["backend_hits"], 1)
+        self.assertEqual(fresh.stats()["hits"], 1)
+
+
+@override_settings(PREDICT_TTA_MAX_VIEWS=4)
+class PredictCacheKeyingTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = PredictionCache(lambda: "v1")
+        self.views = 4
+        patchers = [
+            mock.patch.object(predictions, "PREDICTION_CACHE", self.cache),
+            mock.patch(
+                "backend.ml.detection_model.predict_melanoma",
+                side_effect=lambda *args, **kwargs: {
+                    "prediction": "Benign",
+                    "views": self.views,
+                },
+            ),
+        ]
+        self.predict_melanoma = patchers[1].start()
+        patchers[0].start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def test_repeat_upload_is_served_from_the_cache(self):
+        first = predictions.predict(b"image", tta=True, model=object())
+        again = predictions.predict(b"image", tta=True, model=object())
+        self.assertEqual(again, first)
+        self.assertEqual(self.predict_melanoma.call_count, 1)
+
+    def test_tta_and_single_view_results_are_kept_apart(self):
+        self.views = 1
+        predictions.predict(b"image", tta=False, model=object())
+        self.views = 4
+        result = predictions.predict(b"image", tta=True, model=object())
+        self.assertEqual(result["views"], 4)
+        self.assertEqual(self.predict_melanoma.call_count, 2)
+
+    def test_result_with_fewer_views_is_keyed_by_the_views_scored(self):
+        # Under load the latency budget allowed only one view.
+        self.views = 1
+        predictions.predict(b"image", tta=True, model=object())
+        self.assertIsNone(self.cache.get(self.cache.key(b"image", "tta4")))
+        self.assertEqual(self.cache.get(self.cache.key(b"image"))["views"], 1)
+        # So a later full-TTA request scores it again rather than getting
+        # the degraded result...
+        self.views = 4
+        self.assertEqual(
+            predictions.predict(b"image", tta=True, model=object())["views"], 4
+        )
+        self.assertEqual(self.predict_melanoma.call_count, 2)
+        # ...while a single-view request reuses it.
+        self.assertEqual(
+            predictions.predict(b"image", tta=False, model=object())["views"], 1
+        )
+        self.assertEqual(self.predict_melanoma.call_count, 2)
@@ -0,0 +1,125 @@
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from backend import rollups
+from backend.models import DiagnosisRollup
+from backend.predictions import record_diagnosis
+
+from . import make_user
+
+
+def result(prediction="Benign", confidence=0.8, risk="Low"):
+    return {
+        "prediction": prediction,
+        "confidence": confidence,
+        "risk": risk,
+        "recommendations": [],
+    }
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.today = timezone.localdate()
+
+    def record(self, user=None, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return record_diagnosis(user or self.user, result(**fields))
+
+    def rows(self):
+        return {
+            (row.user_id, row.day, row.prediction): (
+                row.count,
+                round(row.confidence_sum, 6),
+                row.high_risk_count,
+            )
+            for row in DiagnosisRollup.objects.all()
+        }
+
+    def test_first_diagnosis_creates_user_and_clinic_rows(self):
+        self.record(confidence=0.75)
+        self.assertEqual(
+            self.rows(),
+            {
+                (self.user.pk, self.today, "Benign"): (1, 0.75, 0),
+                (None, self.today, "Benign"): (1, 0.75, 0),
+            },
+        )
+
+    def test_later_diagnoses_increment_the_rows(self):
+        other = make_user("other")
+        self.record(confidence=0.5)
+        self.record(confidence=0.25)
+        self.record(other, prediction="Melanoma", confidence=0.9, risk="High")
+        self.record(other, prediction="Melanoma", confidence=0.7, risk="High")
+        self.assertEqual(
+            self.rows(),
+            {
+                (self.user.pk, self.today, "Benign"): (2, 0.75, 0),
+                (other.pk, self.today, "Melanoma"): (2, 1.6, 2),
+                (None, self.today, "Benign"): (2, 0.75, 0),
+                (None, self.today, "Melanoma"): (2, 1.6, 2),
+            },
+        )
+
+    def test_clinic_rows_wait_for_the_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            record_diagnosis(self.user, result())
+        self.assertFalse(DiagnosisRollup.objects.filter(user=None).exists())
+        self.assertTrue(DiagnosisRollup.objects.filter(user=self.user).exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(DiagnosisRollup.objects.get(user=None).count, 1)
+
+    def test_increments_match_a_backfill(self):
+        other = make_user("other")
+        for user, fields in [
+            (self.user, {}),
+            (self.user, {"prediction": "Melanoma", "risk": "High"}),
+            (other, {"confidence": 0.6}),
+            (other, {"prediction": "Melanoma", "confidence": 0.95, "risk": "High"}),
+            (self.user, {"confidence": 0.55}),
+        ]:
+            self.record(user, **fields)
+        incremental = self.rows()
+        self.assertEqual(rollups.backfill(), len(incremental))
+        self.assertEqual(self.rows(), incremental)
+
+    def test_groups_are_applied_in_key_order(self):
+        other = make_user("other")
+        diagnoses = [
+            self.record(other),
+            self.record(prediction="Melanoma"),
+            self.record(),
+        ]
+        with mock.patch.object(
+            DiagnosisRollup.objects, "filter", wraps=DiagnosisRollup.objects.filter
+        ) as rows:
+            rollups._apply(rollups._groups(diagnoses))
+        keys = [
+            (str(call.kwargs["user_id"]), call.kwargs["day"], call.kwargs["prediction"])
+            for call in rows.call_args_list
+        ]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(keys), 5)
+
+    def test_trend_reads_the_rollups(self):
+        self.record(prediction="Melanoma", confidence=0.9, risk="High")
+        self.record(confidence=0.7)
+        trend = rollups.trend(self.user.pk, days=7)
+        self.assertEqual(trend["end"], self.today)
+        self.assertEqual(
+            trend["days"][-1],
+            {
+                "day": self.today,
+                "total": 2,
+                "counts": {"Melanoma": 1, "Benign": 1},
+                "high_risk": 1,
+                "mean_confidence": 0.8,
+            },
+        )
+        self.assertEqual(trend["days"][0]["day"], self.today - datetime.timedelta(6))
+        self.assertEqual(rollups.trend(None, days=7)["days"][-1]["total"], 2)
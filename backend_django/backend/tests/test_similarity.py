@@ -0,0 +1,74 @@
+import datetime
+
+import numpy as np
+from django.test import TestCase
+from django.utils import timezone
+
+from backend.models import Diagnosis
+from backend.similarity import EMBEDDING_DTYPE, embedding_index, similar_diagnoses
+
+from . import make_user
+
+
+class SimilarDiagnosesTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.start = timezone.now() - datetime.timedelta(days=30)
+        self.day = 0
+        self.close = self.scan([1, 0.1, 0, 0], "Benign", 80)
+        self.unrelated = self.scan([0, 1, 0, 0], "Benign", 90)
+        self.nearby = self.scan([1, 0.5, 0, 0], "Melanoma", 60)
+        self.diagnosis = self.scan([1, 0, 0, 0], "Melanoma", 70)
+        # Later scans and other users' scans are never matches.
+        self.later = self.scan([1, 0, 0, 0], "Benign", 90)
+        self.scan([1, 0, 0, 0], "Benign", 90, user=make_user("other"))
+        embedding_index.invalidate(self.user.pk)
+
+    def scan(self, vector, prediction, confidence, user=None):
+        diagnosis = Diagnosis.objects.create(
+            user=user or self.user,
+            prediction=prediction,
+            confidence=confidence,
+            risk="Low",
+            recommendations="",
+            embedding=np.array(vector, dtype=EMBEDDING_DTYPE).tobytes(),
+        )
+        self.day += 1
+        diagnosis.created_at = self.start + datetime.timedelta(days=self.day)
+        Diagnosis.objects.filter(pk=diagnosis.pk).update(
+            created_at=diagnosis.created_at
+        )
+        return diagnosis
+
+    def test_earlier_scans_ranked_by_similarity(self):
+        matches = similar_diagnoses(self.diagnosis, k=5)
+        self.assertEqual(
+            [match["id"] for match in matches],
+            [self.close.pk, self.nearby.pk, self.unrelated.pk],
+        )
+        similarities = [match["similarity"] for match in matches]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+        self.assertAlmostEqual(similarities[2], 0, places=3)
+        self.assertEqual(
+            [match["same_lesion"] for match in matches], [True, False, False]
+        )
+
+    def test_k_limits_the_matches(self):
+        matches = similar_diagnoses(self.diagnosis, k=2)
+        self.assertEqual(
+            [match["id"] for match in matches], [self.close.pk, self.nearby.pk]
+        )
+
+    def test_changes_are_relative_to_the_match(self):
+        close = similar_diagnoses(self.diagnosis, k=1)[0]
+        self.assertEqual(close["confidence_change"], -10)
+        # Benign at 80% is a 0.2 melanoma probability, now 0.7.
+        self.assertAlmostEqual(close["melanoma_probability_change"], 0.5)
+
+    def test_never_matches_itself(self):
+        # Without the created_at cut-off the scan itself and the identical
+        # later scan are the two best matches; only the later one is kept.
+        matches = embedding_index.nearest(
+            self.user.pk, self.diagnosis.embedding, 2, exclude=self.diagnosis.pk
+        )
+        self.assertEqual([row[0] for _, row in matches], [self.later.pk, self.close.pk])
@@ -1,10 +1,18 @@
 from django.urls import path
 from .views import (
     ProfileView,
-    # DiagnosisHistoryView,
+    DiagnosisHistoryView,
+    DiagnosisTrendView,
+    SimilarDiagnosesView,
     PredictView,
-    # NearbyDoctorsView,
-    # AppointmentView,
+    PredictStatsView,
+    BulkPredictView,
+    PredictionJobView,
+    PredictionJobDetailView,
+    NearbyDoctorsView,
+    DoctorAvailabilityView,
+    AppointmentView,
+    AppointmentActionView,
     RegisterView,
     LoginView,
 )
@@ -17,5 +25,26 @@ urlpatterns = [
     path("auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     # Other endpoints
     path("profile/", ProfileView.as_view()),
+    path("diagnoses/", DiagnosisHistoryView.as_view()),
+    path("diagnoses/trends/", DiagnosisTrendView.as_view()),
+    path("diagnoses/<uuid:pk>/similar/", SimilarDiagnosesView.as_view()),
+    path("diagnoses/trends/clinic/", DiagnosisTrendView.as_view(clinic=True)),
     path("predict/", PredictView.as_view()),
+    path("predict/stats/", PredictStatsView.as_view()),
+    path("predict/bulk/", BulkPredictView.as_view()),
+    path("predict/jobs/", PredictionJobView.as_view()),
+    path("predict/jobs/<uuid:pk>/", PredictionJobDetailView.as_view()),
+    path("doctors/nearby/", NearbyDoctorsView.as_view()),
+    path("doctors/availability/", DoctorAvailabilityView.as_view()),
+    path("appointments/", AppointmentView.as_view()),
+    path(
+        "appointments/<uuid:pk>/confirm/",
+        AppointmentActionView.as_view(),
+        {"action": "confirm"},
+    ),
+    path(
+        "appointments/<uuid:pk>/cancel/",
+        AppointmentActionView.as_view(),
+        {"action": "cancel"},
+    ),
 ]
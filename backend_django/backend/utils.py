@@ -1,19 +1,11 @@
-import requests, os
 from math import radians, cos, sin, asin, sqrt
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-
 
 def get_nearby_hospitals(lat, lon, radius=5000):
-    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-    params = {
-        "location": f"{lat},{lon}",
-        "radius": radius,
-        "type": "hospital",
-        "key": GOOGLE_API_KEY,
-    }
-    resp = requests.get(url, params=params).json()
-    return resp.get("results", [])
+    # Cached, timeout-bounded and circuit-broken; see backend/hospitals.py.
+    from .hospitals import get_client
+
+    return get_client().nearby(lat, lon, radius)
 
 
 def haversine(lat1, lon1, lat2, lon2):
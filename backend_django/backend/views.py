@@ -1,23 +1,58 @@
-import tempfile, os
+import json
+from datetime import datetime, timedelta
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.views import TokenObtainPairView
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import Diagnosis, Doctor, Appointment
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from .pagination import KeysetPagination
+from .metrics import ERRORS, render as render_metrics, timed
+from .models import Diagnosis, Doctor, Appointment, PredictionJob
 from .serializers import (
     LoginSerializer,
     RegisterSerializer,
     UserSerializer,
-    # DiagnosisSerializer,
-    # DoctorSerializer,
-    # AppointmentSerializer,
+    DiagnosisSerializer,
+    DiagnosisHistoryFilterSerializer,
+    PredictOptionsSerializer,
+    DoctorSerializer,
+    AppointmentSerializer,
+    BookingSerializer,
 )
-from .ml.detection_model import load_model, predict_melanoma
-from .utils import get_nearby_hospitals, haversine
+from .predictions import (
+    BATCHER,
+    PREDICTION_CACHE,
+    diagnosis_payload,
+    iter_uploads,
+    predict,
+    predict_bulk,
+    record_diagnosis,
+)
+from .availability import next_free_slots
+from .rollups import trend as rollup_trend
+from .similarity import similar_diagnoses
+from .booking import (
+    HoldExpired,
+    IdempotencyConflict,
+    SlotUnavailable,
+    allocate,
+    cancel as cancel_booking,
+    confirm as confirm_booking,
+    reserve,
+)
+from .geo import nearby_doctors
+from .utils import get_nearby_hospitals
 
 User = get_user_model()
-MODEL = load_model()
+
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, datetime.min.time()))
 
 
 class RegisterView(generics.CreateAPIView):
@@ -37,95 +72,312 @@ class ProfileView(generics.RetrieveAPIView):
         return self.request.user
 
 
-# class DiagnosisHistoryView(generics.ListAPIView):
-#     permission_classes = [permissions.IsAuthenticated]
-#     serializer_class = DiagnosisSerializer
+class DiagnosisHistoryView(generics.ListAPIView):
+    """The user's diagnoses, newest first, a keyset page at a time. Filter
+    with ``?from=YYYY-MM-DD&to=YYYY-MM-DD&prediction=Melanoma`` and follow
+    ``next`` for older pages."""
+
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = DiagnosisSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        filters = DiagnosisHistoryFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        params = filters.validated_data
+
+        queryset = Diagnosis.objects.filter(user=self.request.user)
+        # Day bounds become created_at ranges so the (user, created_at, id)
+        # index still serves the query.
+        if "from" in params:
+            queryset = queryset.filter(created_at__gte=start_of_day(params["from"]))
+        if "to" in params:
+            queryset = queryset.filter(
+                created_at__lt=start_of_day(params["to"] + timedelta(days=1))
+            )
+        if "prediction" in params:
+            queryset = queryset.filter(prediction=params["prediction"])
+        return queryset.values(*DiagnosisSerializer.Meta.fields)
+
+
+class SimilarDiagnosesView(APIView):
+    """Earlier scans of the caller that look most like this one, with how
+    the result changed since, from stored embeddings."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        diagnosis = get_object_or_404(
+            Diagnosis.objects.only(
+                "id", "user_id", "prediction", "confidence", "embedding", "created_at"
+            ),
+            pk=pk,
+            user=request.user,
+        )
+        if diagnosis.embedding is None:
+            return Response(
+                {
+                    "error": "No embedding stored for this scan",
+                    "detail": "Scans the fast screening model settled as benign "
+                    "(PREDICT_CASCADE_STUDENT) and scans from before lesion "
+                    "tracking have no embedding to compare.",
+                },
+                status=404,
+            )
+        try:
+            k = max(1, min(int(request.query_params.get("k", 5)), 50))
+        except ValueError:
+            return Response({"error": "k must be a number"}, status=400)
+        return Response(
+            {"id": diagnosis.id, "matches": similar_diagnoses(diagnosis, k)}
+        )
+
+
+class DiagnosisTrendView(APIView):
+    """Daily diagnosis trends from the rollups: the caller's own, or
+    clinic-wide for staff (``clinic=True``)."""
+
+    permission_classes = [permissions.IsAuthenticated]
+    clinic = False
 
-#     def get_queryset(self):
-#         return Diagnosis.objects.filter(user=self.request.user)
+    def get(self, request):
+        if self.clinic and not request.user.is_staff:
+            return Response({"error": "Staff only"}, status=403)
+        try:
+            days = int(request.query_params.get("days", 90))
+        except ValueError:
+            return Response({"error": "days must be a number"}, status=400)
+        days = max(1, min(days, settings.DIAGNOSIS_TREND_MAX_DAYS))
+        user_id = None if self.clinic else request.user.pk
+        return Response(rollup_trend(user_id, days))
 
 
 class PredictView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    def post(self, request):
+        with timed("upload"):
+            file = request.FILES.get("file")
+            data = file.read() if file else None
+        if not file:
+            return Response({"error": "No file uploaded"}, status=400)
+        options = PredictOptionsSerializer(data=request.data)
+        options.is_valid(raise_exception=True)
+
+        try:
+            result = predict(data, **options.validated_data)
+        except Exception:
+            ERRORS.inc(view="predict")
+            raise
+        with timed("db"):
+            diagnosis = record_diagnosis(request.user, result)
+        return Response(
+            diagnosis_payload(diagnosis) | {"views": result.get("views", 1)},
+            status=201,
+        )
+
+
+class BulkPredictView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        files = request.FILES.getlist("files") or request.FILES.getlist("file")
+        if not files:
+            return Response({"error": "No file uploaded"}, status=400)
+
+        lines = (
+            json.dumps(line, cls=DjangoJSONEncoder) + "\n"
+            for line in predict_bulk(request.user, iter_uploads(files))
+        )
+        return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+
+class PredictionJobView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
     def post(self, request):
         file = request.FILES.get("file")
         if not file:
             return Response({"error": "No file uploaded"}, status=400)
 
-        import tempfile, os
+        job = PredictionJob.objects.create(user=request.user, image=file.read())
+        return Response({"id": job.id, "status": job.status}, status=202)
 
-        tmp_dir = tempfile.mkdtemp()
-        file_path = os.path.join(tmp_dir, file.name)
-        with open(file_path, "wb+") as dest:
-            for chunk in file.chunks():
-                dest.write(chunk)
 
-        result = predict_melanoma(MODEL, file_path)
-        diagnosis = Diagnosis.objects.create(
+class PredictionJobDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        job = get_object_or_404(
+            PredictionJob.objects.select_related("diagnosis").defer("image"),
+            pk=pk,
             user=request.user,
-            prediction=result["prediction"],
-            confidence=result["confidence"],
-            risk=result["risk"],
-            recommendations="\n".join(result["recommendations"]),
         )
-
         return Response(
             {
-                "prediction": diagnosis.prediction,
-                "confidence": diagnosis.confidence,
-                "risk": diagnosis.risk,
-                "recommendations": diagnosis.recommendations,
-            },
-            status=201,
+                "id": job.id,
+                "status": job.status,
+                "result": diagnosis_payload(job.diagnosis) if job.diagnosis else None,
+                "error": job.error or None,
+            }
+        )
+
+
+class PredictStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {"batching": BATCHER.stats(), "cache": PREDICTION_CACHE.stats()}
         )
 
 
-# class NearbyDoctorsView(APIView):
-#     permission_classes = [permissions.IsAuthenticated]
-
-#     def post(self, request):
-#         user_lat = float(request.data.get("lat"))
-#         user_lon = float(request.data.get("lon"))
-#         max_distance = float(request.data.get("radius", 10))
-
-#         doctors = []
-#         for doc in Doctor.objects.all():
-#             distance = haversine(user_lat, user_lon, doc.latitude, doc.longitude)
-#             if distance <= max_distance:
-#                 doctors.append((distance, doc))
-
-#         doctors.sort(key=lambda x: x[0])
-#         doctor_data = [
-#             DoctorSerializer(doc).data | {"distance_km": round(dist, 2)}
-#             for dist, doc in doctors
-#         ]
-
-#         if len(doctor_data) < 5:
-#             hospitals = get_nearby_hospitals(
-#                 user_lat, user_lon, radius=max_distance * 1000
-#             )
-#             for h in hospitals[: 5 - len(doctor_data)]:
-#                 doctor_data.append(
-#                     {
-#                         "name": h["name"],
-#                         "specialization": "General",
-#                         "hospital": h["name"],
-#                         "address": h.get("vicinity", ""),
-#                         "latitude": h["geometry"]["location"]["lat"],
-#                         "longitude": h["geometry"]["location"]["lng"],
-#                     }
-#                 )
-
-#         return Response(doctor_data)
-
-
-# class AppointmentView(generics.ListCreateAPIView):
-#     permission_classes = [permissions.IsAuthenticated]
-#     serializer_class = AppointmentSerializer
-
-#     def get_queryset(self):
-#         return Appointment.objects.filter(user=self.request.user)
-
-#     def perform_create(self, serializer):
-#         serializer.save(user=self.request.user)
+def metrics_view(request):
+    """Prometheus scrape endpoint: bearer ``METRICS_TOKEN`` if one is set,
+    otherwise staff sessions only."""
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get("Authorization") != f"Bearer {token}":
+            return HttpResponse(status=401)
+    elif not request.user.is_staff:
+        return HttpResponse(status=403)
+    return HttpResponse(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+class NearbyDoctorsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            user_lat = float(request.data.get("lat"))
+            user_lon = float(request.data.get("lon"))
+            max_distance = float(request.data.get("radius", 10))
+            limit = int(request.data.get("limit", 20))
+        except (TypeError, ValueError):
+            return Response({"error": "lat and lon are required numbers"}, status=400)
+        max_distance = min(max_distance, settings.DOCTOR_SEARCH_MAX_RADIUS_KM)
+        limit = max(1, min(limit, settings.DOCTOR_SEARCH_MAX_RESULTS))
+
+        doctors = nearby_doctors(user_lat, user_lon, max_distance, limit)
+        doctor_data = [
+            DoctorSerializer(doc).data | {"distance_km": round(dist, 2)}
+            for dist, doc in doctors
+        ]
+
+        if len(doctor_data) < 5:
+            hospitals = get_nearby_hospitals(
+                user_lat, user_lon, radius=max_distance * 1000
+            )
+            for h in hospitals[: 5 - len(doctor_data)]:
+                doctor_data.append(
+                    {
+                        "name": h["name"],
+                        "specialization": "General",
+                        "hospital": h["name"],
+                        "address": h.get("vicinity", ""),
+                        "latitude": h["geometry"]["location"]["lat"],
+                        "longitude": h["geometry"]["location"]["lng"],
+                    }
+                )
+
+        return Response(doctor_data)
+
+
+class DoctorAvailabilityView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        try:
+            user_lat = float(request.data.get("lat"))
+            user_lon = float(request.data.get("lon"))
+            max_distance = float(request.data.get("radius", 10))
+            count = int(request.data.get("count", 10))
+        except (TypeError, ValueError):
+            return Response({"error": "lat and lon are required numbers"}, status=400)
+        max_distance = min(max_distance, settings.DOCTOR_SEARCH_MAX_RADIUS_KM)
+        count = max(1, min(count, settings.APPOINTMENT_SEARCH_MAX_RESULTS))
+
+        slots = next_free_slots(user_lat, user_lon, max_distance, count)
+        doctors = Doctor.objects.in_bulk({pk for *_, pk in slots})
+        doctor_data = {pk: DoctorSerializer(doc).data for pk, doc in doctors.items()}
+        return Response(
+            [
+                {
+                    "date": date,
+                    "time_slot": time,
+                    "distance_km": round(distance, 2),
+                    "doctor": doctor_data[pk],
+                }
+                for date, time, distance, pk in slots
+                if pk in doctor_data
+            ]
+        )
+
+
+class AppointmentView(generics.ListCreateAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = AppointmentSerializer
+
+    def get_queryset(self):
+        return Appointment.objects.filter(user=self.request.user).order_by(
+            "date", "time_slot"
+        )
+
+    def create(self, request, *args, **kwargs):
+        """Book or hold a slot. Send an ``Idempotency-Key`` header to make
+        retries safe: repeating a request with its key returns the original
+        appointment, and reusing the key for a different request is a 422."""
+        booking = BookingSerializer(data=request.data)
+        booking.is_valid(raise_exception=True)
+        data = booking.validated_data
+        key = request.headers.get("Idempotency-Key")
+        if key and len(key) > 64:
+            return Response({"error": "Idempotency-Key is too long"}, status=400)
+
+        try:
+            if "time_slot" in data:
+                appointment, created = reserve(
+                    request.user,
+                    data["doctor"],
+                    data["date"],
+                    data["time_slot"],
+                    hold=data["hold"],
+                    idempotency_key=key,
+                )
+            else:
+                appointment, created = allocate(
+                    request.user,
+                    [data["doctor"]],
+                    date=data.get("date"),
+                    hold=data["hold"],
+                    idempotency_key=key,
+                )
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=400)
+        except Doctor.DoesNotExist:
+            return Response({"error": "Unknown doctor"}, status=404)
+        except SlotUnavailable as exc:
+            return Response({"error": str(exc)}, status=409)
+        except IdempotencyConflict as exc:
+            return Response({"error": str(exc)}, status=422)
+        return Response(
+            AppointmentSerializer(appointment).data, status=201 if created else 200
+        )
+
+
+class AppointmentActionView(APIView):
+    """``confirm`` a hold or ``cancel`` a hold or booking."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, pk, action):
+        handler = {"confirm": confirm_booking, "cancel": cancel_booking}[action]
+        try:
+            appointment = handler(request.user, pk)
+        except Appointment.DoesNotExist:
+            return Response({"error": "Not found"}, status=404)
+        except HoldExpired as exc:
+            return Response({"error": str(exc)}, status=409)
+        return Response(AppointmentSerializer(appointment).data)
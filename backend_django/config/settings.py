@@ -61,8 +61,119 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# Inference runtime: "eager" (model.pth), "torchscript", "onnx" or "onnx-int8".
+# The non-eager artifacts are built with `manage.py export_model`.
+PREDICT_BACKEND = env("PREDICT_BACKEND", default="eager")
+
+# Two-tier cascade: set PREDICT_CASCADE_STUDENT to a distilled student's
+# weights (ml-model/train.py --arch ... --teacher ...) to score every image
+# with it first and re-score only those with a melanoma probability of at
+# least PREDICT_CASCADE_ESCALATE_ABOVE with the main model. The cutoff is
+# capped at the decision threshold so every melanoma call comes from the
+# main model. Student-only results carry no embedding, so
+# diagnoses/<id>/similar/ returns 404 for them (predict responses say so
+# with "similar_available").
+PREDICT_CASCADE_STUDENT = env("PREDICT_CASCADE_STUDENT", default=None)
+PREDICT_CASCADE_STUDENT_ARCH = env(
+    "PREDICT_CASCADE_STUDENT_ARCH", default="mobilenetv3_large_100"
+)
+PREDICT_CASCADE_ESCALATE_ABOVE = env.float(
+    "PREDICT_CASCADE_ESCALATE_ABOVE", default=0.1
+)
+
+# Load and warm up the classifier in each gunicorn worker as it starts (see
+# gunicorn.conf.py) instead of on its first /predict/ request. Management
+# commands and other servers load it lazily.
+PREDICT_PRELOAD_MODEL = env.bool("PREDICT_PRELOAD_MODEL", default=False)
+
+# Inference micro-batching: concurrent /predict/ requests are merged into one
+# forward pass of up to PREDICT_BATCH_MAX_SIZE images, waiting at most
+# PREDICT_BATCH_MAX_WAIT_MS for the batch to fill.
+PREDICT_BATCH_MAX_SIZE = env.int("PREDICT_BATCH_MAX_SIZE", default=16)
+PREDICT_BATCH_MAX_WAIT_MS = env.float("PREDICT_BATCH_MAX_WAIT_MS", default=10)
+
+# Workers renew the lease on a running predict/jobs/ job every third of
+# PREDICT_JOB_LEASE_SECONDS; a job not renewed for that long (its worker
+# died) is handed to the next worker that polls.
+PREDICT_JOB_LEASE_SECONDS = env.int("PREDICT_JOB_LEASE_SECONDS", default=300)
+
+# Upper bound on images scored by one predict/bulk/ request (files or ZIP).
+PREDICT_BULK_MAX_IMAGES = env.int("PREDICT_BULK_MAX_IMAGES", default=200)
+
+# Prediction results are cached by upload content hash. PREDICT_CACHE_SIZE
+# bounds the in-process LRU; PREDICT_CACHE_ALIAS optionally names an entry in
+# CACHES used as a shared/persistent second tier.
+PREDICT_CACHE_SIZE = env.int("PREDICT_CACHE_SIZE", default=1024)
+PREDICT_CACHE_ALIAS = env("PREDICT_CACHE_ALIAS", default=None)
+PREDICT_CACHE_TIMEOUT = env.int("PREDICT_CACHE_TIMEOUT", default=7 * 24 * 3600)
+
+# Test-time augmentation for /predict/: score flipped/rotated views of the
+# upload in one forward pass and average them. PREDICT_TTA turns it on by
+# default (requests can also ask with "tta"); the number of views adapts to
+# fit PREDICT_TTA_BUDGET_MS of model time, up to PREDICT_TTA_MAX_VIEWS (8).
+PREDICT_TTA = env.bool("PREDICT_TTA", default=False)
+PREDICT_TTA_MAX_VIEWS = env.int("PREDICT_TTA_MAX_VIEWS", default=4)
+PREDICT_TTA_BUDGET_MS = env.float("PREDICT_TTA_BUDGET_MS", default=250)
+
+# Nearby-dermatologist search caps.
+DOCTOR_SEARCH_MAX_RADIUS_KM = env.float("DOCTOR_SEARCH_MAX_RADIUS_KM", default=50)
+DOCTOR_SEARCH_MAX_RESULTS = env.int("DOCTOR_SEARCH_MAX_RESULTS", default=50)
+# Max age in seconds of the in-memory doctor coordinate snapshot. Saves and
+# deletes in the same process invalidate it immediately.
+DOCTOR_INDEX_TTL = env.float("DOCTOR_INDEX_TTL", default=300)
+
+# Appointment slot grid and free-slot search (see backend/availability.py).
+# Run "manage.py rebuild_availability --reset" after changing the slot length.
+APPOINTMENT_SLOT_MINUTES = env.int("APPOINTMENT_SLOT_MINUTES", default=15)
+APPOINTMENT_HORIZON_DAYS = env.int("APPOINTMENT_HORIZON_DAYS", default=14)
+APPOINTMENT_SEARCH_MAX_DOCTORS = env.int("APPOINTMENT_SEARCH_MAX_DOCTORS", default=200)
+APPOINTMENT_SEARCH_MAX_RESULTS = env.int("APPOINTMENT_SEARCH_MAX_RESULTS", default=50)
+# How long a slot hold lasts before release_expired_holds gives it back.
+APPOINTMENT_HOLD_SECONDS = env.int("APPOINTMENT_HOLD_SECONDS", default=300)
+
+# Longest window served by the diagnosis trend endpoints.
+DIAGNOSIS_TREND_MAX_DAYS = env.int("DIAGNOSIS_TREND_MAX_DAYS", default=365)
+
+# Lesion tracking: per-user embedding matrices kept in memory (LRU by user,
+# max age in seconds), and the cosine similarity above which two scans are
+# reported as the same lesion.
+SIMILARITY_INDEX_MAX_USERS = env.int("SIMILARITY_INDEX_MAX_USERS", default=256)
+SIMILARITY_INDEX_TTL = env.float("SIMILARITY_INDEX_TTL", default=300)
+LESION_MATCH_MIN_SIMILARITY = env.float("LESION_MATCH_MIN_SIMILARITY", default=0.9)
+
+# Hospital lookup used to pad nearby-doctor results. HOSPITAL_PROVIDER is
+# "google" (Places API) or "fixture" (offline JSON at HOSPITAL_FIXTURE_PATH).
+# A search with nothing cached waits at most HOSPITAL_MISS_WAIT_MS for the
+# upstream, then returns without hospitals while the fetch finishes.
+GOOGLE_MAPS_API_KEY = env("GOOGLE_MAPS_API_KEY", default=None)
+HOSPITAL_PROVIDER = env("HOSPITAL_PROVIDER", default="google")
+HOSPITAL_FIXTURE_PATH = env(
+    "HOSPITAL_FIXTURE_PATH", default=str(BASE_DIR / "backend/fixtures/hospitals.json")
+)
+HOSPITAL_CONNECT_TIMEOUT = env.float("HOSPITAL_CONNECT_TIMEOUT", default=1.0)
+HOSPITAL_READ_TIMEOUT = env.float("HOSPITAL_READ_TIMEOUT", default=2.0)
+HOSPITAL_MISS_WAIT_MS = env.float("HOSPITAL_MISS_WAIT_MS", default=200)
+HOSPITAL_CACHE_TTL = env.int("HOSPITAL_CACHE_TTL", default=3600)
+HOSPITAL_CACHE_STALE_TTL = env.int("HOSPITAL_CACHE_STALE_TTL", default=86400)
+HOSPITAL_CACHE_SIZE = env.int("HOSPITAL_CACHE_SIZE", default=2048)
+HOSPITAL_BREAKER_THRESHOLD = env.int("HOSPITAL_BREAKER_THRESHOLD", default=5)
+HOSPITAL_BREAKER_COOLDOWN = env.int("HOSPITAL_BREAKER_COOLDOWN", default=30)
+
+# /metrics serves Prometheus text format to "Authorization: Bearer
+# <METRICS_TOKEN>", or to logged-in staff when no token is set.
+# METRICS_LOG_REQUESTS adds one JSON log line per request with its stage
+# timings (logger "backend.requests").
+METRICS_TOKEN = env("METRICS_TOKEN", default=None)
+METRICS_LOG_REQUESTS = env.bool("METRICS_LOG_REQUESTS", default=False)
+
+# Keep typical phone photos in memory so they are decoded without a temp file.
+FILE_UPLOAD_MAX_MEMORY_SIZE = env.int(
+    "FILE_UPLOAD_MAX_MEMORY_SIZE", default=20 * 1024 * 1024
+)
+
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
+    "backend.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
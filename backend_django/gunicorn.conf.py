@@ -0,0 +1,17 @@
+"""Gunicorn settings, read from the working directory:
+
+    cd backend_django && gunicorn config.wsgi
+"""
+
+
+def post_worker_init(worker):
+    # Warm the model in each worker once it has forked and loaded the app,
+    # never in the master: torch thread pools started before a fork can
+    # deadlock the children. The weights file is memory-mapped, so workers
+    # still share one copy through the page cache.
+    from django.conf import settings
+
+    if settings.PREDICT_PRELOAD_MODEL:
+        from backend.ml.registry import model_registry
+
+        model_registry.warmup()
@@ -0,0 +1,155 @@
+"""Benchmark the student/teacher cascade on the held-out split.
+
+    python cascade.py --csv ... --images ... --out runs/b0 \\
+        --student runs/student/model.pth --student-arch mobilenetv3_large_100
+
+Takes ``train.py``'s data flags and the teacher run in ``--out`` (its
+``model.pth`` and, if present, ``model.threshold.json``). The student scores
+every test image; images whose melanoma probability reaches
+``--escalate-above`` are re-scored by the teacher, as the backend's
+``CascadeModel`` does. Like the backend, a cutoff above the teacher's
+threshold is lowered to the threshold, so the student alone never calls a
+scan melanoma. For each escalation cutoff it reports images/second
+of the teacher alone, the student alone and the cascade, the escalation
+rate, and the sensitivity and specificity at the teacher's threshold, then
+writes them to ``<out>/cascade.json``.
+
+Test images are decoded up front so the timings cover model time only,
+which is what the backend pays per request.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+from evaluate import THRESHOLD_FILE
+from metrics import at_threshold, roc_auc
+from train import (
+    BatchTransform,
+    autocast,
+    build_loaders,
+    build_parser,
+    load_classifier,
+    load_metadata,
+    parse_args,
+    softmax,
+)
+
+
+@torch.inference_mode()
+def timed_scores(model, batches, args, device):
+    """Melanoma probabilities for preprocessed ``batches`` and the seconds
+    the forward passes took."""
+    outputs = []
+    started = time.perf_counter()
+    for batch in batches:
+        with autocast(device, args.amp):
+            outputs.append(model(batch).float())
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+    seconds = time.perf_counter() - started
+    logits = torch.cat(outputs).cpu().numpy() if outputs else np.empty((0, 2))
+    return softmax(logits)[:, 1], seconds
+
+
+def tier_metrics(targets, scores, threshold, seconds):
+    return {
+        "images_per_second": len(targets) / seconds if seconds else None,
+        "seconds": seconds,
+        "roc_auc": roc_auc(targets, scores),
+        **at_threshold(targets, scores, threshold),
+    }
+
+
+def main(argv=None):
+    parser = build_parser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--student", required=True, help="Student model.pth")
+    parser.add_argument("--student-arch", default="mobilenetv3_large_100")
+    parser.add_argument(
+        "--escalate-above",
+        type=float,
+        nargs="+",
+        default=[0.05, 0.1, 0.2],
+        help="Student melanoma probabilities sent on to the teacher",
+    )
+    args = parse_args(argv, parser)
+    device = torch.device(args.device)
+    args.sampling = "loss"
+
+    metadata, splits = load_metadata(args)
+    *_, test_loader = build_loaders(args, metadata, splits)
+    transform = BatchTransform(device, train=False)
+    batches, targets = [], []
+    for images, labels in test_loader:
+        batches.append(transform(images.to(device)))
+        targets.append(labels.numpy())
+    targets = np.concatenate(targets)
+    threshold_path = os.path.join(args.out, THRESHOLD_FILE)
+    threshold = 0.5
+    if os.path.exists(threshold_path):
+        with open(threshold_path) as f:
+            threshold = json.load(f)["threshold"]
+
+    teacher = load_classifier(os.path.join(args.out, "model.pth"), args.arch, device)
+    student = load_classifier(args.student, args.student_arch, device)
+    # One untimed pass each so lazy initialisation is not measured.
+    timed_scores(teacher, batches[:1], args, device)
+    timed_scores(student, batches[:1], args, device)
+    teacher_scores, teacher_seconds = timed_scores(teacher, batches, args, device)
+    student_scores, student_seconds = timed_scores(student, batches, args, device)
+    teacher_result = tier_metrics(targets, teacher_scores, threshold, teacher_seconds)
+    results = {
+        "threshold": threshold,
+        "samples": int(len(targets)),
+        "melanoma": int(targets.sum()),
+        "teacher": teacher_result,
+        "student": tier_metrics(targets, student_scores, threshold, student_seconds),
+        "cascade": [],
+    }
+
+    images = torch.cat(batches)
+    for escalate_above in args.escalate_above:
+        cutoff = min(escalate_above, threshold)
+        if cutoff < escalate_above:
+            print(
+                f"escalate >= {escalate_above} is above the threshold "
+                f"{threshold:g}; using {cutoff:g} as the backend does"
+            )
+        escalated = np.flatnonzero(student_scores >= cutoff)
+        subset = [
+            images[escalated[start : start + args.batch_size]]
+            for start in range(0, len(escalated), args.batch_size)
+        ]
+        rescored, seconds = timed_scores(teacher, subset, args, device)
+        scores = student_scores.copy()
+        scores[escalated] = rescored
+        cascade = tier_metrics(targets, scores, threshold, student_seconds + seconds)
+        cascade["escalate_above"] = escalate_above
+        cascade["cutoff"] = cutoff
+        cascade["escalation_rate"] = len(escalated) / max(len(targets), 1)
+        cascade["speedup"] = teacher_seconds / (student_seconds + seconds)
+        if teacher_result["sensitivity"]:
+            cascade["recall_retained"] = (
+                cascade["sensitivity"] / teacher_result["sensitivity"]
+            )
+        results["cascade"].append(cascade)
+        print(
+            f"escalate >= {cutoff}: {cascade['escalation_rate']:.1%} escalated, "
+            f"{cascade['images_per_second']:.1f} img/s "
+            f"({cascade['speedup']:.2f}x teacher), sensitivity "
+            f"{cascade['sensitivity']} vs teacher {teacher_result['sensitivity']}"
+        )
+
+    with open(os.path.join(args.out, "cascade.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    print(
+        f"Teacher {teacher_result['images_per_second']:.1f} img/s, student "
+        f"{results['student']['images_per_second']:.1f} img/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Evaluate a trained model and pick its decision threshold.
+
+    python evaluate.py --csv train.csv --images train/ --out runs/b0
+
+Takes the same data flags (or ``--config``) as ``train.py``, so it rebuilds
+the same split, and reads ``<out>/model.pth``. Logits for the validation
+and test splits come from batched inference; everything after that is
+vectorized NumPy (see ``metrics.py``).
+
+The melanoma threshold is chosen on the validation split as the strictest
+cutoff that still catches ``--target-sensitivity`` of melanomas, since a
+screening tool should rather over-refer than miss one. It is written to
+``<out>/model.threshold.json``, which the backend reads when it sits next
+to ``model.pth``. ``<out>/report.json`` has the metrics for both splits at
+that threshold and at the plain argmax cutoff.
+"""
+
+import json
+import os
+import time
+
+import torch
+
+from metrics import (
+    at_threshold,
+    average_precision,
+    calibration,
+    roc_auc,
+    sensitivity_at_specificity,
+    threshold_for_sensitivity,
+)
+from train import (
+    BatchTransform,
+    build_loaders,
+    build_parser,
+    load_classifier,
+    load_metadata,
+    parse_args,
+    predict,
+    softmax,
+)
+
+THRESHOLD_FILE = "model.threshold.json"
+
+
+def report(targets, logits, threshold, specificities=(0.8, 0.9, 0.95)):
+    probabilities = softmax(logits)
+    scores = probabilities[:, 1]
+    both_classes = targets.min() != targets.max()
+    ece, bins = calibration(targets, probabilities)
+    return {
+        "samples": int(len(targets)),
+        "melanoma": int(targets.sum()),
+        "roc_auc": roc_auc(targets, scores),
+        "pr_auc": average_precision(targets, scores),
+        "sensitivity_at_specificity": {
+            str(specificity): (
+                sensitivity_at_specificity(targets, scores, specificity)[0]
+                if both_classes
+                else None
+            )
+            for specificity in specificities
+        },
+        "ece": ece,
+        "calibration_bins": bins,
+        "argmax": at_threshold(targets, scores, 0.5),
+        "chosen_threshold": at_threshold(targets, scores, threshold),
+    }
+
+
+def main(argv=None):
+    parser = build_parser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--target-sensitivity",
+        type=float,
+        default=0.95,
+        help="Share of validation melanomas the chosen threshold must flag",
+    )
+    args = parse_args(argv, parser)
+    device = torch.device(args.device)
+    # Inference on whole, ordered splits; no sampler needed.
+    args.sampling = "loss"
+
+    metadata, splits = load_metadata(args)
+    _, val_loader, test_loader = build_loaders(args, metadata, splits)
+    model = load_classifier(os.path.join(args.out, "model.pth"), args.arch, device)
+    transform = BatchTransform(device, train=False)
+
+    started = time.perf_counter()
+    val_targets, val_logits = predict(model, val_loader, transform, args, device)
+    test_targets, test_logits = predict(model, test_loader, transform, args, device)
+    inference_seconds = time.perf_counter() - started
+
+    val_scores = softmax(val_logits)[:, 1]
+    if val_targets.min() != val_targets.max():
+        threshold, val_specificity = threshold_for_sensitivity(
+            val_targets, val_scores, args.target_sensitivity
+        )
+    else:
+        # Nothing to tune on; keep the argmax cutoff.
+        threshold, val_specificity = 0.5, None
+    results = {
+        "threshold": threshold,
+        "target_sensitivity": args.target_sensitivity,
+        "validation_specificity": val_specificity,
+        "inference_seconds": inference_seconds,
+        "validation": report(val_targets, val_logits, threshold),
+        "test": report(test_targets, test_logits, threshold),
+    }
+
+    with open(os.path.join(args.out, "report.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    with open(os.path.join(args.out, THRESHOLD_FILE), "w") as f:
+        json.dump(
+            {
+                "threshold": threshold,
+                "target_sensitivity": args.target_sensitivity,
+                "validation_specificity": val_specificity,
+            },
+            f,
+            indent=2,
+        )
+    test = results["test"]
+    print(
+        f"Threshold {threshold:.4f} (validation sensitivity target "
+        f"{args.target_sensitivity:.0%}, specificity {val_specificity})"
+    )
+    print(
+        f"Test ROC-AUC {test['roc_auc']}, PR-AUC {test['pr_auc']}, ECE "
+        f"{test['ece']:.4f}, at threshold: {test['chosen_threshold']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
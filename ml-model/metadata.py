@@ -0,0 +1,162 @@
+"""Column-array metadata and class-balanced sampling.
+
+``Metadata`` keeps the image list as a few NumPy arrays instead of a pandas
+DataFrame, so indexing a sample is two array lookups rather than an
+``.iloc`` row, and the arrays pickle cheaply into DataLoader workers. Several
+ISIC releases can be loaded into one store; both the 2020 layout
+(``image_name``, ``target``) and the 2019 ground-truth layout (``image``,
+one-hot ``MEL``) are understood.
+
+Melanoma is under 2% of ISIC 2020, so training either weights the loss by
+class (``class_weights``) or oversamples melanoma by index, without copying
+rows: ``weighted_sampler`` draws samples with probability inversely
+proportional to their class size, and ``BalancedBatchSampler`` puts a fixed
+share of melanoma in every batch.
+"""
+
+import csv
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import Sampler, WeightedRandomSampler
+
+NUM_CLASSES = 2
+
+
+def _read_rows(csv_path):
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        if "image_name" in reader.fieldnames:
+            name, target = "image_name", "target"
+        else:
+            name, target = "image", "MEL"
+        for row in reader:
+            yield row[name], int(float(row[target]))
+
+
+class Metadata:
+    """Image names, melanoma targets and source folders as parallel arrays.
+
+    ``source[i]`` indexes ``image_dirs``, so rows from several CSVs keep
+    their own image folder.
+    """
+
+    def __init__(self, image_name, target, source, image_dirs):
+        self.image_name = image_name
+        self.target = target
+        self.source = source
+        self.image_dirs = list(image_dirs)
+
+    @classmethod
+    def from_csv(cls, *sources):
+        """Load ``(csv_path, image_dir)`` pairs, in order, into one store."""
+        names, targets, source_ids = [], [], []
+        for source, (csv_path, _) in enumerate(sources):
+            for name, target in _read_rows(csv_path):
+                names.append(name)
+                targets.append(target)
+                source_ids.append(source)
+        return cls(
+            np.array(names, dtype=str),
+            np.array(targets, dtype=np.int64),
+            np.array(source_ids, dtype=np.int16),
+            [image_dir for _, image_dir in sources],
+        )
+
+    def __len__(self):
+        return len(self.target)
+
+    def path(self, idx):
+        image_dir = self.image_dirs[self.source[idx]]
+        return os.path.join(image_dir, f"{self.image_name[idx]}.jpg")
+
+    def subset(self, indices):
+        indices = np.asarray(indices)
+        return Metadata(
+            self.image_name[indices],
+            self.target[indices],
+            self.source[indices],
+            self.image_dirs,
+        )
+
+    def class_counts(self):
+        return np.bincount(self.target, minlength=NUM_CLASSES)
+
+
+def stratified_split(targets, fractions, seed=42):
+    """Split row positions into ``len(fractions) + 1`` stratified parts: one
+    per fraction, then the remainder (e.g. ``(0.1, 0.1)`` gives val, test
+    and train). Each class is shuffled and cut separately, so every part
+    keeps the class ratio."""
+    rng = np.random.default_rng(seed)
+    parts = [[] for _ in range(len(fractions) + 1)]
+    for label in np.unique(targets):
+        rows = rng.permutation(np.flatnonzero(targets == label))
+        cuts = np.round(np.cumsum(fractions) * len(rows)).astype(int)
+        for part, chunk in zip(parts, np.split(rows, cuts)):
+            part.append(chunk)
+    return [np.sort(np.concatenate(part)) for part in parts]
+
+
+def class_weights(targets):
+    """Per-class loss weights ``total / count``, for CrossEntropyLoss."""
+    counts = np.bincount(targets, minlength=NUM_CLASSES)
+    return torch.tensor(counts.sum() / np.maximum(counts, 1), dtype=torch.float)
+
+
+def weighted_sampler(targets, num_samples=None, generator=None):
+    """Sampler that draws each class equally often on average, with
+    replacement. An epoch is ``num_samples`` draws (default: one per row)."""
+    counts = np.bincount(targets, minlength=NUM_CLASSES)
+    weights = torch.from_numpy(1.0 / np.maximum(counts, 1))[targets]
+    return WeightedRandomSampler(
+        weights,
+        num_samples or len(targets),
+        replacement=True,
+        generator=generator,
+    )
+
+
+class BalancedBatchSampler(Sampler):
+    """Batch sampler with ``round(batch_size * positive_fraction)`` melanoma
+    samples in every batch.
+
+    Each epoch walks a fresh permutation of the benign samples once;
+    melanoma samples are reshuffled and cycled as often as needed to fill
+    their share. Pass it as ``batch_sampler=`` to a DataLoader.
+    """
+
+    def __init__(self, targets, batch_size, positive_fraction=0.25, seed=0):
+        targets = np.asarray(targets)
+        self.positives = np.flatnonzero(targets == 1)
+        self.negatives = np.flatnonzero(targets != 1)
+        self.per_batch = max(1, round(batch_size * positive_fraction))
+        if not len(self.positives) or self.per_batch >= batch_size:
+            raise ValueError("Need both classes and room for benign samples")
+        self.negatives_per_batch = batch_size - self.per_batch
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return -(-len(self.negatives) // self.negatives_per_batch)
+
+    def __iter__(self):
+        rng = np.random.default_rng((self.seed, self.epoch))
+        self.epoch += 1
+        negatives = rng.permutation(self.negatives)
+        needed = len(self) * self.per_batch
+        positives = np.concatenate(
+            [
+                rng.permutation(self.positives)
+                for _ in range(-(-needed // len(self.positives)))
+            ]
+        )
+        for batch in range(len(self)):
+            start = batch * self.negatives_per_batch
+            pos = positives[batch * self.per_batch : (batch + 1) * self.per_batch]
+            neg = negatives[start : start + self.negatives_per_batch]
+            yield rng.permutation(np.concatenate([pos, neg])).tolist()
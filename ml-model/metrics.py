@@ -0,0 +1,104 @@
+"""Vectorized binary classification metrics.
+
+Everything works on whole NumPy arrays (``targets`` in {0, 1}, ``scores``
+the melanoma probability), with one sort per curve and no Python loop over
+samples, so scoring tens of thousands of images takes milliseconds.
+"""
+
+import numpy as np
+
+
+def roc_curve(targets, scores):
+    """``(fpr, tpr, thresholds)`` with one point per distinct score, from
+    the strictest threshold down; a sample is positive when its score is
+    ``>= threshold``. The first point is ``(0, 0)`` at ``inf``."""
+    order = np.argsort(-scores, kind="mergesort")
+    scores, targets = scores[order], targets[order]
+    # Last index of each run of equal scores.
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp = np.cumsum(targets)[last]
+    fp = last + 1 - tp
+    positives, negatives = tp[-1], fp[-1]
+    return (
+        np.r_[0, fp] / max(negatives, 1),
+        np.r_[0, tp] / max(positives, 1),
+        np.r_[np.inf, scores[last]],
+    )
+
+
+def roc_auc(targets, scores):
+    """Area under the ROC curve, or None if only one class is present."""
+    if targets.min() == targets.max():
+        return None
+    fpr, tpr, _ = roc_curve(targets, scores)
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def average_precision(targets, scores):
+    """Area under the precision-recall curve as average precision (the sum
+    of precision at each threshold weighted by the recall gained there)."""
+    if not targets.any():
+        return None
+    order = np.argsort(-scores, kind="mergesort")
+    scores, targets = scores[order], targets[order]
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tp = np.cumsum(targets)[last]
+    precision = tp / (last + 1)
+    recall = tp / tp[-1]
+    return float(np.sum(np.diff(np.r_[0, recall]) * precision))
+
+
+def sensitivity_at_specificity(targets, scores, specificity):
+    """Best ``(sensitivity, threshold)`` whose specificity is at least
+    ``specificity``."""
+    fpr, tpr, thresholds = roc_curve(targets, scores)
+    allowed = np.flatnonzero(1 - fpr >= specificity)
+    # tpr only grows along the curve, so the last allowed point is best.
+    best = allowed[-1]
+    return float(tpr[best]), float(thresholds[best])
+
+
+def threshold_for_sensitivity(targets, scores, sensitivity):
+    """Strictest ``(threshold, specificity)`` that still flags at least
+    ``sensitivity`` of the positives, i.e. the most specific screening
+    cutoff with that miss rate."""
+    fpr, tpr, thresholds = roc_curve(targets, scores)
+    first = np.flatnonzero(tpr >= sensitivity)[0]
+    return float(thresholds[first]), float(1 - fpr[first])
+
+
+def calibration(targets, probabilities, bins=15):
+    """Expected calibration error of the top-class confidence and the
+    per-bin ``(count, confidence, accuracy)`` behind it (equal-width bins)."""
+    confidence = probabilities.max(1)
+    correct = probabilities.argmax(1) == targets
+    index = np.minimum((confidence * bins).astype(int), bins - 1)
+    counts = np.bincount(index, minlength=bins)
+    safe = np.maximum(counts, 1)
+    mean_confidence = np.bincount(index, confidence, bins) / safe
+    accuracy = np.bincount(index, correct, bins) / safe
+    ece = np.sum(counts * np.abs(mean_confidence - accuracy)) / len(targets)
+    return float(ece), {
+        "count": counts.tolist(),
+        "confidence": mean_confidence.round(4).tolist(),
+        "accuracy": accuracy.round(4).tolist(),
+    }
+
+
+def confusion_matrix(targets, predicted):
+    """2x2 counts, rows actual and columns predicted (benign, melanoma)."""
+    return np.bincount(targets * 2 + predicted, minlength=4).reshape(2, 2)
+
+
+def at_threshold(targets, scores, threshold):
+    """Confusion matrix, sensitivity and specificity when flagging
+    ``scores >= threshold``."""
+    matrix = confusion_matrix(targets, (scores >= threshold).astype(np.int64))
+    positives, negatives = matrix[1].sum(), matrix[0].sum()
+    return {
+        "threshold": float(threshold),
+        "confusion_matrix": matrix.tolist(),
+        "sensitivity": float(matrix[1, 1] / positives) if positives else None,
+        "specificity": float(matrix[0, 0] / negatives) if negatives else None,
+        "accuracy": float(np.trace(matrix) / len(targets)),
+    }
@@ -0,0 +1,197 @@
+"""Pre-decoded image shards for training.
+
+Decoding and resizing full-resolution ISIC JPEGs on every epoch keeps the
+training loop waiting on PIL. ``python shards.py`` does that work once: every
+image listed in the metadata CSVs is resized to ``size`` x ``size`` RGB and
+written into ``.npy`` shards of up to ``shard_size`` images (uint8, NHWC),
+next to an ``index.npz`` holding each row's image name, target, shard and
+offset in ``Metadata`` order, plus ``size`` and ``shard_size``.
+
+``ShardDataset`` memory-maps the shards, so a sample is a view of the page
+cache rather than a decoded file, and DataLoader workers share the same
+physical pages.
+
+    python shards.py --csv train.csv --images train/ --out shards/
+
+Repeat ``--csv``/``--images`` to shard several ISIC releases together.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+from torch.utils.data import Dataset
+
+from metadata import Metadata
+
+INDEX_FILE = "index.npz"
+
+
+def shard_path(out_dir, shard):
+    return os.path.join(out_dir, f"shard-{shard:05d}.npy")
+
+
+def decode(path, size):
+    """Same decode as the serving backend: JPEG draft mode, then a bilinear
+    resize to ``size`` x ``size``."""
+    with Image.open(path) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (size, size))
+        return np.asarray(image.convert("RGB").resize((size, size), Image.BILINEAR))
+
+
+def _write_shard(args):
+    path, paths, size = args
+    if os.path.exists(path):
+        return path, False
+    images = np.empty((len(paths), size, size, 3), dtype=np.uint8)
+    for i, image_path in enumerate(paths):
+        images[i] = decode(image_path, size)
+    # Write under a temporary name so an interrupted run never leaves a
+    # truncated shard that a rerun would skip.
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, images)
+    os.replace(tmp, path)
+    return path, True
+
+
+def check_index(index, metadata, size, shard_size=None):
+    """Raise ``ValueError`` unless the loaded ``index`` was built from
+    ``metadata`` (same images and targets, in order) at ``size``, and with
+    ``shard_size`` when one is given."""
+    problems = []
+    if int(index["size"]) != size:
+        problems.append(f"size {int(index['size'])}, not {size}")
+    if shard_size is not None and int(index["shard_size"]) != shard_size:
+        problems.append(f"shard size {int(index['shard_size'])}, not {shard_size}")
+    if not np.array_equal(index["image_name"], metadata.image_name):
+        problems.append(
+            f"{len(index['image_name'])} images that do not match the "
+            f"{len(metadata)} in the CSVs"
+        )
+    elif not np.array_equal(index["target"], metadata.target):
+        problems.append("targets that differ from the CSVs")
+    if problems:
+        raise ValueError(f"Shard index has {'; '.join(problems)}")
+
+
+def build_shards(metadata, out_dir, size=224, shard_size=2048, workers=None):
+    """Write the shards and index for ``metadata`` into ``out_dir``.
+
+    Shards are decoded in parallel, one per worker process. The index is
+    written first and shards that already exist are kept, so an interrupted
+    run can simply be restarted; a rerun with another ``size``,
+    ``shard_size`` or set of CSVs raises ``ValueError`` instead of mixing
+    old shards into the new index (delete ``out_dir`` first).
+    """
+    count = len(metadata)
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        with np.load(index_path) as index:
+            if "shard_size" not in index:
+                raise ValueError("Shard index predates shard_size")
+            check_index(index, metadata, size, shard_size)
+    else:
+        positions = np.arange(count)
+        tmp = f"{index_path}.tmp.npz"
+        np.savez(
+            tmp,
+            image_name=metadata.image_name,
+            target=metadata.target,
+            shard=(positions // shard_size).astype(np.int32),
+            offset=(positions % shard_size).astype(np.int32),
+            size=np.array(size),
+            shard_size=np.array(shard_size),
+        )
+        os.replace(tmp, index_path)
+
+    jobs = [
+        (
+            shard_path(out_dir, shard),
+            [metadata.path(i) for i in range(start, min(start + shard_size, count))],
+            size,
+        )
+        for shard, start in enumerate(range(0, count, shard_size))
+    ]
+    with ProcessPoolExecutor(workers) as pool:
+        for path, written in pool.map(_write_shard, jobs):
+            print(f"{'Wrote' if written else 'Kept'} {path}")
+    return count, len(jobs)
+
+
+class ShardDataset(Dataset):
+    """``(uint8 HWC image, target)`` samples from ``build_shards`` output,
+    optionally limited to the positions in ``indices`` (rows of the
+    ``Metadata`` it was built from). Augmentation happens later, on whole
+    batches (see ``train.BatchTransform``).
+
+    Shards are opened lazily with ``mmap_mode="r"`` in whichever process
+    reads them, so the dataset pickles cheaply into DataLoader workers and
+    each worker maps the files itself.
+    """
+
+    def __init__(self, shard_dir, indices=None):
+        self.shard_dir = shard_dir
+        with np.load(os.path.join(shard_dir, INDEX_FILE)) as index:
+            self.size = int(index["size"])
+            rows = slice(None) if indices is None else np.asarray(indices)
+            self.targets = index["target"][rows]
+            self.shards = index["shard"][rows]
+            self.offsets = index["offset"][rows]
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_maps"] = {}
+        return state
+
+    def _shard(self, shard):
+        array = self._maps.get(shard)
+        if array is None:
+            array = np.load(shard_path(self.shard_dir, shard), mmap_mode="r")
+            self._maps[shard] = array
+        return array
+
+    def __getitem__(self, idx):
+        image = self._shard(int(self.shards[idx]))[self.offsets[idx]]
+        return image, int(self.targets[idx])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--csv", action="append", required=True, help="ISIC metadata CSV"
+    )
+    parser.add_argument(
+        "--images",
+        action="append",
+        required=True,
+        help="Folder with the JPEGs, one per --csv",
+    )
+    parser.add_argument("--out", required=True, help="Output folder for shards")
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--shard-size", type=int, default=2048)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    if len(args.csv) != len(args.images):
+        parser.error("give one --images folder per --csv")
+
+    metadata = Metadata.from_csv(*zip(args.csv, args.images))
+    try:
+        count, shards = build_shards(
+            metadata, args.out, args.size, args.shard_size, args.workers
+        )
+    except ValueError as exc:
+        parser.error(f"{exc}; delete {args.out} to rebuild")
+    print(f"{count} images in {shards} shards of {args.size}x{args.size}")
+
+
+if __name__ == "__main__":
+    main()
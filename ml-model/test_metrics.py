@@ -0,0 +1,108 @@
+"""Checks ``metrics.py`` against hand-computed values.
+
+python -m pytest test_metrics.py
+"""
+
+import numpy as np
+import pytest
+
+from metrics import (
+    at_threshold,
+    average_precision,
+    calibration,
+    confusion_matrix,
+    roc_auc,
+    roc_curve,
+    sensitivity_at_specificity,
+    threshold_for_sensitivity,
+)
+
+# Sorted by score: 0.8 (melanoma), 0.4 (benign), 0.35 (melanoma), 0.1 (benign).
+TARGETS = np.array([0, 0, 1, 1])
+SCORES = np.array([0.1, 0.4, 0.35, 0.8])
+
+
+def test_roc_curve():
+    fpr, tpr, thresholds = roc_curve(TARGETS, SCORES)
+    np.testing.assert_allclose(fpr, [0, 0, 0.5, 0.5, 1])
+    np.testing.assert_allclose(tpr, [0, 0.5, 0.5, 1, 1])
+    np.testing.assert_allclose(thresholds, [np.inf, 0.8, 0.4, 0.35, 0.1])
+
+
+def test_roc_curve_merges_tied_scores():
+    fpr, tpr, thresholds = roc_curve(
+        np.array([0, 1, 1, 0]), np.array([0.5, 0.5, 0.9, 0.1])
+    )
+    np.testing.assert_allclose(fpr, [0, 0, 0.5, 1])
+    np.testing.assert_allclose(tpr, [0, 0.5, 1, 1])
+    np.testing.assert_allclose(thresholds, [np.inf, 0.9, 0.5, 0.1])
+
+
+def test_roc_auc():
+    assert roc_auc(TARGETS, SCORES) == pytest.approx(0.75)
+    # Three of four pairs ranked right and one tie counted as half.
+    assert roc_auc(
+        np.array([0, 1, 1, 0]), np.array([0.5, 0.5, 0.9, 0.1])
+    ) == pytest.approx(0.875)
+    assert roc_auc(TARGETS, TARGETS.astype(float)) == pytest.approx(1.0)
+    assert roc_auc(TARGETS, 1.0 - TARGETS) == pytest.approx(0.0)
+
+
+def test_roc_auc_needs_both_classes():
+    assert roc_auc(np.zeros(3, dtype=int), np.array([0.1, 0.2, 0.3])) is None
+
+
+def test_average_precision():
+    # Precision 1 at recall 0.5, then 2/3 at recall 1.
+    assert average_precision(TARGETS, SCORES) == pytest.approx((1 + 2 / 3) / 2)
+    assert average_precision(TARGETS, TARGETS.astype(float)) == pytest.approx(1.0)
+    assert average_precision(np.zeros(2, dtype=int), np.array([0.3, 0.7])) is None
+
+
+def test_sensitivity_at_specificity():
+    assert sensitivity_at_specificity(TARGETS, SCORES, 0.5) == pytest.approx(
+        (1.0, 0.35)
+    )
+    assert sensitivity_at_specificity(TARGETS, SCORES, 1.0) == pytest.approx((0.5, 0.8))
+
+
+def test_threshold_for_sensitivity():
+    assert threshold_for_sensitivity(TARGETS, SCORES, 0.5) == pytest.approx((0.8, 1.0))
+    assert threshold_for_sensitivity(TARGETS, SCORES, 1.0) == pytest.approx((0.35, 0.5))
+
+
+def test_confusion_matrix():
+    matrix = confusion_matrix(np.array([0, 0, 1, 1, 1]), np.array([0, 1, 1, 1, 0]))
+    assert matrix.tolist() == [[1, 1], [1, 2]]
+
+
+def test_at_threshold():
+    assert at_threshold(TARGETS, SCORES, 0.5) == {
+        "threshold": 0.5,
+        "confusion_matrix": [[2, 0], [1, 1]],
+        "sensitivity": 0.5,
+        "specificity": 1.0,
+        "accuracy": 0.75,
+    }
+    # Scores equal to the threshold are flagged.
+    assert at_threshold(TARGETS, SCORES, 0.35)["confusion_matrix"] == [[1, 1], [0, 2]]
+
+
+def test_at_threshold_with_one_class():
+    result = at_threshold(np.zeros(2, dtype=int), np.array([0.2, 0.6]), 0.5)
+    assert result["sensitivity"] is None
+    assert result["specificity"] == 0.5
+
+
+def test_calibration():
+    # Top-class confidence 0.8 and four of five right: calibrated.
+    targets = np.array([1, 1, 1, 1, 0])
+    probabilities = np.tile([0.2, 0.8], (5, 1))
+    ece, bins = calibration(targets, probabilities, bins=10)
+    assert ece == pytest.approx(0.0)
+    assert bins["count"][8] == 5
+    assert bins["accuracy"][8] == pytest.approx(0.8)
+
+    # Confidence 0.9 but always right: under-confident by 0.1.
+    ece, _ = calibration(np.ones(4, dtype=int), np.tile([0.1, 0.9], (4, 1)), bins=10)
+    assert ece == pytest.approx(0.1)
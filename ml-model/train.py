@@ -0,0 +1,567 @@
+"""Train the melanoma classifier.
+
+    python train.py --csv train.csv --images train/ --out runs/b0
+    python train.py --config runs/b0.json --resume
+    python train.py --synthetic 64 --epochs 2 --no-pretrained --out /tmp/smoke
+
+Options come from flags, optionally with defaults from a JSON ``--config``
+file whose keys are the flag names (``"batch_size": 32``). Every epoch
+writes ``last.pt`` (model, optimizer, grad-scaler and RNG state, including
+the train loader's shuffling) to ``--out``, so ``--resume`` continues an
+interrupted run with the same batches; the cosine learning-rate schedule is
+rebuilt for the current ``--epochs``, so a resumed run can be extended.
+The weights scoring
+best on ``--metric`` over the validation split are written to ``model.pth``,
+a plain state dict that ``backend/ml/detection_model.load_model`` reads.
+
+``--arch`` trains another timm backbone, and ``--teacher`` (a B0
+``model.pth``) adds knowledge distillation, e.g. for the backend's cascade
+student:
+
+    python train.py --csv ... --images ... --arch mobilenetv3_large_100 \\
+        --teacher runs/b0/model.pth --out runs/student
+
+Images come from ``shards.py`` output when ``--shards`` is given, otherwise
+straight from the JPEGs. Augmentation runs on whole batches on the training
+device, so workers only hand over uint8 pixels.
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import timm
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset, RandomSampler
+
+from metadata import (
+    BalancedBatchSampler,
+    Metadata,
+    class_weights,
+    stratified_split,
+    weighted_sampler,
+)
+from metrics import confusion_matrix, roc_auc
+from shards import INDEX_FILE, ShardDataset, check_index, decode
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+METRICS = ("auc", "recall", "accuracy")
+
+
+class EfficientNetClassifier(nn.Module):
+    # Same layout as the backend's, so state dicts load on either side.
+    # Other timm architectures (the distilled students) get the same wrapper.
+    def __init__(self, num_classes=2, pretrained=True, arch="efficientnet_b0"):
+        super().__init__()
+        self.model = timm.create_model(arch, pretrained=pretrained)
+        self.model.reset_classifier(num_classes)
+
+    def forward(self, x):
+        return self.model(x)
+
+
+class JpegDataset(Dataset):
+    """uint8 HWC pixels decoded from the original JPEGs, for runs without
+    shards."""
+
+    def __init__(self, metadata, size=224):
+        self.metadata = metadata
+        self.size = size
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __getitem__(self, idx):
+        return decode(self.metadata.path(idx), self.size), int(
+            self.metadata.target[idx]
+        )
+
+
+def collate(batch):
+    """Stack uint8 images with a single copy into one NHWC tensor."""
+    images, targets = zip(*batch)
+    return torch.from_numpy(np.stack(images)), torch.tensor(targets)
+
+
+class BatchTransform:
+    """The former albumentations pipeline applied to a whole uint8 NHWC
+    batch: per-image horizontal and vertical flips (p=0.5 each) and
+    brightness/contrast jitter of up to 20% (p=0.2) when ``train``, then
+    ImageNet normalization into float NCHW."""
+
+    def __init__(self, device, train):
+        self.train = train
+        self.mean = torch.tensor(MEAN, device=device).view(1, 3, 1, 1) * 255
+        self.std = torch.tensor(STD, device=device).view(1, 3, 1, 1) * 255
+
+    def __call__(self, images):
+        x = images.permute(0, 3, 1, 2).float()
+        if self.train:
+            n = x.shape[0]
+            flip = torch.rand(n, device=x.device) < 0.5
+            x = torch.where(flip.view(n, 1, 1, 1), x.flip(3), x)
+            flip = torch.rand(n, device=x.device) < 0.5
+            x = torch.where(flip.view(n, 1, 1, 1), x.flip(2), x)
+            jitter = (torch.rand(n, device=x.device) < 0.2).view(n, 1, 1, 1)
+            alpha = 1 + (torch.rand(n, 1, 1, 1, device=x.device) * 0.4 - 0.2)
+            beta = (torch.rand(n, 1, 1, 1, device=x.device) * 0.4 - 0.2) * 255
+            mean = x.mean(dim=(1, 2, 3), keepdim=True)
+            adjusted = ((x - mean) * alpha + mean + beta).clamp(0, 255)
+            x = torch.where(jitter, adjusted, x)
+        return ((x - self.mean) / self.std).contiguous(
+            memory_format=torch.channels_last
+        )
+
+
+def make_synthetic_dataset(out_dir, count, size=256, seed=0):
+    """Write ``count`` fake lesion JPEGs and a 2020-style CSV into
+    ``out_dir`` (a quarter melanoma, drawn darker and larger) and return the
+    CSV path. For smoke-testing the pipeline; the images mean nothing."""
+    from PIL import Image, ImageDraw
+
+    rng = np.random.default_rng(seed)
+    image_dir = os.path.join(out_dir, "train")
+    os.makedirs(image_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, "train.csv")
+    with open(csv_path, "w") as f:
+        f.write("image_name,target\n")
+        for i in range(count):
+            target = int(i % 4 == 0)
+            skin = rng.integers(150, 230, 3)
+            pixels = rng.normal(skin, 12, (size, size, 3)).clip(0, 255)
+            image = Image.fromarray(pixels.astype(np.uint8))
+            radius = size * (
+                rng.uniform(0.25, 0.4) if target else rng.uniform(0.1, 0.2)
+            )
+            cx, cy = rng.uniform(0.35, 0.65, 2) * size
+            tone = rng.integers(20, 70) if target else rng.integers(90, 140)
+            ImageDraw.Draw(image).ellipse(
+                (cx - radius, cy - radius * 0.8, cx + radius, cy + radius * 0.8),
+                fill=(int(tone) + 30, int(tone), int(tone) - 10),
+            )
+            name = f"SYNTH_{i:07d}"
+            image.save(os.path.join(image_dir, f"{name}.jpg"), quality=90)
+            f.write(f"{name},{target}\n")
+    return csv_path
+
+
+def softmax(logits):
+    exp = np.exp(logits - logits.max(1, keepdims=True))
+    return exp / exp.sum(1, keepdims=True)
+
+
+def summarize(targets, logits):
+    """Validation metrics at the argmax cutoff."""
+    probabilities = softmax(logits)
+    predicted = probabilities.argmax(1)
+    confusion = confusion_matrix(targets, predicted)
+    positives = confusion[1].sum()
+    return {
+        "accuracy": float((predicted == targets).mean()),
+        "recall": float(confusion[1, 1] / positives) if positives else None,
+        "auc": roc_auc(targets, probabilities[:, 1]),
+        "confusion_matrix": confusion.tolist(),
+    }
+
+
+def autocast(device, mode):
+    """bfloat16 autocast on CPU, float16 on CUDA, or nothing."""
+    if mode == "off":
+        return torch.autocast(device.type, enabled=False)
+    if mode == "auto":
+        mode = "fp16" if device.type == "cuda" else "bf16"
+    dtype = torch.float16 if mode == "fp16" else torch.bfloat16
+    return torch.autocast(device.type, dtype=dtype)
+
+
+def distillation_loss(logits, teacher_logits, labels, criterion, alpha, temperature):
+    """``alpha`` x the KL divergence from the teacher's temperature-softened
+    distribution (scaled by T^2 to keep gradient size independent of T),
+    plus ``1 - alpha`` x the usual loss on the labels."""
+    logits, teacher_logits = logits.float(), teacher_logits.float()
+    soft = F.kl_div(
+        F.log_softmax(logits / temperature, dim=1),
+        F.log_softmax(teacher_logits / temperature, dim=1),
+        reduction="batchmean",
+        log_target=True,
+    )
+    hard = criterion(logits, labels)
+    return alpha * soft * temperature**2 + (1 - alpha) * hard
+
+
+def load_classifier(path, arch, device):
+    model = EfficientNetClassifier(pretrained=False, arch=arch)
+    model.load_state_dict(torch.load(path, map_location="cpu"))
+    return model.to(device, memory_format=torch.channels_last).eval()
+
+
+def train_one_epoch(
+    model, loader, transform, optimizer, criterion, scaler, args, device, teacher=None
+):
+    model.train()
+    running_loss = 0.0
+    optimizer.zero_grad(set_to_none=True)
+    steps = len(loader)
+    for batch_idx, (images, labels) in enumerate(loader):
+        images = transform(images.to(device, non_blocking=True))
+        labels = labels.to(device, non_blocking=True)
+        with autocast(device, args.amp):
+            logits = model(images)
+            if teacher is None:
+                loss = criterion(logits, labels)
+            else:
+                with torch.no_grad():
+                    teacher_logits = teacher(images)
+                loss = distillation_loss(
+                    logits,
+                    teacher_logits,
+                    labels,
+                    criterion,
+                    args.distill_alpha,
+                    args.distill_temperature,
+                )
+            loss = loss / args.accumulation_steps
+        scaler.scale(loss).backward()
+
+        # Also step on the last batch so its gradients are not dropped.
+        if (batch_idx + 1) % args.accumulation_steps == 0 or batch_idx + 1 == steps:
+            scaler.step(optimizer)
+            scaler.update()
+            optimizer.zero_grad(set_to_none=True)
+
+        running_loss += loss.item() * args.accumulation_steps
+        if batch_idx % args.log_every == 0:
+            print(f"Batch {batch_idx}/{steps} - Loss: {loss.item():.4f}")
+    return running_loss / max(steps, 1)
+
+
+@torch.inference_mode()
+def predict(model, loader, transform, args, device):
+    """Targets and float32 logits for a whole loader, written into arrays
+    preallocated from the dataset size."""
+    model.eval()
+    count = len(loader.dataset)
+    targets = np.empty(count, dtype=np.int64)
+    logits = np.empty((count, 2), dtype=np.float32)
+    offset = 0
+    for images, labels in loader:
+        with autocast(device, args.amp):
+            output = model(transform(images.to(device, non_blocking=True)))
+        n = len(labels)
+        targets[offset : offset + n] = labels.numpy()
+        logits[offset : offset + n] = output.float().cpu().numpy()
+        offset += n
+    return targets, logits
+
+
+def cosine_schedule(optimizer, epochs, start_epoch=0):
+    """Cosine annealing over ``epochs`` epochs, advanced to ``start_epoch``.
+
+    Built fresh on every run rather than restored from a checkpoint, so
+    resuming with a different ``--epochs`` follows the new schedule.
+    """
+    for group in optimizer.param_groups:
+        group["lr"] = group.setdefault("initial_lr", group["lr"])
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
+    # The closed form at start_epoch; later steps continue from there.
+    progress = (1 + math.cos(math.pi * start_epoch / epochs)) / 2
+    for group, base_lr in zip(optimizer.param_groups, scheduler.base_lrs):
+        group["lr"] = scheduler.eta_min + (base_lr - scheduler.eta_min) * progress
+    scheduler.last_epoch = start_epoch
+    return scheduler
+
+
+def save_atomic(obj, path):
+    tmp = f"{path}.tmp"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+def export_state_dict(model):
+    """Contiguous float32 CPU tensors, loadable with ``mmap=True``."""
+    return {
+        name: tensor.detach().to("cpu", torch.float32).contiguous()
+        for name, tensor in model.state_dict().items()
+    }
+
+
+def load_metadata(args):
+    """Metadata and its (train, val, test) row positions; the split only
+    depends on the data, fractions and seed, so evaluation sees the same
+    one. ``--synthetic`` data is generated on first use."""
+    if args.synthetic:
+        synthetic_dir = os.path.join(args.out, "synthetic")
+        csv_path = os.path.join(synthetic_dir, "train.csv")
+        if not os.path.exists(csv_path):
+            make_synthetic_dataset(synthetic_dir, args.synthetic)
+        args.csv, args.images = [csv_path], [os.path.join(synthetic_dir, "train")]
+    metadata = Metadata.from_csv(*zip(args.csv, args.images))
+    val_idx, test_idx, train_idx = stratified_split(
+        metadata.target, (args.val_fraction, args.test_fraction), args.seed
+    )
+    return metadata, (train_idx, val_idx, test_idx)
+
+
+def build_loaders(args, metadata, splits):
+    train_idx, val_idx, test_idx = splits
+    if args.shards:
+        # Splits and samplers index the CSV rows, so the shards must hold
+        # exactly those rows, in order, at this image size.
+        try:
+            with np.load(os.path.join(args.shards, INDEX_FILE)) as index:
+                check_index(index, metadata, args.image_size)
+        except (OSError, ValueError) as exc:
+            raise SystemExit(
+                f"--shards {args.shards} does not fit --csv/--image-size: {exc}"
+            )
+        datasets = [ShardDataset(args.shards, rows) for rows in splits]
+    else:
+        datasets = [
+            JpegDataset(metadata.subset(rows), args.image_size) for rows in splits
+        ]
+    options = dict(
+        num_workers=args.workers,
+        collate_fn=collate,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=args.workers > 0,
+        prefetch_factor=4 if args.workers > 0 else None,
+    )
+    train_targets = metadata.target[train_idx]
+    generator = torch.Generator().manual_seed(args.seed)
+    if args.sampling == "balanced":
+        sampler = BalancedBatchSampler(
+            train_targets, args.batch_size, args.positive_fraction, args.seed
+        )
+        train = DataLoader(datasets[0], batch_sampler=sampler, **options)
+    elif args.sampling == "weighted":
+        sampler = weighted_sampler(train_targets, generator=generator)
+        train = DataLoader(
+            datasets[0], batch_size=args.batch_size, sampler=sampler, **options
+        )
+    else:
+        # The generator goes to the sampler, not the DataLoader, so it only
+        # drives the shuffling and its saved state replays it on --resume.
+        sampler = RandomSampler(datasets[0], generator=generator)
+        train = DataLoader(
+            datasets[0], batch_size=args.batch_size, sampler=sampler, **options
+        )
+    val, test = (
+        DataLoader(dataset, batch_size=args.batch_size, **options)
+        for dataset in datasets[1:]
+    )
+    return train, val, test
+
+
+def build_parser(description=__doc__.split("\n\n")[0]):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--config", help="JSON file with defaults for these flags")
+    parser.add_argument("--csv", action="append", default=[], help="ISIC CSV")
+    parser.add_argument(
+        "--images", action="append", default=[], help="JPEG folder per --csv"
+    )
+    parser.add_argument("--shards", help="shards.py output built from the same CSVs")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="Generate this many fake images into --out and train on them",
+    )
+    parser.add_argument("--out", default="runs/latest")
+    parser.add_argument("--resume", action="store_true", help="Continue last.pt")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--accumulation-steps", type=int, default=4)
+    parser.add_argument("--lr", type=float, default=1e-5)
+    parser.add_argument("--weight-decay", type=float, default=1e-4)
+    parser.add_argument("--image-size", type=int, default=224)
+    parser.add_argument(
+        "--sampling", choices=["loss", "weighted", "balanced"], default="loss"
+    )
+    parser.add_argument("--positive-fraction", type=float, default=0.25)
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument("--test-fraction", type=float, default=0.1)
+    parser.add_argument(
+        "--metric",
+        choices=METRICS,
+        default="auc",
+        help="Validation metric that picks the saved model",
+    )
+    parser.add_argument(
+        "--amp",
+        choices=["auto", "bf16", "fp16", "off"],
+        default="auto",
+        help="Autocast dtype; auto is fp16 on CUDA and bf16 on CPU",
+    )
+    parser.add_argument(
+        "--pretrained", action=argparse.BooleanOptionalAction, default=True
+    )
+    parser.add_argument("--arch", default="efficientnet_b0", help="timm model name")
+    parser.add_argument("--teacher", help="model.pth to distill from")
+    parser.add_argument("--teacher-arch", default="efficientnet_b0")
+    parser.add_argument(
+        "--distill-alpha",
+        type=float,
+        default=0.7,
+        help="Weight of the teacher's soft targets against the labels",
+    )
+    parser.add_argument("--distill-temperature", type=float, default=4.0)
+    parser.add_argument(
+        "--device", default="cuda" if torch.cuda.is_available() else "cpu"
+    )
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-every", type=int, default=10)
+    return parser
+
+
+def parse_args(argv=None, parser=None):
+    parser = parser or build_parser()
+    args, _ = parser.parse_known_args(argv)
+    if args.config:
+        with open(args.config) as f:
+            parser.set_defaults(**json.load(f))
+    args = parser.parse_args(argv)
+    if len(args.csv) != len(args.images):
+        parser.error("give one --images folder per --csv")
+    if not args.csv and not args.synthetic:
+        parser.error("--csv/--images or --synthetic is required")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    torch.manual_seed(args.seed)
+    device = torch.device(args.device)
+    print("Using device:", device)
+    if device.type == "cuda":
+        torch.backends.cudnn.benchmark = True
+
+    metadata, (train_idx, val_idx, test_idx) = load_metadata(args)
+    print(
+        f"Total dataset size: {len(metadata)}, class counts {metadata.class_counts()}"
+    )
+    print(
+        f"Training samples: {len(train_idx)}, Validation samples: {len(val_idx)}, "
+        f"Test samples: {len(test_idx)}"
+    )
+    train_loader, val_loader, test_loader = build_loaders(
+        args, metadata, (train_idx, val_idx, test_idx)
+    )
+
+    model = EfficientNetClassifier(pretrained=args.pretrained, arch=args.arch).to(
+        device, memory_format=torch.channels_last
+    )
+    teacher = None
+    if args.teacher:
+        teacher = load_classifier(args.teacher, args.teacher_arch, device)
+        teacher.requires_grad_(False)
+        print(f"Distilling from {args.teacher} ({args.teacher_arch})")
+    if args.sampling == "loss":
+        weights = class_weights(metadata.target[train_idx])
+    else:
+        # The sampler already rebalances the batches.
+        weights = torch.ones(2)
+    criterion = nn.CrossEntropyLoss(weight=weights.to(device))
+    optimizer = torch.optim.AdamW(
+        model.parameters(), lr=args.lr, weight_decay=args.weight_decay
+    )
+    # Loss scaling only matters for float16; bfloat16 has float32's range.
+    fp16 = args.amp == "fp16" or (args.amp == "auto" and device.type == "cuda")
+    scaler = torch.amp.GradScaler(device.type, enabled=fp16)
+
+    checkpoint_path = os.path.join(args.out, "last.pt")
+    model_path = os.path.join(args.out, "model.pth")
+    start_epoch, best_score, history = 0, None, []
+    # Drives the train loader's order in "loss" and "weighted" sampling;
+    # BalancedBatchSampler seeds itself from the epoch instead.
+    shuffle_generator = getattr(train_loader.sampler, "generator", None)
+    if args.resume and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(
+            checkpoint_path, map_location=device, weights_only=False
+        )
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        scaler.load_state_dict(checkpoint["scaler"])
+        torch.set_rng_state(checkpoint["rng_state"])
+        if shuffle_generator and checkpoint.get("shuffle_state") is not None:
+            shuffle_generator.set_state(checkpoint["shuffle_state"])
+        start_epoch = checkpoint["epoch"]
+        best_score = checkpoint["best_score"]
+        history = checkpoint["history"]
+        print(f"Resumed from {checkpoint_path} after epoch {start_epoch}")
+    if isinstance(train_loader.batch_sampler, BalancedBatchSampler):
+        train_loader.batch_sampler.set_epoch(start_epoch)
+    scheduler = cosine_schedule(optimizer, args.epochs, start_epoch)
+
+    train_transform = BatchTransform(device, train=True)
+    eval_transform = BatchTransform(device, train=False)
+    for epoch in range(start_epoch, args.epochs):
+        print(f"\nEpoch {epoch + 1}/{args.epochs}")
+        started = time.perf_counter()
+        train_loss = train_one_epoch(
+            model,
+            train_loader,
+            train_transform,
+            optimizer,
+            criterion,
+            scaler,
+            args,
+            device,
+            teacher,
+        )
+        scheduler.step()
+        metrics = summarize(*predict(model, val_loader, eval_transform, args, device))
+        score = metrics[args.metric]
+        improved = score is not None and (best_score is None or score > best_score)
+        history.append(
+            {
+                "epoch": epoch + 1,
+                "train_loss": train_loss,
+                "seconds": time.perf_counter() - started,
+                **metrics,
+            }
+        )
+        print(
+            f"Train Loss: {train_loss:.4f}, Val Acc: {metrics['accuracy']:.2%}, "
+            f"Val Recall: {metrics['recall']}, Val AUC: {metrics['auc']}"
+        )
+        if improved:
+            best_score = score
+            save_atomic(export_state_dict(model), model_path)
+            print(f"Saved {model_path} ({args.metric} {score:.4f})")
+        save_atomic(
+            {
+                "epoch": epoch + 1,
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "scaler": scaler.state_dict(),
+                "rng_state": torch.get_rng_state(),
+                "shuffle_state": (
+                    shuffle_generator.get_state() if shuffle_generator else None
+                ),
+                "best_score": best_score,
+                "history": history,
+                "config": vars(args),
+            },
+            checkpoint_path,
+        )
+
+    if not os.path.exists(model_path):
+        # No epoch produced a usable score (e.g. a split without melanoma).
+        save_atomic(export_state_dict(model), model_path)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    test_metrics = summarize(*predict(model, test_loader, eval_transform, args, device))
+    print(f"Test metrics: {test_metrics}")
+    with open(os.path.join(args.out, "history.json"), "w") as f:
+        json.dump({"epochs": history, "test": test_metrics}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()